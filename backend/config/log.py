@@ -0,0 +1,152 @@
+"""
+Non-blocking logging pipeline.
+
+Request threads filter records, render the ones that pass and enqueue them; a
+single background thread owned by QueueLogHandler serializes them and does
+the file/console I/O. Messages are rendered on the request thread, where
+the objects in `args` (model instances, querysets) can still safely be
+turned into strings, but only for records that pass the level and sampling
+filters, so use lazy `logger.info("... %s", value)` calls rather than
+f-strings.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+#----------------------------FORMATTER-------------------------------
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line, with `extra=` fields kept as top-level keys.
+    """
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+#----------------------------SAMPLING-------------------------------
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of records per logger. `rates` maps logger names to a
+    probability; the longest matching dotted prefix wins and '' is the default.
+    Warnings and errors are never dropped.
+    """
+    def __init__(self, rates=None, min_level=logging.WARNING):
+        super().__init__()
+        self.rates = rates or {}
+        self.min_level = min_level
+        self._resolved = {}
+
+    def rate_for(self, name):
+        rate = self._resolved.get(name)
+        if rate is None:
+            candidate = name
+            while True:
+                if candidate in self.rates:
+                    rate = self.rates[candidate]
+                    break
+                if not candidate:
+                    rate = 1.0
+                    break
+                candidate = candidate.rpartition('.')[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= self.min_level:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+#----------------------------QUEUE HANDLER-------------------------------
+
+class QueueLogHandler(QueueHandler):
+    """
+    Enqueue records for a background writer thread that owns the real
+    handlers (a file and/or stderr). The queue is bounded: when the writer
+    falls behind, records are dropped rather than blocking the request.
+    """
+    def __init__(self, filename=None, console=False, maxsize=10000):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.dropped = 0
+
+        self.targets = []
+        if filename:
+            self.targets.append(logging.FileHandler(filename, delay=True))
+        if console:
+            self.targets.append(logging.StreamHandler(sys.stderr))
+
+        self.listener = None
+        self.start()
+        atexit.register(self.stop)
+        # Threads do not survive fork(): pre-forking servers need a writer per worker
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._restart_in_child)
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        for target in self.targets:
+            target.setFormatter(fmt)
+
+    def start(self):
+        self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def _restart_in_child(self):
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.listener = None
+        self.start()
+
+    def prepare(self, record):
+        # Render everything that may touch live objects now: str() of a model
+        # instance can query the database, which the writer thread must not
+        # do, and tracebacks need their frames.
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        for key, value in list(record.__dict__.items()):
+            if key not in RESERVED_ATTRS and not isinstance(value, (str, int, float, bool, type(None))):
+                record.__dict__[key] = str(value)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
@@ -0,0 +1,322 @@
+"""
+In-process metrics.
+
+Counters and histograms live in a per-process registry; recording one is a
+dict update under a lock. MetricsMiddleware records per-route request
+latency, database time and query counts, and throttled (429) responses;
+other modules call `inc()` and `observe()` for cache hits and misses and
+batch sizes. `metrics_view` serves everything in the Prometheus text format.
+
+Under a pre-forking server each worker only sees its own requests, so with
+METRICS_DIR set every process writes its registry to its own file there at
+most every METRICS_FLUSH_INTERVAL seconds, at exit and before answering a
+scrape, and a scrape adds up the files of all processes. Files of
+processes that have exited are folded into one archive so that counters
+never go down when workers are recycled. Without METRICS_DIR (runserver,
+tests), or where fcntl is missing (Windows, which has no pre-forking
+server to aggregate), a scrape returns the serving process's registry.
+"""
+
+import atexit
+import hmac
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Unix only
+    fcntl = None
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', "Request latency by route", LATENCY_BUCKETS),
+    'http_throttled_total': ('counter', "Requests rejected with 429 Too Many Requests", None),
+    'db_query_duration_seconds_total': ('counter', "Time spent in database queries by route", None),
+    'db_queries_per_request': ('histogram', "Database queries per request by route", QUERY_BUCKETS),
+    'cache_requests_total': ('counter', "Cache lookups by cache and result (hit or miss)", None),
+    'buffer_flush_size': ('histogram', "Items written per flush of a batching buffer", SIZE_BUCKETS),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+ARCHIVE = 'archive.json'
+LOCK = 'archive.lock'
+
+
+#----------------------------REGISTRY-------------------------------
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+        # A forked worker starts from zero rather than from its parent's counts
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self.flushed = 0.0
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            state = self.histograms.get(key)
+            if state is None:
+                state = self.histograms[key] = [0] * len(buckets) + [0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(state)] for (name, labels), state in self.histograms.items()],
+            }
+
+
+registry = Registry()
+
+
+def inc(name, amount=1, **labels):
+    registry.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+
+#----------------------------PROCESS FILES-------------------------------
+
+def _metrics_dir():
+    # The archive lock needs flock; without it every process stands alone
+    return settings.METRICS_DIR if fcntl is not None else None
+
+
+def _process_file(directory):
+    return os.path.join(directory, f'{os.getpid()}-{int(registry.started * 1000)}.json')
+
+
+def _write_json(path, data):
+    with open(path + '.tmp', 'w') as output:
+        json.dump(data, output)
+    os.replace(path + '.tmp', path)
+
+
+def flush(force=False):
+    """
+    Write this process's registry to METRICS_DIR, at most every
+    METRICS_FLUSH_INTERVAL seconds unless `force`.
+    """
+    directory = _metrics_dir()
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - registry.flushed < settings.METRICS_FLUSH_INTERVAL:
+        return
+    registry.flushed = now
+    os.makedirs(directory, exist_ok=True)
+    _write_json(_process_file(directory), registry.snapshot())
+
+
+def _flush_at_exit():
+    try:
+        flush(force=True)
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(total, snapshot):
+    for name, labels, value in snapshot.get('counters', []):
+        key = (name, tuple(map(tuple, labels)))
+        total['counters'][key] = total['counters'].get(key, 0) + value
+    for name, labels, state in snapshot.get('histograms', []):
+        key = (name, tuple(map(tuple, labels)))
+        current = total['histograms'].get(key)
+        total['histograms'][key] = state if current is None else [a + b for a, b in zip(current, state)]
+
+
+def _read(path):
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _dump(total):
+    return {
+        'counters': [[name, labels, value] for (name, labels), value in total['counters'].items()],
+        'histograms': [[name, labels, state] for (name, labels), state in total['histograms'].items()],
+    }
+
+
+def collect():
+    """
+    Return {'counters': {key: value}, 'histograms': {key: state}} summed
+    over every process, folding the files of exited processes into the
+    archive first.
+    """
+    total = {'counters': {}, 'histograms': {}}
+    directory = _metrics_dir()
+    if not directory:
+        _merge(total, registry.snapshot())
+        return total
+
+    flush(force=True)
+    with open(os.path.join(directory, LOCK), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(directory, ARCHIVE)
+        _merge(total, _read(archive_path))
+
+        files = {}
+        for name in os.listdir(directory):
+            stem, extension = os.path.splitext(name)
+            if extension != '.json' or name == ARCHIVE or '-' not in stem:
+                continue
+            pid, started = stem.split('-', 1)
+            files.setdefault(int(pid), []).append((int(started), os.path.join(directory, name)))
+
+        dead, archived = [], {'counters': {}, 'histograms': {}}
+        for pid, entries in files.items():
+            entries.sort()
+            # Only the newest process of a pid can still be running
+            for index, (_, path) in enumerate(entries):
+                snapshot = _read(path)
+                _merge(total, snapshot)
+                if index < len(entries) - 1 or not _is_alive(pid):
+                    _merge(archived, snapshot)
+                    dead.append(path)
+
+        if dead:
+            _merge(archived, _read(archive_path))
+            _write_json(archive_path, _dump(archived))
+            for path in dead:
+                os.remove(path)
+    return total
+
+
+#----------------------------EXPOSITION-------------------------------
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(total):
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        source = total['histograms'] if kind == 'histogram' else total['counters']
+        series = sorted((labels, value) for (metric, labels), value in source.items() if metric == name)
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            if kind == 'counter':
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            for bound, count in zip(buckets, value):
+                lines.append(f'{name}_bucket{_labels(labels, [("le", _number(float(bound)))])} {count}')
+            lines.append(f'{name}_bucket{_labels(labels, [("le", "+Inf")])} {value[-1]}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(float(value[-2]))}')
+            lines.append(f'{name}_count{_labels(labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Scrape endpoint. With METRICS_TOKEN set it wants `Authorization: Bearer
+    <token>`. Without one it only answers local requests in DEBUG: behind a
+    reverse proxy every request looks local.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG or request.META.get('REMOTE_ADDR') not in ('127.0.0.1', '::1'):
+        return HttpResponseForbidden()
+    return HttpResponse(render(collect()), content_type=CONTENT_TYPE)
+
+
+#----------------------------MIDDLEWARE-------------------------------
+
+class QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        # Unmatched paths share one label so that 404 probes cannot add series
+        route = match.route if match else 'unmatched'
+        observe('http_request_duration_seconds', elapsed,
+                method=request.method, route=route, status=response.status_code)
+        observe('db_queries_per_request', timer.count, route=route)
+        inc('db_query_duration_seconds_total', timer.duration, route=route)
+        if response.status_code == 429:
+            inc('http_throttled_total', route=route)
+        flush()
+        return response
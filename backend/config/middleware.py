@@ -0,0 +1,175 @@
+"""
+Response compression middleware.
+
+Compresses responses with brotli when the client accepts it and the `brotli`
+package is installed, gzip otherwise. Streaming responses are compressed
+chunk by chunk. Anonymous GET responses marked `Cache-Control: public,
+max-age=N` are stored already compressed, so repeat hits skip the view,
+the renderer and the compressor.
+"""
+
+import hashlib
+import re
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_max_age, patch_vary_headers
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+ACCEPT_ENCODING_RE = re.compile(r'\b(br|gzip)\b(?!;q=0(?:\.0*)?\b)')
+
+# Already compressed, or must reach the client chunk by chunk
+SKIPPED_CONTENT_TYPES = ('image/', 'video/', 'audio/', 'text/event-stream')
+
+CACHED_HEADERS = ('Content-Type', 'Content-Encoding', 'Content-Language', 'Vary', 'ETag', 'Cache-Control')
+
+
+def choose_encoding(request):
+    accepted = set(ACCEPT_ENCODING_RE.findall(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(content) + compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+async def compress_stream_async(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        async for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+        async for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cache = caches[settings.COMPRESSION_CACHE_ALIAS]
+
+    def __call__(self, request):
+        encoding = choose_encoding(request)
+        cache_key = self.get_cache_key(request, encoding)
+
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            metrics.inc('cache_requests_total', cache='response', result='miss' if cached is None else 'hit')
+            if cached is not None:
+                return self.build_cached_response(cached)
+
+        response = self.get_response(request)
+        response = self.compress_response(response, encoding)
+
+        if cache_key is not None and self.is_cacheable(response):
+            self.cache.set(cache_key, self.serialize_response(response), get_max_age(response))
+
+        return response
+
+    #----------------------------CACHE-------------------------------
+
+    def get_cache_key(self, request, encoding):
+        if request.method != 'GET':
+            return None
+        user = getattr(request, 'user', None)
+        if user is None or user.is_authenticated:
+            return None
+
+        raw = '|'.join([
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''),
+            encoding or 'identity',
+        ])
+        return 'compressed:' + hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+    def is_cacheable(self, response):
+        if response.streaming or response.status_code != 200 or response.cookies:
+            return False
+        cache_control = response.get('Cache-Control', '')
+        if 'public' not in cache_control or 'private' in cache_control or 'no-store' in cache_control:
+            return False
+        return bool(get_max_age(response))
+
+    def serialize_response(self, response):
+        headers = {name: response[name] for name in CACHED_HEADERS if response.has_header(name)}
+        return {'status': response.status_code, 'headers': headers, 'content': response.content}
+
+    def build_cached_response(self, cached):
+        response = HttpResponse(cached['content'], status=cached['status'])
+        for name, value in cached['headers'].items():
+            response[name] = value
+        response['Content-Length'] = str(len(cached['content']))
+        return response
+
+    #----------------------------COMPRESSION-------------------------------
+
+    def compress_response(self, response, encoding):
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if encoding is None or response.has_header('Content-Encoding'):
+            return response
+        if response.get('Content-Type', '').startswith(SKIPPED_CONTENT_TYPES):
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compress_stream_async(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+                return response
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # The representation changed, so a strong validator no longer applies
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+
+        response['Content-Encoding'] = encoding
+        return response
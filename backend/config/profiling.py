@@ -0,0 +1,195 @@
+"""
+On-demand sampling profiler.
+
+ProfilerMiddleware profiles a random PROFILER_SAMPLE_RATE fraction of
+requests, and every request sent with `X-Profile: <PROFILER_TOKEN>`. While
+such a request runs, a per-process sampler thread reads the stack of the
+thread serving it every PROFILER_INTERVAL seconds through
+sys._current_frames(); the request itself is not instrumented, so the cost
+is one stack walk per interval, in another thread. Samples are written in
+the collapsed stack format (`frame;frame;frame count`, root first) read by
+flamegraph.pl, speedscope and inferno, one file per request in PROFILER_DIR
+named after the timestamp and the route. The oldest files are deleted when
+the directory grows past PROFILER_MAX_BYTES.
+
+With PROFILER_ENABLED off the middleware raises MiddlewareNotUsed and
+Django drops it from the chain: disabled, it costs nothing.
+"""
+
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+logger = logging.getLogger('django')
+
+HEADER = 'HTTP_X_PROFILE'
+SUFFIX = '.folded'
+ROUTE_SLUG_RE = re.compile(r'[^A-Za-z0-9]+')
+
+
+#----------------------------SAMPLER-------------------------------
+
+class Sampler:
+    """
+    Samples the stacks of the threads registered with `start()` until they
+    call `stop()`. The thread runs only while something is being profiled.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.sessions = {}
+        self.condition = threading.Condition()
+        self.labels = {}
+        self.thread = None
+        self.pid = None
+
+    def _ensure_thread(self):
+        # Threads do not survive a fork: one sampler per worker process
+        if self.pid != os.getpid() or self.thread is None or not self.thread.is_alive():
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+            self.thread.start()
+
+    def start(self, thread_id):
+        with self.condition:
+            self.sessions[thread_id] = Counter()
+            self._ensure_thread()
+            self.condition.notify()
+
+    def stop(self, thread_id):
+        with self.condition:
+            return self.sessions.pop(thread_id, Counter())
+
+    def _label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = f'{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})'
+            self.labels[code] = label
+        return label
+
+    def _stack(self, frame):
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.sessions:
+                    self.condition.wait()
+                thread_ids = list(self.sessions)
+            frames = sys._current_frames()
+            stacks = [(thread_id, self._stack(frames[thread_id])) for thread_id in thread_ids if thread_id in frames]
+            del frames
+            # Counted under the lock: stop() may have handed a counter over meanwhile
+            with self.condition:
+                for thread_id, stack in stacks:
+                    if thread_id in self.sessions:
+                        self.sessions[thread_id][stack] += 1
+            time.sleep(self.interval)
+
+
+def short_path(filename):
+    """
+    `filename` relative to the sys.path entry it was imported from.
+    """
+    for entry in sorted(sys.path, key=len, reverse=True):
+        if entry and filename.startswith(entry.rstrip(os.sep) + os.sep):
+            return filename[len(entry.rstrip(os.sep)) + 1:]
+    return filename
+
+
+#----------------------------OUTPUT-------------------------------
+
+def write_profile(directory, route, samples):
+    """
+    Write collapsed stacks to `<directory>/<timestamp>_<pid>_<route>.folded`
+    and return the file name.
+    """
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    slug = ROUTE_SLUG_RE.sub('-', route).strip('-') or 'root'
+    name = f'{stamp}_{os.getpid()}_{slug[:80]}{SUFFIX}'
+    path = os.path.join(directory, name)
+    with open(path + '.tmp', 'w') as output:
+        for stack, count in samples.most_common():
+            output.write(f'{stack} {count}\n')
+    os.replace(path + '.tmp', path)
+    return name
+
+
+def rotate(directory, max_bytes):
+    """
+    Delete the oldest profiles until the directory holds at most `max_bytes`.
+    """
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(SUFFIX):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Another worker rotated it first
+            pass
+        total -= size
+
+
+#----------------------------MIDDLEWARE-------------------------------
+
+class ProfilerMiddleware:
+    def __init__(self, get_response):
+        if not settings.PROFILER_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sampler = Sampler(settings.PROFILER_INTERVAL)
+
+    def is_requested(self, request):
+        token = settings.PROFILER_TOKEN
+        header = request.META.get(HEADER)
+        return bool(token and header and hmac.compare_digest(header.encode(), token.encode()))
+
+    def __call__(self, request):
+        requested = self.is_requested(request)
+        if not requested and random.random() >= settings.PROFILER_SAMPLE_RATE:
+            return self.get_response(request)
+
+        thread_id = threading.get_ident()
+        started = time.perf_counter()
+        self.sampler.start(thread_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            samples = self.sampler.stop(thread_id)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        route = f'{request.method} {match.route if match else request.path}'
+        if samples:
+            try:
+                name = write_profile(settings.PROFILER_DIR, route, samples)
+                rotate(settings.PROFILER_DIR, settings.PROFILER_MAX_BYTES)
+            except OSError:
+                logger.exception("Could not write the profile of %s", route)
+            else:
+                # Only callers holding the token learn where their profile is
+                if requested:
+                    response['X-Profile-Id'] = name
+                logger.info("Profiled %s: %d samples in %.3fs, %s", route, sum(samples.values()), elapsed, name)
+        return response
@@ -38,12 +38,15 @@ DEFAULT_FROM_EMAIL = 'noreply@fidni.com'  # Can be any value during development
 # Frontend URL for confirmation links
 FRONTEND_URL = '192.168.1.47:8000'  # Update with your frontend URL
 MIDDLEWARE = [
+    'config.profiling.ProfilerMiddleware',
+    'config.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'config.middleware.CompressionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -101,6 +104,10 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
 
+# Uploaded files (things/images.py)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -150,29 +157,103 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 30,
+    'DEFAULT_RENDERER_CLASSES': [
+        'config.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'config.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Response compression (config.middleware.CompressionMiddleware)
+COMPRESSION_MIN_SIZE = 1024  # bytes, smaller bodies are sent as-is
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+COMPRESSION_CACHE_ALIAS = 'default'
+
+# Image uploads (things/images.py)
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024  # bytes
+IMAGE_VARIANT_WIDTHS = (320, 640, 1280)  # pixels, only those below the original width
+IMAGE_VARIANT_WORKERS = 2
+
+# Live exercise updates over Server-Sent Events (things/live.py). LocalBroker
+# only reaches streams of the same process; with several ASGI workers use
+# 'things.live.RedisBroker' with LIVE_BROKER_OPTIONS = {'url': 'redis://...'}
+LIVE_BROKER = 'things.live.LocalBroker'
+LIVE_BROKER_OPTIONS = {}
+LIVE_KEEPALIVE = 25  # seconds between comment frames on an idle stream
+LIVE_RETRY_MS = 5000  # reconnection delay advertised to EventSource
+
+# Reputation leaderboards (users/reputation.py). LocalLeaderboard is per
+# process; with several workers use 'users.reputation.RedisLeaderboard' and
+# LEADERBOARD_OPTIONS = {'url': 'redis://...'}
+LEADERBOARD_BACKEND = 'users.reputation.LocalLeaderboard'
+LEADERBOARD_OPTIONS = {}
+
+# Sampling profiler (config/profiling.py). When disabled the middleware
+# removes itself from the chain. Profiles are collapsed stacks: render them
+# with flamegraph.pl, speedscope or inferno.
+PROFILER_ENABLED = os.getenv('DJANGO_PROFILER', '') == '1'
+PROFILER_SAMPLE_RATE = 0.001  # fraction of requests profiled at random
+PROFILER_TOKEN = os.getenv('DJANGO_PROFILER_TOKEN', '')  # "X-Profile: <token>" profiles a request
+PROFILER_INTERVAL = 0.005  # seconds between stack samples
+PROFILER_DIR = BASE_DIR / 'profiles'
+PROFILER_MAX_BYTES = 50 * 1024 * 1024  # oldest profiles are deleted past this
+
+# Metrics (config/metrics.py), scraped from /metrics/. Pre-forking servers
+# need METRICS_DIR: each process writes its counts there and a scrape adds
+# them up. Without METRICS_TOKEN only local scrapes are answered, and only
+# with DEBUG on.
+METRICS_DIR = os.getenv('DJANGO_METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = 5  # seconds between writes of a process's counts
+METRICS_TOKEN = os.getenv('DJANGO_METRICS_TOKEN', '')
+
+# Fill the process caches before serving (config/warmup.py), see
+# settings_production.py
+WARM_UP = False
+
 # Authentication settings
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
 
+# Logging: request threads only enqueue records (see config/log.py),
+# a background thread writes them to debug.log as JSON lines.
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'config.log.JSONFormatter',
+        },
+    },
+    'filters': {
+        'sampling': {
+            '()': 'config.log.SamplingFilter',
+            # Fraction of DEBUG/INFO records kept per logger, WARNING+ always pass
+            'rates': {
+                '': 1.0,
+                'django.db.backends': 0.01,
+                'django.server': 0.1,
+            },
+        },
+    },
     'handlers': {
-        'file': {
+        'async': {
             'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': 'debug.log',
-        },
-        'console': {
-            'class': 'logging.StreamHandler',
+            'class': 'config.log.QueueLogHandler',
+            'filename': BASE_DIR / 'debug.log',
+            'console': DEBUG,
+            'formatter': 'json',
+            'filters': ['sampling'],
         },
     },
     'loggers': {
         'django': {
-            'handlers': ['file','console'],
+            'handlers': ['async'],
             'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
         },
     },
@@ -0,0 +1,81 @@
+"""
+Production settings: config.settings with debugging off and the runtime tuned.
+
+Run with DJANGO_SETTINGS_MODULE=config.settings_production under gunicorn
+(see gunicorn.conf.py). DJANGO_SECRET_KEY and DJANGO_METRICS_TOKEN are
+required; the database, cache and host names come from the environment,
+with defaults matching docker-compose.yml.
+"""
+
+import copy
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, LOGGING, TEMPLATES, os
+
+
+# DEBUG off also stops Django from keeping every query in connection.queries
+DEBUG = False
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+ALLOWED_HOSTS = [host for host in os.getenv('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+CSRF_TRUSTED_ORIGINS = [origin for origin in os.getenv('DJANGO_CSRF_TRUSTED_ORIGINS', '').split(',') if origin]
+
+# Persistent connections: one per worker thread, reused across requests
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('POSTGRES_DB', 'student_platform'),
+        'USER': os.getenv('POSTGRES_USER', 'user'),
+        'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'password'),
+        'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+        'PORT': os.getenv('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': 600,  # seconds
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Workers are separate processes: the fragment, outline and response caches,
+# the live broker and the leaderboards have to be shared for invalidations
+# and updates to reach them all
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+}
+LIVE_BROKER = 'things.live.RedisBroker'
+LIVE_BROKER_OPTIONS = {'url': REDIS_URL}
+LEADERBOARD_BACKEND = 'users.reputation.RedisLeaderboard'
+LEADERBOARD_OPTIONS = {'url': REDIS_URL}
+
+# Templates (admin, browsable API) are compiled once per process
+TEMPLATES = copy.deepcopy(TEMPLATES)
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
+# `manage.py collectstatic` copies static files here with hashed names, so
+# the web server can serve them with far-future cache headers
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'},
+}
+
+SESSION_COOKIE_SECURE = True
+CSRF_COOKIE_SECURE = True
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+
+# gunicorn runs several processes (config/metrics.py)
+METRICS_DIR = os.getenv('DJANGO_METRICS_DIR', str(BASE_DIR / 'metrics'))
+# Behind the proxy every request comes from 127.0.0.1: scrapes must carry the token
+METRICS_TOKEN = os.environ['DJANGO_METRICS_TOKEN']
+
+WARM_UP = True
+
+LOGGING = copy.deepcopy(LOGGING)
+LOGGING['handlers']['async']['console'] = False
@@ -1,9 +1,10 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
 from things.views import (
     ExerciseViewSet, ClassLevelViewSet, SubjectViewSet, ChapterViewSet,SolutionViewSet,
-    CommentViewSet
+    CommentViewSet, ReportSummaryViewSet, VoteViewSet, ImageUploadView, serve_image,
+    exercise_events
 )
 from users.views import (
     LoginView, RegisterView, LogoutView, get_current_user,
@@ -11,6 +12,7 @@ from users.views import (
     mark_content_viewed, mark_content_completed
 )
 from users import views
+from config.metrics import metrics_view
 
 router = DefaultRouter()
 router.register(r'exercises', ExerciseViewSet, basename='exercise')
@@ -19,12 +21,16 @@ router.register(r'subjects', SubjectViewSet, basename='subject')
 router.register(r'chapters', ChapterViewSet, basename='chapter')
 router.register(r'comments', CommentViewSet, basename='comment')
 router.register(r'solutions', SolutionViewSet, basename='solution')
+router.register(r'moderation/reports', ReportSummaryViewSet, basename='report-summary')
+router.register(r'votes', VoteViewSet, basename='vote')
 
 
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', metrics_view, name='metrics'),
+    path('api/exercises/<int:pk>/events/', exercise_events, name='exercise-events'),
     path('api/', include(router.urls)),
     path('api/auth/login/', LoginView.as_view(), name='login'),
     path('api/auth/register/', RegisterView.as_view(), name='register'),
@@ -34,11 +40,17 @@ urlpatterns = [
     path('api/users/history/', get_user_history, name='user-history'),
     path('api/content/<str:content_id>/view/', mark_content_viewed, name='mark-content-viewed'),
     path('api/content/<str:content_id>/complete/', mark_content_completed, name='mark-content-completed'),
+    path('api/upload/image/', ImageUploadView.as_view(), name='upload-image'),
+    re_path(r'^media/(?P<path>images/.+)$', serve_image, name='image'),
 
-    # User profile endpoints
+    path('api/users/feed/', views.get_feed, name='user_feed'),
+    path('api/users/reviews/', views.get_due_reviews, name='due_reviews'),
+    path('api/leaderboard/', views.get_leaderboard, name='leaderboard'),
+
+    # User profile endpoints (saved/ first: <str:username>/ would match it)
+    path('api/users/saved/', views.get_saved_content, name='saved_content'),
     path('api/users/<str:username>/', views.get_user_profile, name='user_profile'),
     path('api/users/<str:username>/exercises/', views.get_user_exercises, name='user_exercises'),
-    path('api/users/saved/', views.get_saved_content, name='saved_content'),
 
     
     # Your existing endpoints
@@ -0,0 +1,54 @@
+"""
+Start-up warm-up.
+
+`warm_up()` runs from config/wsgi.py and config/asgi.py when WARM_UP is on,
+before the server accepts traffic. It fills what the first requests would
+otherwise pay for: the URL resolver, the ContentType cache (per process, so
+with a preloading server the workers inherit it from the master) and the
+class level outlines in the shared cache, and loads the near-duplicate
+index (things/duplicates.py), also inherited by the workers. Database
+connections opened here are closed afterwards so that forked workers never
+share a socket. Import it once Django is set up.
+"""
+
+import logging
+import time
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError, connections
+from django.urls import reverse
+
+from things.duplicates import shared_index
+from things.models import ClassLevel
+from things.outline import get_outline
+
+
+logger = logging.getLogger('django')
+
+WARMED_APPS = ('things', 'users')
+
+
+def warm_up():
+    started = time.perf_counter()
+    # Building the resolver imports every view, serializer and model module
+    reverse('exercise-list')
+    try:
+        models = [model for label in WARMED_APPS for model in apps.get_app_config(label).get_models()]
+        ContentType.objects.get_for_models(*models)
+
+        class_levels = list(ClassLevel.objects.all())
+        for class_level in class_levels:
+            get_outline(class_level)
+
+        signatures = len(shared_index.get().signatures)
+    except DatabaseError:
+        # The site still starts, the first requests fill the caches
+        logger.exception("Warm-up skipped: database unavailable")
+        return
+    finally:
+        connections.close_all()
+    logger.info(
+        "Warmed up %d content types, %d outlines and %d exercise signatures in %.2fs",
+        len(models), len(class_levels), signatures, time.perf_counter() - started,
+    )
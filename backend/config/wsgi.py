@@ -1,7 +1,10 @@
 """
-WSGI config for educational_platform project.
+WSGI config for the backend project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+Production runs it under gunicorn with config.settings_production and the
+gunicorn.conf.py next to manage.py, which preloads this module in the
+master process: the warm-up below then runs once and the workers inherit it.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
@@ -9,8 +12,13 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'educational_platform.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+if settings.WARM_UP:
+    from config.warmup import warm_up
+    warm_up()
@@ -0,0 +1,44 @@
+"""
+gunicorn settings for production:
+
+    DJANGO_SETTINGS_MODULE=config.settings_production gunicorn config.wsgi
+
+The app is preloaded in the master, which runs the warm-up once
+(config/warmup.py) and forks workers that share its imported code
+copy-on-write. Each worker runs a few threads, so requests waiting on the
+database or the cache do not hold a whole process. Workers are recycled
+after a bounded number of requests to cap memory growth.
+
+The live update streams (/api/exercises/<id>/events/) are long-lived and
+need the ASGI app, served next to this one, e.g.:
+
+    uvicorn config.asgi:application --workers 2 --no-access-log
+"""
+
+import multiprocessing
+import os
+
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+# (2 x cores) + 1 processes, each with a handful of threads
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+preload_app = True
+
+# Recycle workers; the jitter keeps them from restarting all at once
+max_requests = 2000
+max_requests_jitter = 200
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Heartbeat files on tmpfs: a slow disk must not get workers killed
+worker_tmp_dir = '/dev/shm'
+
+# Logging goes through config/log.py, gunicorn only logs errors
+accesslog = None
+errorlog = '-'
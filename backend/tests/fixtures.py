@@ -0,0 +1,134 @@
+"""
+A small but realistic content graph for the API tests: several class
+levels, subjects, subfields and chapters, exercises with solutions,
+threaded comments, votes from several users, view history, related
+exercises, recommendations, review schedules, reputation, revisions and
+open reports. The first user is staff (moderation queue).
+"""
+
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from things.models import ClassLevel, Subject, Subfield, Chapter, Theorem, Exercise, Solution, Comment, Vote, Lesson, Report
+from things.moderation import record_report
+from things.related import refresh_related_many
+from things.revisions import record_initial_revisions, record_revision
+from users.models import Recommendation, UserProfile, ViewHistory
+from users.reputation import rebuild_reputation
+from users.reviews import record_review
+
+
+EXERCISES = 60
+USERS = 6
+DIFFICULTIES = ['easy', 'medium', 'hard']
+
+
+def build_fixture():
+    users = [
+        User.objects.create_user(f'user{index}', f'user{index}@example.com', 'password')
+        for index in range(USERS)
+    ]
+    for user in users:
+        UserProfile.objects.get_or_create(user=user)
+    users[0].is_staff = True
+    users[0].save(update_fields=['is_staff'])
+
+    class_levels = [ClassLevel.objects.create(name=f'Level {index}', order=index) for index in range(3)]
+    subjects = []
+    for index, name in enumerate(['Mathematics', 'Physics']):
+        subject = Subject.objects.create(name=name)
+        subject.class_levels.set(class_levels)
+        subjects.append(subject)
+
+    chapters, theorems = [], []
+    for subject in subjects:
+        for subfield_index in range(2):
+            subfield = Subfield.objects.create(name=f'{subject.name} {subfield_index}', subject=subject)
+            subfield.class_levels.set(class_levels)
+            for order in range(3):
+                chapter = Chapter.objects.create(
+                    name=f'{subfield.name}.{order}', subject=subject, subfield=subfield,
+                    order=len(chapters),
+                )
+                chapter.class_levels.set(class_levels[:2])
+                chapters.append(chapter)
+
+                theorem = Theorem.objects.create(name=f'Theorem {len(theorems)}', subject=subject, subfield=subfield)
+                theorem.chapters.set([chapter])
+                theorem.class_levels.set(class_levels[:2])
+                theorems.append(theorem)
+
+    lesson = Lesson.objects.create(
+        title='Limits', content='<p>Limits and continuity</p>', subject=subjects[0], author=users[0],
+    )
+    lesson.theorems.set(theorems[:3])
+    lesson.class_levels.set(class_levels[:1])
+
+    exercises = []
+    for index in range(EXERCISES):
+        exercise = Exercise(
+            title=f'Exercise {index}',
+            content=f'<p>Prove that $f_{index}(x) = x^{index % 7}$ is continuous on $[0, 1]$.</p>' * 3,
+            difficulty=DIFFICULTIES[index % 3],
+            author=users[index % USERS],
+            subject=subjects[index % 2],
+        )
+        exercise.refresh_content_artifacts()
+        exercise.save()
+        exercise.chapters.set([chapters[index % len(chapters)], chapters[(index + 1) % len(chapters)]])
+        exercise.class_levels.set([class_levels[index % 3]])
+        exercise.theorems.set([theorems[index % len(theorems)]])
+        exercises.append(exercise)
+
+        Solution.objects.create(exercise=exercise, content=f'<p>Solution of exercise {index}</p>', author=users[0])
+        for thread in range(2):
+            comment = Comment.objects.create(
+                exercise=exercise, content=f'Question {thread}', author=users[(index + thread) % USERS],
+            )
+            Comment.objects.create(
+                exercise=exercise, content='An answer', author=users[(index + thread + 1) % USERS], parent=comment,
+            )
+
+    record_initial_revisions(exercises, users[0])
+    edited = exercises[0]
+    for edit in range(8):
+        edited.content += f'<p>Edit {edit}</p>'
+        edited.save()
+        record_revision(edited, users[edit % USERS])
+
+    exercise_type = ContentType.objects.get_for_model(Exercise)
+    comment_type = ContentType.objects.get_for_model(Comment)
+    votes = []
+    for user_index, user in enumerate(users):
+        for exercise in exercises[user_index::2]:
+            votes.append(Vote(user=user, content_type=exercise_type, object_id=exercise.id, value=Vote.UP))
+        for comment in Comment.objects.filter(exercise__in=exercises[:10]):
+            votes.append(Vote(user=user, content_type=comment_type, object_id=comment.id, value=Vote.DOWN))
+    Vote.objects.bulk_create(votes)
+    for exercise in exercises:
+        exercise.vote_score = Vote.objects.filter(content_type=exercise_type, object_id=exercise.id).count()
+    Exercise.objects.bulk_update(exercises, ['vote_score'])
+    rebuild_reputation()
+
+    for user in users:
+        for exercise in exercises[:20]:
+            ViewHistory.objects.create(user=user, content=exercise, completed=exercise.id % 2 == 0)
+            if exercise.id % 2 == 0:
+                # Reviewed between 1 and 10 days ago: most of them are due
+                record_review(user, exercise, now=timezone.now() - timedelta(days=exercise.id % 10 + 1))
+        Recommendation.objects.bulk_create([
+            Recommendation(user=user, exercise=exercise, score=1.0 / (rank + 1), rank=rank)
+            for rank, exercise in enumerate(exercises[20:50])
+        ])
+
+    for index, comment in enumerate(Comment.objects.filter(exercise__in=exercises[10:20])):
+        for user in users[1:1 + index % 3 + 1]:
+            record_report(Report.objects.create(
+                user=user, content_type=comment_type, object_id=comment.id, reason='Off topic',
+            ))
+
+    refresh_related_many([exercise.id for exercise in exercises])
+    return users, exercises
@@ -0,0 +1,76 @@
+"""
+Difficulty calibration (things/calibration.py) on matrices small enough to
+check by hand.
+
+Run with `python manage.py test tests`.
+"""
+
+import math
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from things.calibration import PRIOR_WEIGHT, calibrate_level, labels_between, logit
+
+
+class CalibrateLevelTests(SimpleTestCase):
+    def test_two_learners_two_exercises(self):
+        # Learner 1 completed exercise 0 only, learner 2 both; learner 1
+        # upvoted exercise 0. Exercise 2 is in the level but nobody opened it.
+        users = np.array([1, 1, 2, 2])
+        exercises = np.array([0, 1, 0, 1])
+        completed = np.array([True, False, True, True])
+        upvoted = np.array([True, False, False, False])
+        members = np.array([0, 1, 2])
+        priors = np.array([0.0, 0.0, 1.0])
+
+        result = calibrate_level(users, exercises, completed, upvoted, members, priors, 3)
+
+        self.assertEqual(result['attempts'].tolist(), [2, 2, 0])
+        self.assertEqual(result['completions'].tolist(), [2, 1, 0])
+        self.assertEqual(result['upvote_rate'].tolist(), [0.5, 0.0, 0.0])
+
+        # Level rate (3 + 1) / (4 + 2) = 2/3. Learner abilities on the other
+        # exercise, shrunk by PRIOR_WEIGHT: 5/9 for learner 1 on exercise 0,
+        # 13/18 on every other row. Expected rates (abilities + 5 * 2/3) / 7
+        # are 83/126 and 86/126; observed rates (completions + 5 * 2/3) / 7
+        # are 96/126 and 78/126.
+        self.assertEqual(PRIOR_WEIGHT, 5.0)
+        difficulty = result['difficulty']
+        self.assertAlmostEqual(difficulty[0], math.log(83 / 43) - math.log(96 / 30))
+        self.assertAlmostEqual(difficulty[1], math.log(86 / 40) - math.log(78 / 48))
+        self.assertLess(difficulty[0], 0)
+        self.assertGreater(difficulty[1], 0)
+
+        # Unseen: expected and observed are both the level rate, moved by the
+        # label prior, so the difficulty is the prior itself
+        self.assertAlmostEqual(difficulty[2], 1.0)
+
+        # Two learners are too few to measure discrimination
+        self.assertTrue(np.isnan(result['discrimination']).all())
+
+    def test_discrimination_follows_learner_strength(self):
+        # Ten learners on four exercises. Exercise 3 is completed exactly by
+        # the learners who completed the three others, so it separates them.
+        strong = [(user, exercise, True) for user in range(5) for exercise in range(4)]
+        weak = [(user, exercise, False) for user in range(5, 10) for exercise in range(4)]
+        rows = np.array(strong + weak, dtype=[('user', np.int64), ('exercise', np.int64), ('completed', np.bool_)])
+        members = np.arange(4)
+
+        result = calibrate_level(
+            rows['user'], rows['exercise'], rows['completed'], np.zeros(len(rows), dtype=bool),
+            members, np.zeros(4), 4,
+        )
+
+        np.testing.assert_allclose(result['discrimination'], 1.0)
+        np.testing.assert_allclose(result['difficulty'], 0.0, atol=1e-9)
+
+    def test_logit_is_clipped(self):
+        self.assertTrue(np.isfinite(logit(np.array([0.0, 1.0]))).all())
+
+
+class LabelTests(SimpleTestCase):
+    def test_labels_between(self):
+        self.assertEqual(labels_between(gte=-0.5), ['medium', 'hard'])
+        self.assertEqual(labels_between(lte=-0.5), ['easy'])
+        self.assertEqual(labels_between(gte=-1, lte=1), ['easy', 'medium', 'hard'])
@@ -0,0 +1,121 @@
+"""
+Near-duplicate detection (things/duplicates.py).
+
+Run with `python manage.py test tests`.
+"""
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from things import duplicates
+from things.duplicates import (
+    DUPLICATE_THRESHOLD, LSHIndex, SharedIndex, cluster_duplicates, find_duplicates, normalize, signature, similarity,
+)
+from things.models import Subject, Exercise, ExerciseSignature
+
+
+ORIGINAL = (
+    '<p>Soit $f$ la fonction définie sur $\\mathbb{R}$ par $f(x) = \\dfrac{x^2 + 1}{\\left(x + 2\\right)}$.</p>'
+    '<p>1. Étudier les variations de $f$ sur son domaine de définition.</p>'
+    '<p>2. Montrer que la courbe de $f$ admet une asymptote oblique en $+\\infty$.</p>'
+    '<p>3. En déduire le nombre de solutions de l\'équation $f(x) = 3$ sur $\\mathbb{R}$.</p>'
+)
+# The same exercise retyped: other markup, spacing and LaTeX spellings
+RETYPED = (
+    'Soit $f$ la fonction définie sur $\\mathbb{R}$ par $f(x)=\\frac{x^2+1}{(x+2)}$. '
+    '1. Étudier les variations de $f$ sur son domaine de définition. '
+    '2. Montrer que la courbe de $f$ admet une asymptote oblique en $+\\infty$. '
+    '3. En déduire le nombre de solutions de l\'équation $f(x)=3$ sur $\\mathbb{R}$.'
+)
+# One question changed
+EDITED = ORIGINAL.replace('$f(x) = 3$', '$f(x) = -1$')
+UNRELATED = (
+    '<p>On lance deux dés équilibrés à six faces et on note $S$ la somme des résultats obtenus.</p>'
+    '<p>Déterminer la loi de $S$, puis calculer son espérance et sa variance.</p>'
+)
+
+
+class SignatureTests(SimpleTestCase):
+    def test_markup_does_not_count(self):
+        self.assertEqual(normalize(ORIGINAL), normalize(RETYPED))
+        self.assertEqual(similarity(signature(ORIGINAL), signature(RETYPED)), 1.0)
+
+    def test_similarity_follows_the_overlap(self):
+        self.assertGreaterEqual(similarity(signature(ORIGINAL), signature(EDITED)), DUPLICATE_THRESHOLD)
+        self.assertLess(similarity(signature(ORIGINAL), signature(UNRELATED)), 0.2)
+
+    def test_bodies_without_tokens_have_no_signature(self):
+        self.assertIsNone(signature(''))
+        self.assertIsNone(signature('<p> <img src="figure.png"> </p>'))
+
+    def test_index_finds_candidates_above_the_threshold(self):
+        index = LSHIndex()
+        index.add(1, signature(ORIGINAL))
+        index.add(2, signature(EDITED))
+        index.add(3, signature(UNRELATED))
+
+        matches = index.query(signature(RETYPED))
+        self.assertEqual([exercise_id for exercise_id, _ in matches], [1, 2])
+        self.assertEqual(matches[0][1], 1.0)
+        self.assertEqual([exercise_id for exercise_id, _ in index.query(signature(ORIGINAL), exclude=1)], [2])
+        self.assertEqual(list(index.pairs()), [(1, 2)])
+
+        # Re-adding an exercise replaces its signature
+        index.add(2, signature(UNRELATED))
+        self.assertEqual(list(index.pairs()), [(2, 3)])
+
+
+class LookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', 'author@example.com', 'password')
+        subject = Subject.objects.create(name='Analyse')
+        create = lambda title, content, **fields: Exercise.objects.create(
+            title=title, content=content, difficulty='medium', author=author, subject=subject, **fields
+        )
+        # Signatures are stored by a post_save receiver (things/signals.py)
+        cls.original = create('Fonction rationnelle', ORIGINAL)
+        cls.edited = create('Fonction rationnelle bis', EDITED)
+        cls.hidden = create('Fonction rationnelle ter', RETYPED, is_hidden=True)
+        cls.unrelated = create('Deux dés', UNRELATED)
+
+    def setUp(self):
+        # A fresh process-wide index per test
+        self.addCleanup(setattr, duplicates, 'shared_index', duplicates.shared_index)
+        duplicates.shared_index = SharedIndex()
+
+    def test_find_duplicates_skips_hidden_exercises(self):
+        found = find_duplicates(RETYPED)
+        self.assertEqual([entry['id'] for entry in found], [self.original.id, self.edited.id])
+        self.assertEqual(found[0], {'id': self.original.id, 'title': 'Fonction rationnelle', 'similarity': 1.0})
+
+        self.assertEqual([entry['id'] for entry in find_duplicates(ORIGINAL, exclude=self.original.id)], [self.edited.id])
+        self.assertEqual(find_duplicates(UNRELATED, exclude=self.unrelated.id), [])
+
+    def test_index_catches_up_on_new_exercises(self):
+        find_duplicates(UNRELATED)
+        copy = Exercise.objects.create(
+            title='Deux dés bis', content=UNRELATED, difficulty='easy',
+            author=self.original.author, subject=self.original.subject,
+        )
+        self.assertEqual([entry['id'] for entry in find_duplicates(UNRELATED)], [self.unrelated.id, copy.id])
+
+    def test_cluster_duplicates(self):
+        self.assertEqual(cluster_duplicates(), [sorted([self.original.id, self.edited.id, self.hidden.id])])
+
+    def test_exercises_without_tokens_are_never_duplicates(self):
+        blank = [
+            Exercise.objects.create(
+                title=f'Figure {index}', content='<p><img src="figure.png"></p>', difficulty='easy',
+                author=self.original.author, subject=self.original.subject,
+            )
+            for index in range(2)
+        ]
+        self.assertFalse(ExerciseSignature.objects.filter(exercise__in=blank).exists())
+        self.assertEqual(find_duplicates(blank[0].content), [])
+        self.assertEqual(cluster_duplicates(), [sorted([self.original.id, self.edited.id, self.hidden.id])])
+
+        # Emptying a body drops the signature it had
+        self.unrelated.content = '<p></p>'
+        self.unrelated.save()
+        self.assertFalse(ExerciseSignature.objects.filter(exercise=self.unrelated).exists())
@@ -0,0 +1,134 @@
+"""
+Cached exercise detail (things/fragments.py).
+
+Run with `python manage.py test tests`.
+"""
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.test import TestCase
+
+from things.fragments import apply_overlay, get_fragment, invalidate_exercises
+from things.models import Subject, Exercise, Solution, Comment, Vote
+from users.models import ViewHistory
+
+
+class FragmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        subject = Subject.objects.create(name='Analyse')
+        cls.exercise = Exercise.objects.create(
+            title='Limite', content='...', difficulty='easy', author=cls.author, subject=subject, view_count=7
+        )
+        cls.other = Exercise.objects.create(
+            title='Dérivée', content='...', difficulty='easy', author=cls.author, subject=subject
+        )
+        cls.solution = Solution.objects.create(exercise=cls.exercise, content='...', author=cls.author)
+        cls.question = Comment.objects.create(exercise=cls.exercise, content='Pourquoi ?', author=cls.reader)
+        cls.answer = Comment.objects.create(
+            exercise=cls.exercise, content='Parce que.', author=cls.author, parent=cls.question
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.builds = 0
+
+    def fragment(self, exercise=None):
+        exercise = exercise or self.exercise
+
+        def build():
+            self.builds += 1
+            return {'id': exercise.id, 'title': exercise.title}
+
+        return get_fragment(exercise.id, build)
+
+    def test_built_once_until_invalidated(self):
+        self.assertEqual(self.fragment(), {'id': self.exercise.id, 'title': 'Limite'})
+        self.fragment()
+        self.assertEqual(self.builds, 1)
+
+        invalidate_exercises([self.exercise.id])
+        self.fragment()
+        self.fragment(self.other)
+        self.assertEqual(self.builds, 3)
+        self.fragment()
+        self.assertEqual(self.builds, 3)
+
+    def test_rebuild_racing_a_write_is_not_served(self):
+        def build():
+            self.builds += 1
+            # A write commits while the fragment is being serialized
+            invalidate_exercises([self.exercise.id])
+            return {'id': self.exercise.id}
+
+        get_fragment(self.exercise.id, build)
+        self.fragment()
+        self.assertEqual(self.builds, 2)
+
+    def test_writes_invalidate_on_commit(self):
+        self.fragment()
+        self.fragment(self.other)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Comment.objects.create(exercise=self.exercise, content='Merci', author=self.reader)
+            # Still cached until the write commits
+            self.fragment()
+            self.assertEqual(self.builds, 2)
+        for callback in callbacks:
+            callback()
+
+        self.fragment()
+        self.fragment(self.other)
+        self.assertEqual(self.builds, 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Vote.objects.create(user=self.reader, content_object=self.answer, value=Vote.UP)
+        self.fragment()
+        self.assertEqual(self.builds, 4)
+
+    def test_login_leaves_fragments_cached(self):
+        self.fragment()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.client.login(username='author', password='password'))
+        self.fragment()
+        self.assertEqual(self.builds, 1)
+
+        # Changing what the detail shows of an author still evicts
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.profile.avatar = 'https://example.com/avatar.png'
+            self.author.profile.save()
+        self.fragment()
+        self.assertEqual(self.builds, 2)
+
+    def detail(self):
+        return {
+            'id': self.exercise.id,
+            'view_count': None,
+            'user_vote': None,
+            'solution': {'id': self.solution.id, 'user_vote': None},
+            'comments': [{
+                'id': self.question.id, 'user_vote': None,
+                'replies': [{'id': self.answer.id, 'user_vote': None, 'replies': []}],
+            }],
+        }
+
+    def test_overlay_fills_the_viewer_state(self):
+        Vote.objects.create(user=self.reader, content_object=self.exercise, value=Vote.UP)
+        Vote.objects.create(user=self.reader, content_object=self.answer, value=Vote.DOWN)
+        Vote.objects.create(user=self.author, content_object=self.solution, value=Vote.UP)
+        ViewHistory.objects.create(user=self.reader, content=self.exercise, completed=True)
+
+        with self.assertNumQueries(1):
+            data = apply_overlay(self.detail(), self.reader)
+        self.assertEqual((data['view_count'], data['completed'], data['user_vote']), (7, True, Vote.UP))
+        self.assertIsNone(data['solution']['user_vote'])
+        self.assertIsNone(data['comments'][0]['user_vote'])
+        self.assertEqual(data['comments'][0]['replies'][0]['user_vote'], Vote.DOWN)
+
+        data = apply_overlay(self.detail(), self.author)
+        self.assertEqual((data['completed'], data['user_vote'], data['solution']['user_vote']), (False, None, Vote.UP))
+
+        data = apply_overlay(self.detail(), AnonymousUser())
+        self.assertEqual((data['view_count'], data['completed'], data['user_vote']), (7, None, None))
@@ -0,0 +1,151 @@
+"""
+Reputation and leaderboards (users/reputation.py).
+
+The backend tests run against LocalLeaderboard and, when the redis package
+is installed and a server answers on LEADERBOARD_TEST_REDIS_URL, against
+RedisLeaderboard; they are skipped otherwise.
+
+Run with `python manage.py test tests`.
+"""
+
+import os
+import uuid
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from things.models import Subject, Exercise, Vote
+from things.votes import apply_vote
+from users import reputation
+from users.models import SubjectReputation, UserProfile
+from users.reputation import GLOBAL_BOARD, LocalLeaderboard, RedisLeaderboard, rank, subject_board, top
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+REDIS_URL = os.getenv('LEADERBOARD_TEST_REDIS_URL', 'redis://localhost:6379/15')
+
+
+class LeaderboardBackendTests:
+    """
+    Behaviour every backend shares; mixed into one TestCase per backend.
+    """
+    def make_leaderboard(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.board = 'test'
+        self.leaderboard = self.make_leaderboard()
+        self.leaderboard.replace(self.board, {1: 5, 2: 9, 3: 5, 4: 0, 5: 1})
+
+    def test_top_orders_by_reputation_then_user(self):
+        self.assertEqual(self.leaderboard.top(self.board, 10), [(2, 9), (1, 5), (3, 5), (5, 1)])
+        self.assertEqual(self.leaderboard.top(self.board, 2, offset=1), [(1, 5), (3, 5)])
+        self.assertEqual(self.leaderboard.top(self.board, 2, offset=10), [])
+
+    def test_rank(self):
+        self.assertEqual(self.leaderboard.rank(self.board, 2), (1, 9))
+        self.assertEqual(self.leaderboard.rank(self.board, 3), (3, 5))
+        # Users without positive reputation are not on the board
+        self.assertIsNone(self.leaderboard.rank(self.board, 4))
+        self.assertIsNone(self.leaderboard.rank(self.board, 99))
+
+    def test_update_moves_adds_and_removes(self):
+        self.leaderboard.update(self.board, {5: 10, 6: 2, 2: 0})
+        self.assertEqual(self.leaderboard.top(self.board, 10), [(5, 10), (1, 5), (3, 5), (6, 2)])
+        self.assertEqual(self.leaderboard.rank(self.board, 5), (1, 10))
+        self.assertIsNone(self.leaderboard.rank(self.board, 2))
+
+    def test_replace_marks_the_board_loaded(self):
+        self.assertTrue(self.leaderboard.is_loaded(self.board))
+        self.assertFalse(self.leaderboard.is_loaded('other'))
+        self.leaderboard.replace('other', {})
+        self.assertTrue(self.leaderboard.is_loaded('other'))
+        self.assertEqual(self.leaderboard.top('other', 10), [])
+
+
+class LocalLeaderboardTests(LeaderboardBackendTests, SimpleTestCase):
+    def make_leaderboard(self):
+        return LocalLeaderboard()
+
+    def test_update_ignores_unloaded_boards(self):
+        self.leaderboard.update('other', {1: 3})
+        self.assertFalse(self.leaderboard.is_loaded('other'))
+
+
+@skipUnless(redis is not None, "redis is not installed")
+class RedisLeaderboardTests(LeaderboardBackendTests, SimpleTestCase):
+    def make_leaderboard(self):
+        leaderboard = RedisLeaderboard(url=REDIS_URL, prefix=f'test:{uuid.uuid4().hex}:')
+        try:
+            leaderboard.client.ping()
+        except redis.ConnectionError:
+            self.skipTest(f"no Redis server at {REDIS_URL}")
+        return leaderboard
+
+    def tearDown(self):
+        keys = list(self.leaderboard.client.scan_iter(self.leaderboard.prefix + '*'))
+        if keys:
+            self.leaderboard.client.delete(*keys)
+
+
+class ReputationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.voters = [User.objects.create_user(f'voter{index}', f'voter{index}@example.com', 'password') for index in range(3)]
+        cls.subject = Subject.objects.create(name='Analyse')
+        cls.exercise = Exercise.objects.create(
+            title='Limite', content='...', difficulty='easy', author=cls.author, subject=cls.subject
+        )
+
+    def setUp(self):
+        # A fresh in-memory backend per test
+        reputation._leaderboard = LocalLeaderboard()
+        self.addCleanup(setattr, reputation, '_leaderboard', None)
+
+    def vote(self, voter, value):
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_vote(voter, self.exercise, value)
+
+    def test_votes_move_the_boards(self):
+        self.assertEqual(top(GLOBAL_BOARD, 10), [])
+        self.assertEqual(top(subject_board(self.subject.id), 10), [])
+
+        self.vote(self.voters[0], Vote.UP)
+        self.vote(self.voters[1], Vote.UP)
+        self.assertEqual(rank(GLOBAL_BOARD, self.author.id), (1, 2))
+        self.assertEqual(rank(subject_board(self.subject.id), self.author.id), (1, 2))
+
+        self.vote(self.voters[0], Vote.DOWN)
+        self.vote(self.voters[1], Vote.UNVOTE)
+        self.assertIsNone(rank(GLOBAL_BOARD, self.author.id))
+        self.author.profile.refresh_from_db()
+        self.assertEqual(self.author.profile.reputation, 0)
+        self.assertEqual(SubjectReputation.objects.get(user=self.author, subject=self.subject).reputation, 0)
+
+    def test_board_loaded_between_commit_and_update_counts_once(self):
+        top(subject_board(self.subject.id), 10)
+        with self.captureOnCommitCallbacks() as callbacks:
+            apply_vote(self.voters[0], self.exercise, Vote.UP)
+        # The global board is read first after the vote committed, before the
+        # vote's board update runs
+        self.assertEqual(rank(GLOBAL_BOARD, self.author.id), (1, 1))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(rank(GLOBAL_BOARD, self.author.id), (1, 1))
+        self.assertEqual(rank(subject_board(self.subject.id), self.author.id), (1, 1))
+
+    def test_subject_board_lists_users_without_a_profile(self):
+        UserProfile.objects.filter(user=self.author).delete()
+        self.vote(self.voters[0], Vote.UP)
+
+        response = self.client.get(f'/api/leaderboard/?subject={self.subject.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'rank': 1, 'reputation': 1, 'id': self.author.id, 'username': 'author', 'avatar': None},
+        ])
@@ -0,0 +1,81 @@
+"""
+Hidden content (things/moderation.py) stays out of every listing.
+
+Run with `python manage.py test tests`.
+"""
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.test import TestCase
+
+from things.models import ClassLevel, Subject, Subfield, Chapter, Exercise, Vote, Report, ReportSummary
+from things.moderation import bulk_hide, bulk_restore
+from users.models import ViewHistory
+
+
+class HiddenExerciseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        cls.class_level = ClassLevel.objects.create(name='Terminale', order=1)
+        subject = Subject.objects.create(name='Analyse')
+        subfield = Subfield.objects.create(name='Suites', subject=subject)
+        chapter = Chapter.objects.create(name='Limites', subject=subject, subfield=subfield, order=1)
+        chapter.class_levels.set([cls.class_level])
+
+        cls.exercises = []
+        for index in range(2):
+            exercise = Exercise.objects.create(
+                title=f'Limite {index}', content='...', difficulty='easy', author=cls.author, subject=subject
+            )
+            exercise.chapters.set([chapter])
+            exercise.class_levels.set([cls.class_level])
+            ViewHistory.objects.create(user=cls.reader, content=exercise)
+            Vote.objects.create(user=cls.reader, content_object=exercise, value=Vote.UP)
+            cls.exercises.append(exercise)
+        cls.visible, cls.reported = cls.exercises
+
+        Report.objects.create(
+            user=cls.reader, content_type=ContentType.objects.get_for_model(Exercise),
+            object_id=cls.reported.id, reason='Duplicate',
+        )
+        cls.summary = ReportSummary.objects.get(object_id=cls.reported.id)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def moderate(self, action):
+        with self.captureOnCommitCallbacks(execute=True):
+            action([self.summary.id])
+
+    def listed_ids(self):
+        history = self.client.get('/api/users/history/').json()
+        return {
+            'profile': [entry['id'] for entry in self.client.get(f'/api/users/{self.author.username}/exercises/').json()['results']],
+            'saved': [entry['id'] for entry in self.client.get('/api/users/saved/').json()['results']],
+            'viewed': [entry['id'] for entry in history['recentlyViewed']],
+            'upvoted': [entry['id'] for entry in history['upvoted']],
+        }
+
+    def outline_count(self):
+        outline = self.client.get(f'/api/class-levels/{self.class_level.id}/outline/').json()
+        return outline['subjects'][0]['counts']['exercises']
+
+    def test_hidden_exercises_are_not_listed(self):
+        self.assertTrue(all(len(ids) == 2 for ids in self.listed_ids().values()))
+
+        self.moderate(bulk_hide)
+        for listing, ids in self.listed_ids().items():
+            with self.subTest(listing=listing):
+                self.assertEqual(ids, [self.visible.id])
+
+    def test_outline_counts_follow_bulk_actions(self):
+        # Cached before the bulk actions, which bypass model signals
+        self.assertEqual(self.outline_count(), 2)
+        self.moderate(bulk_hide)
+        self.assertEqual(self.outline_count(), 1)
+        self.moderate(bulk_restore)
+        self.assertEqual(self.outline_count(), 2)
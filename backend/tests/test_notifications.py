@@ -0,0 +1,48 @@
+"""
+Notification outbox writes (users/notifications.py).
+
+Run with `python manage.py test tests`.
+"""
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TestCase
+
+from things.models import Subject, Lesson
+from users.models import NotificationEvent
+
+
+class LessonOutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('teacher', 'teacher@example.com', 'password')
+        cls.subject = Subject.objects.create(name='Analyse')
+
+    def lesson_events(self):
+        return NotificationEvent.objects.filter(kind=NotificationEvent.LESSON_UPDATE)
+
+    def test_lesson_save_records_an_event(self):
+        lesson = Lesson.objects.create(title='Limites', content='...', subject=self.subject, author=self.author)
+        lesson.content = 'Edited'
+        lesson.save()
+
+        events = list(self.lesson_events())
+        self.assertEqual(len(events), 2)
+        self.assertTrue(all(event.lesson_id == lesson.id for event in events))
+        self.assertTrue(all(event.actor_id == self.author.id for event in events))
+        self.assertTrue(all(event.processed_at is None for event in events))
+
+    def test_event_rolls_back_with_the_lesson(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Lesson.objects.create(title='Limites', content='...', subject=self.subject, author=self.author)
+                raise RuntimeError
+
+        self.assertFalse(self.lesson_events().exists())
+
+    def test_view_count_save_records_nothing(self):
+        lesson = Lesson.objects.create(title='Limites', content='...', subject=self.subject, author=self.author)
+        lesson.view_count += 1
+        lesson.save(update_fields=['view_count'])
+
+        self.assertEqual(self.lesson_events().count(), 1)
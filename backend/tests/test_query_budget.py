@@ -0,0 +1,251 @@
+"""
+Query budgets of the API.
+
+Every GET route is requested anonymously and logged in against the fixture
+in tests/fixtures.py, with the caches cleared, and must stay within a fixed
+number of queries and a fixed response size. Paginated routes are also
+requested with a small and a large page and must cost the same number of
+queries both times: a count that grows with the page is an N+1.
+
+The write routes are budgeted the same way, including the work they defer
+to on_commit, and the batch routes must cost the same for a small and a
+large batch.
+
+Run with `python manage.py test tests`.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from things.models import ClassLevel, Exercise, Solution, Comment, Vote, Report, ReportSummary
+from .fixtures import build_fixture
+
+
+SMALL_PAGE = 5
+LARGE_PAGE = 30
+
+SMALL_BATCH = 2
+LARGE_BATCH = 10
+
+# Responses of routes that need a login, for an anonymous client
+LOGIN_REQUIRED = 403
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.exercises = build_fixture()
+        cls.user = cls.users[1]
+        cls.staff = cls.users[0]
+        cls.exercise = cls.exercises[0]
+        cls.comment = Comment.objects.filter(exercise=cls.exercise, parent=None).first()
+        cls.class_level = ClassLevel.objects.first()
+
+    def setUp(self):
+        # Content types are cached per process once looked up
+        ContentType.objects.get_for_models(Exercise, Solution, Comment)
+
+    def routes(self):
+        """
+        (url, max queries, max response bytes, anonymous status); the
+        budgets hold for the default page size.
+        """
+        exercise, username = self.exercise.id, self.user.username
+        return [
+            ('/api/exercises/', 11, 60_000, 200),
+            ('/api/exercises/?sort=most_upvoted', 11, 60_000, 200),
+            ('/api/exercises/?sort=most_commented', 11, 60_000, 200),
+            ('/api/exercises/?sort=most_viewed', 11, 60_000, 200),
+            ('/api/exercises/?sort=oldest', 11, 60_000, 200),
+            (f'/api/exercises/?class_levels[]={self.class_level.id}&difficulties[]=easy', 11, 40_000, 200),
+            ('/api/exercises/?compound=1', 19, 25_000, 200),
+            (f'/api/exercises/{exercise}/', 12, 6_000, 200),
+            (f'/api/exercises/{exercise}/related/', 3, 3_000, 200),
+            (f'/api/exercises/{exercise}/revisions/', 6, 4_500, 200),
+            (f'/api/exercises/{exercise}/revisions/1/', 7, 1_000, 200),
+            ('/api/class-levels/', 4, 500, 200),
+            (f'/api/class-levels/{self.class_level.id}/outline/', 7, 3_000, 200),
+            ('/api/subjects/', 5, 500, 200),
+            ('/api/chapters/', 6, 4_000, 200),
+            ('/api/comments/', 8, 25_000, 200),
+            (f'/api/comments/{self.comment.id}/', 7, 1_200, 200),
+            ('/api/solutions/', 6, 18_000, 200),
+            (f'/api/solutions/{self.exercise.solution.id}/', 5, 600, 200),
+            ('/api/auth/user/', 4, 500, 401),
+            ('/api/users/stats/', 5, 200, LOGIN_REQUIRED),
+            ('/api/users/history/', 18, 55_000, LOGIN_REQUIRED),
+            ('/api/users/feed/', 3, 6_000, LOGIN_REQUIRED),
+            ('/api/users/reviews/', 3, 6_000, LOGIN_REQUIRED),
+            ('/api/users/saved/', 12, 55_000, LOGIN_REQUIRED),
+            (f'/api/users/{username}/', 6, 500, 200),
+            (f'/api/users/{username}/exercises/', 13, 55_000, 200),
+            ('/api/leaderboard/', 3, 1_500, 200),
+            (f'/api/leaderboard/?subject={self.exercise.subject_id}', 3, 1_500, 200),
+        ]
+
+    def paginated_routes(self):
+        """
+        (url, page size parameter, user) for the routes that paginate.
+        """
+        exercise = self.exercise.id
+        return [
+            ('/api/exercises/', 'page_size', None),
+            ('/api/exercises/', 'page_size', self.user),
+            ('/api/exercises/?sort=most_upvoted', 'page_size', self.user),
+            (f'/api/exercises/?chapters[]={self.exercise.chapters.first().id}', 'page_size', self.user),
+            ('/api/exercises/?compound=1', 'page_size', None),
+            ('/api/exercises/?compound=1', 'page_size', self.user),
+            (f'/api/exercises/{exercise}/revisions/', 'page_size', None),
+            ('/api/chapters/', 'page_size', None),
+            ('/api/comments/', 'page_size', None),
+            ('/api/comments/', 'page_size', self.user),
+            ('/api/solutions/', 'page_size', None),
+            ('/api/solutions/', 'page_size', self.user),
+            ('/api/users/feed/', 'page_size', self.user),
+            ('/api/users/reviews/', 'page_size', self.user),
+            ('/api/users/saved/', 'per_page', self.user),
+            (f'/api/users/{self.user.username}/exercises/', 'per_page', None),
+            (f'/api/users/{self.user.username}/exercises/', 'per_page', self.user),
+            ('/api/moderation/reports/', 'page_size', self.staff),
+        ]
+
+    def post_routes(self):
+        """
+        (url, body, max queries) for the write routes, requested logged in.
+        """
+        exercises = self.exercises
+        return [
+            (f'/api/exercises/{exercises[2].id}/vote/', {'value': Vote.UP}, 12),
+            (f'/api/solutions/{exercises[3].solution.id}/vote/', {'value': Vote.UP}, 8),
+            ('/api/votes/batch/', self.vote_batch(4, SMALL_BATCH), 12),
+            (f'/api/exercises/{exercises[2].id}/comment/', {'content': 'Which theorem applies here?'}, 22),
+            (f'/api/exercises/{exercises[7].id}/report/', {'reason': 'Duplicate'}, 18),
+            (f'/api/content/{exercises[9].id}/complete/', {'grade': 4}, 10),
+            ('/api/exercises/', self.new_exercise(0), 47),
+            ('/api/exercises/batch/', {'exercises': [self.new_exercise(index) for index in range(1, 3)]}, 33),
+        ]
+
+    def batch_routes(self):
+        """
+        (url, small body, large body, user, max queries) for the routes that
+        take a batch. No two bodies share an item, so every item is new work.
+        """
+        exercise_type = ContentType.objects.get_for_model(Exercise)
+        for exercise in self.exercises[40:40 + SMALL_BATCH + LARGE_BATCH]:
+            Report.objects.create(user=self.user, content_type=exercise_type, object_id=exercise.id, reason='Duplicate')
+        summaries = {
+            model: list(ReportSummary.objects.filter(content_type__model=model).order_by('id').values_list('id', flat=True))
+            for model in ('exercise', 'comment')
+        }
+        moderation = lambda action, ids: (
+            {'action': action, 'ids': ids[:SMALL_BATCH]},
+            {'action': action, 'ids': ids[SMALL_BATCH:SMALL_BATCH + LARGE_BATCH]},
+        )
+        small, large = self.vote_batch(0, SMALL_BATCH), self.vote_batch(SMALL_BATCH, LARGE_BATCH)
+        batch = lambda start, count: {'exercises': [self.new_exercise(index) for index in range(start, start + count)]}
+        return [
+            ('/api/votes/batch/', small, large, self.user, 12),
+            ('/api/exercises/batch/', batch(0, SMALL_BATCH), batch(SMALL_BATCH, LARGE_BATCH), self.user, 33),
+            ('/api/moderation/reports/bulk/', *moderation('hide', summaries['comment']), self.staff, 9),
+            ('/api/moderation/reports/bulk/', *moderation('restore', summaries['comment']), self.staff, 9),
+            ('/api/moderation/reports/bulk/', *moderation('delete', summaries['comment']), self.staff, 15),
+            ('/api/moderation/reports/bulk/', *moderation('delete', summaries['exercise']), self.staff, 42),
+        ]
+
+    def vote_batch(self, start, count):
+        return {'votes': [
+            {'type': 'exercise', 'id': exercise.id, 'value': Vote.UP}
+            for exercise in self.exercises[start:start + count]
+        ]}
+
+    def new_exercise(self, index):
+        return {
+            'title': f'Suite récurrente {index}',
+            'content': f'<p>Étudier la suite définie par $u_{{n+1}} = u_n^2 + {index}$.</p>',
+            'difficulty': 'medium',
+            'chapters': [self.exercise.chapters.first().id],
+            'class_levels': [self.class_level.id],
+            'subject': self.exercise.subject_id,
+            'solution_content': '<p>Elle est croissante.</p>',
+        }
+
+    def post(self, url, body, user=None):
+        """
+        Return (response, query count) for a POST with cold caches, running
+        the on_commit callbacks it schedules.
+        """
+        if user is None:
+            self.client.logout()
+        else:
+            self.client.force_login(user)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, body, content_type='application/json')
+        return response, len(queries)
+
+    def get(self, url, user=None):
+        """
+        Return (response, query count) for a GET with cold caches.
+        """
+        if user is None:
+            self.client.logout()
+        else:
+            self.client.force_login(user)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, len(queries)
+
+    def test_routes_stay_within_budget(self):
+        for url, max_queries, max_size, anonymous_status in self.routes():
+            for user in (None, self.user):
+                with self.subTest(url=url, user=user):
+                    response, queries = self.get(url, user)
+                    self.assertEqual(response.status_code, 200 if user else anonymous_status)
+                    self.assertLessEqual(queries, max_queries)
+                    self.assertLessEqual(len(response.content), max_size)
+
+    def test_moderation_queue_stays_within_budget(self):
+        response, queries = self.get('/api/moderation/reports/', self.staff)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.json()['count'], 0)
+        self.assertLessEqual(queries, 5)
+        self.assertLessEqual(len(response.content), 10_000)
+
+        response, _ = self.get('/api/moderation/reports/', self.user)
+        self.assertEqual(response.status_code, 403)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        for url, parameter, user in self.paginated_routes():
+            with self.subTest(url=url, user=user):
+                separator = '&' if '?' in url else '?'
+                small, small_queries = self.get(f'{url}{separator}{parameter}={SMALL_PAGE}', user)
+                large, large_queries = self.get(f'{url}{separator}{parameter}={LARGE_PAGE}', user)
+                self.assertEqual(small.status_code, 200)
+                self.assertEqual(large.status_code, 200)
+                # The larger page has to hold more rows for the check to mean anything
+                self.assertGreater(len(large.content), len(small.content))
+                self.assertEqual(large_queries, small_queries)
+
+    def test_post_routes_stay_within_budget(self):
+        for url, body, max_queries in self.post_routes():
+            with self.subTest(url=url):
+                response, _ = self.post(url, body)
+                self.assertEqual(response.status_code, LOGIN_REQUIRED)
+
+                response, queries = self.post(url, body, self.user)
+                self.assertIn(response.status_code, (200, 201))
+                self.assertLessEqual(queries, max_queries)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        for url, small_body, large_body, user, max_queries in self.batch_routes():
+            with self.subTest(url=url, body=small_body):
+                small, small_queries = self.post(url, small_body, user)
+                large, large_queries = self.post(url, large_body, user)
+                self.assertIn(small.status_code, (200, 201))
+                self.assertIn(large.status_code, (200, 201))
+                self.assertLessEqual(small_queries, max_queries)
+                self.assertEqual(large_queries, small_queries)
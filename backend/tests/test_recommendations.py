@@ -0,0 +1,64 @@
+"""
+Personalized feed (users/recommendations.py).
+
+Run with `python manage.py test tests`.
+"""
+
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from things.models import Subject, Subfield, Chapter, Exercise
+from users.models import Recommendation, StaleFeed
+from users.recommendations import build_recommendations, build_stale_recommendations, mark_stale
+
+
+class StaleFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.learner = User.objects.create_user('learner', 'learner@example.com', 'password')
+        author = User.objects.create_user('author', 'author@example.com', 'password')
+        subject = Subject.objects.create(name='Analyse')
+        subfield = Subfield.objects.create(name='Suites', subject=subject)
+        chapter = Chapter.objects.create(name='Limites', subject=subject, subfield=subfield, order=1)
+        cls.exercises = []
+        for index, difficulty in enumerate(['easy', 'easy', 'medium', 'hard']):
+            exercise = Exercise.objects.create(
+                title=f'Limite {index}', content='...', difficulty=difficulty, author=author, subject=subject
+            )
+            exercise.chapters.set([chapter])
+            cls.exercises.append(exercise)
+
+    def setUp(self):
+        self.client.force_login(self.learner)
+
+    def feed_ids(self):
+        return [entry['id'] for entry in self.client.get('/api/users/feed/').json()['results']]
+
+    def test_completion_only_marks_the_feed_stale(self):
+        self.client.post(f'/api/content/{self.exercises[0].id}/view/')
+        build_recommendations()
+        self.assertIn(self.exercises[1].id, self.feed_ids())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/content/{self.exercises[1].id}/complete/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(StaleFeed.objects.filter(user=self.learner).exists())
+        # The stored feed is untouched, but the completed exercise is not served
+        self.assertTrue(Recommendation.objects.filter(user=self.learner, exercise=self.exercises[1]).exists())
+        self.assertNotIn(self.exercises[1].id, self.feed_ids())
+
+        self.assertEqual(build_stale_recommendations(), 1)
+        self.assertFalse(StaleFeed.objects.exists())
+        self.assertFalse(Recommendation.objects.filter(user=self.learner, exercise=self.exercises[1]).exists())
+        self.assertEqual(build_stale_recommendations(), 0)
+
+    def test_marks_made_during_a_run_are_kept(self):
+        mark_stale(self.learner.id)
+        StaleFeed.objects.update(marked_at=timezone.now() + timedelta(minutes=1))
+
+        self.assertEqual(build_stale_recommendations(), 0)
+        build_recommendations()
+        self.assertTrue(StaleFeed.objects.filter(user=self.learner).exists())
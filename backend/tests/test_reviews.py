@@ -0,0 +1,77 @@
+"""
+Spaced repetition (users/reviews.py).
+
+Run with `python manage.py test tests`.
+"""
+
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from things.models import Subject, Exercise
+from users.models import ReviewSchedule
+from users.reviews import INITIAL_EASE, MIN_EASE, next_interval, record_review
+
+
+class NextIntervalTests(SimpleTestCase):
+    def test_passing_grades_go_one_six_then_ease(self):
+        state = (0, INITIAL_EASE, 0)
+        intervals = []
+        for _ in range(4):
+            state = next_interval(*state, grade=4)
+            intervals.append(state[0])
+        # Grade 4 leaves the ease at 2.5: 6 * 2.5 = 15, 15 * 2.5 = 37.5 -> 38
+        self.assertEqual(intervals, [1, 6, 15, 38])
+        self.assertAlmostEqual(state[1], 2.5)
+        self.assertEqual(state[2], 4)
+
+    def test_ease_follows_the_grade(self):
+        self.assertAlmostEqual(next_interval(6, 2.5, 2, 5)[1], 2.6)
+        self.assertAlmostEqual(next_interval(6, 2.5, 2, 3)[1], 2.36)
+
+    def test_failed_review_starts_over(self):
+        interval, ease, repetitions = next_interval(15, 2.5, 3, 2)
+        self.assertEqual((interval, repetitions), (1, 0))
+        self.assertAlmostEqual(ease, 2.18)
+
+        # Passing again restarts the 1, 6 progression
+        self.assertEqual(next_interval(interval, ease, repetitions, 4)[0], 1)
+        self.assertEqual(next_interval(1, ease, 1, 4)[0], 6)
+
+    def test_ease_never_drops_below_the_floor(self):
+        state = (0, INITIAL_EASE, 0)
+        for _ in range(10):
+            state = next_interval(*state, grade=0)
+        self.assertEqual(state[1], MIN_EASE)
+        self.assertEqual(next_interval(6, MIN_EASE, 2, 3)[1], MIN_EASE)
+
+
+class RecordReviewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('learner', 'learner@example.com', 'password')
+        subject = Subject.objects.create(name='Analyse')
+        cls.exercise = Exercise.objects.create(
+            title='Limite', content='...', difficulty='easy', author=cls.user, subject=subject
+        )
+
+    def test_review_before_due_date_only_records_the_visit(self):
+        now = timezone.now()
+        first = record_review(self.user, self.exercise, 4, now=now)
+        self.assertEqual((first.interval_days, first.repetitions), (1, 1))
+
+        later = now + timedelta(hours=2)
+        record_review(self.user, self.exercise, 5, now=later)
+        schedule = ReviewSchedule.objects.get(user=self.user, exercise=self.exercise)
+        self.assertEqual((schedule.interval_days, schedule.repetitions, schedule.last_grade), (1, 1, 4))
+        self.assertEqual(schedule.next_due, now + timedelta(days=1))
+        self.assertEqual(schedule.last_reviewed_at, later)
+
+    def test_due_review_advances_the_schedule(self):
+        now = timezone.now()
+        record_review(self.user, self.exercise, 4, now=now)
+        schedule = record_review(self.user, self.exercise, 4, now=now + timedelta(days=1))
+        self.assertEqual((schedule.interval_days, schedule.repetitions), (6, 2))
+        self.assertEqual(schedule.next_due, now + timedelta(days=7))
@@ -0,0 +1,121 @@
+"""
+Revision history (things/revisions.py).
+
+Run with `python manage.py test tests`.
+"""
+
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from things.models import Subject, Exercise, Revision
+from things.revisions import (
+    SNAPSHOT_INTERVAL, apply_delta, compact_revisions, encode_delta, get_revision, record_revision, revisions_of,
+)
+
+
+BODY = ' '.join(f'Montrer que la suite $u_{index}$ converge vers une limite finie.' for index in range(20))
+
+
+def edited(number):
+    return BODY.replace('$u_3$', f'$v_{number}$') + f' Question {number}.'
+
+
+class DeltaTests(SimpleTestCase):
+    def test_delta_round_trip(self):
+        previous = 'Soit  $f$ définie sur\n$[0, 1]$ par  f(x) = x².'
+        text = 'Soit $g$ définie sur\n$[0, 1]$ par  g(x) = x² + 1.\n'
+        self.assertEqual(apply_delta(previous, encode_delta(previous, text)), text)
+        self.assertEqual(apply_delta(previous, encode_delta(previous, '')), '')
+        self.assertEqual(apply_delta('', encode_delta('', text)), text)
+
+
+class RevisionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.subject = Subject.objects.create(name='Analyse')
+
+    def setUp(self):
+        self.exercise = Exercise.objects.create(
+            title='Suite', content=BODY, difficulty='easy', author=self.author, subject=self.subject
+        )
+
+    def edit(self, content):
+        self.exercise.content = content
+        self.exercise.save()
+        return record_revision(self.exercise, self.author)
+
+    def test_every_revision_reads_back(self):
+        contents = [BODY] + [edited(number) for number in range(1, 2 * SNAPSHOT_INTERVAL + 3)]
+        for content in contents:
+            self.edit(content)
+
+        for number, content in enumerate(contents, start=1):
+            revision, text = get_revision(self.exercise, number)
+            self.assertEqual(revision.number, number)
+            self.assertEqual(text, content)
+        self.assertIsNone(get_revision(self.exercise, len(contents) + 1))
+
+    def test_snapshot_every_interval(self):
+        for number in range(2 * SNAPSHOT_INTERVAL + 1):
+            self.edit(edited(number))
+
+        snapshots = list(revisions_of(self.exercise).filter(is_snapshot=True).order_by('number').values_list('number', flat=True))
+        self.assertEqual(snapshots, [1, SNAPSHOT_INTERVAL + 1, 2 * SNAPSHOT_INTERVAL + 1])
+        # Deltas are what keeps the history small
+        delta = revisions_of(self.exercise).get(number=2)
+        self.assertLess(len(delta.data), len(revisions_of(self.exercise).get(number=1).data))
+
+    def test_unchanged_content_records_nothing(self):
+        self.edit(BODY)
+        self.assertIsNone(self.edit(BODY))
+        self.assertEqual(revisions_of(self.exercise).count(), 1)
+
+    def test_previous_body_becomes_revision_one(self):
+        # The exercise was created without a revision
+        self.exercise.content = edited(1)
+        self.exercise.save()
+        revision = record_revision(self.exercise, self.author, previous=BODY)
+
+        self.assertEqual(revision.number, 2)
+        self.assertEqual(get_revision(self.exercise, 1)[1], BODY)
+        self.assertEqual(get_revision(self.exercise, 2)[1], edited(1))
+
+
+class CompactionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        subject = Subject.objects.create(name='Analyse')
+        cls.exercise = Exercise.objects.create(
+            title='Suite', content=BODY, difficulty='easy', author=cls.author, subject=subject
+        )
+
+    def test_keeps_last_per_day_and_recent_revisions_intact(self):
+        # Revisions 1-12, three a day over four days
+        contents = [edited(number) for number in range(1, 13)]
+        start = timezone.now() - timedelta(days=10)
+        for index, content in enumerate(contents):
+            self.exercise.content = content
+            self.exercise.save()
+            revision = record_revision(self.exercise, self.author)
+            Revision.objects.filter(id=revision.id).update(
+                created_at=start + timedelta(days=index // 3, hours=index % 3)
+            )
+
+        content_type = ContentType.objects.get_for_model(Exercise)
+        deleted = compact_revisions(content_type.id, self.exercise.id, keep_recent=4)
+
+        # Revisions 9-12 are recent; before them 3, 6 and 8 close their day
+        kept = [3, 6, 8, 9, 10, 11, 12]
+        self.assertEqual(deleted, len(contents) - len(kept))
+        self.assertEqual(sorted(revisions_of(self.exercise).values_list('number', flat=True)), kept)
+        for number in kept:
+            self.assertEqual(get_revision(self.exercise, number)[1], contents[number - 1])
+        self.assertIsNone(get_revision(self.exercise, 5))
+
+        self.assertEqual(compact_revisions(content_type.id, self.exercise.id, keep_recent=4), 0)
@@ -0,0 +1,118 @@
+from django.contrib import admin
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .models import ClassLevel, Subject, Chapter, Exercise, Solution, Comment
+
+
+# Must match the expression indexes created by migration 0006_search_indexes
+SEARCH_CONFIG = 'simple'
+# Below this many rows the planner estimate is not worth its inaccuracy
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+#----------------------------LARGE TABLES-------------------------------
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Use the planner's row estimate instead of COUNT(*) for unfiltered
+    changelists of large PostgreSQL tables.
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATED_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables with hundreds of thousands of rows.
+
+    On PostgreSQL, searches go through the full-text index over
+    `search_vector_fields`; elsewhere the (cheap) `search_fields` are used.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_vector_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term or not self.search_vector_fields or connections[queryset.db].vendor != 'postgresql':
+            return super().get_search_results(request, queryset, search_term)
+
+        queryset = queryset.annotate(
+            search=SearchVector(*self.search_vector_fields, config=SEARCH_CONFIG)
+        ).filter(search=SearchQuery(search_term, config=SEARCH_CONFIG, search_type='websearch'))
+        return queryset, False
+
+
+#----------------------------TAXONOMY-------------------------------
+
+@admin.register(ClassLevel)
+class ClassLevelAdmin(admin.ModelAdmin):
+    list_display = ('name', 'order')
+    ordering = ('order',)
+    search_fields = ('name',)
+
+@admin.register(Subject)
+class SubjectAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    autocomplete_fields = ('class_levels',)
+    search_fields = ('name',)
+
+@admin.register(Chapter)
+class ChapterAdmin(admin.ModelAdmin):
+    list_display = ('name', 'subject', 'order')
+    list_filter = ('subject',)
+    list_select_related = ('subject',)
+    ordering = ('subject', 'order')
+    search_fields = ('name', 'subject__name')
+    autocomplete_fields = ('subject', 'class_levels')
+
+
+#----------------------------CONTENT-------------------------------
+
+@admin.register(Exercise)
+class ExerciseAdmin(LargeTableAdmin):
+    list_display = ('title', 'difficulty', 'author', 'created_at', 'view_count')
+    list_filter = ('difficulty', 'is_hidden')
+    list_select_related = ('author',)
+    autocomplete_fields = ('author', 'subject', 'chapters', 'class_levels')
+    search_fields = ('^title', '=author__username')
+    search_vector_fields = ('title', 'content')
+    date_hierarchy = 'created_at'
+    readonly_fields = ('created_at', 'updated_at', 'view_count')
+
+@admin.register(Solution)
+class SolutionAdmin(LargeTableAdmin):
+    list_display = ('exercise', 'author', 'created_at')
+    list_filter = ('is_hidden',)
+    list_select_related = ('exercise', 'author')
+    autocomplete_fields = ('exercise', 'author')
+    search_fields = ('=author__username',)
+    search_vector_fields = ('content',)
+    date_hierarchy = 'created_at'
+    readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(Comment)
+class CommentAdmin(LargeTableAdmin):
+    list_display = ('exercise', 'author', 'created_at', 'parent')
+    list_filter = ('is_hidden',)
+    list_select_related = ('exercise', 'author', 'parent__exercise', 'parent__author')
+    autocomplete_fields = ('exercise', 'author', 'parent')
+    search_fields = ('=author__username',)
+    search_vector_fields = ('content',)
+    date_hierarchy = 'created_at'
+    readonly_fields = ('created_at',)
@@ -0,0 +1,130 @@
+"""
+Batch exercise creation.
+
+A whole exam's worth of exercises is checked against the taxonomy with one
+query per table, then written with bulk inserts: the exercises, the rows of
+their chapter and class level through tables, their solutions, the first
+revision of each body and the signatures of the bodies (things/duplicates.py).
+"""
+
+from django.db import transaction
+
+from .calibration import label_difficulty
+from .duplicates import store_signatures
+from .models import ClassLevel, Subject, Chapter, Exercise, Solution
+from .outline import invalidate_outlines
+from .related import refresh_related_many
+from .revisions import record_initial_revisions
+
+
+BATCH_LIMIT = 200
+
+
+#----------------------------VALIDATION-------------------------------
+
+def check_taxonomy(items):
+    """
+    Return one error dict per item ({} when the item is valid): unknown
+    chapters, class levels and subjects, and chapters outside the item's subject.
+    """
+    chapter_ids = {chapter_id for item in items for chapter_id in item.get('chapters', ())}
+    class_level_ids = {level_id for item in items for level_id in item.get('class_levels', ())}
+    subject_ids = {item['subject'] for item in items if item.get('subject') is not None}
+
+    chapter_subjects = dict(Chapter.objects.filter(id__in=chapter_ids).values_list('id', 'subject_id'))
+    known_levels = set(ClassLevel.objects.filter(id__in=class_level_ids).values_list('id', flat=True))
+    known_subjects = set(Subject.objects.filter(id__in=subject_ids).values_list('id', flat=True))
+
+    results = []
+    for item in items:
+        errors = {}
+        subject_id = item.get('subject')
+        if subject_id is not None and subject_id not in known_subjects:
+            errors['subject'] = [f'Unknown subject {subject_id}.']
+
+        chapter_errors = []
+        for chapter_id in item.get('chapters', ()):
+            if chapter_id not in chapter_subjects:
+                chapter_errors.append(f'Unknown chapter {chapter_id}.')
+            elif subject_id is not None and chapter_subjects[chapter_id] != subject_id:
+                chapter_errors.append(f'Chapter {chapter_id} does not belong to subject {subject_id}.')
+        if chapter_errors:
+            errors['chapters'] = chapter_errors
+
+        level_errors = [
+            f'Unknown class level {level_id}.'
+            for level_id in item.get('class_levels', ()) if level_id not in known_levels
+        ]
+        if level_errors:
+            errors['class_levels'] = level_errors
+
+        results.append(errors)
+    return results
+
+
+#----------------------------CREATION-------------------------------
+
+def create_exercises(author, items):
+    """
+    Insert validated items in one transaction. Returns one
+    {'id', 'solution_id'} dict per item, in order.
+    """
+    exercises = []
+    for item in items:
+        exercise = Exercise(
+            author=author,
+            title=item['title'],
+            content=item['content'],
+            difficulty=item['difficulty'],
+            subject_id=item.get('subject'),
+        )
+        exercise.refresh_content_artifacts()
+        # Bulk inserts skip the pre_save receiver that sets it
+        exercise.calibrated_difficulty = label_difficulty(exercise.difficulty)
+        exercises.append(exercise)
+
+    with transaction.atomic():
+        Exercise.objects.bulk_create(exercises)
+
+        ChapterLink = Exercise.chapters.through
+        ClassLevelLink = Exercise.class_levels.through
+        chapter_links, level_links, solutions = [], [], {}
+        for exercise, item in zip(exercises, items):
+            chapter_links.extend(
+                ChapterLink(exercise_id=exercise.id, chapter_id=chapter_id)
+                for chapter_id in dict.fromkeys(item.get('chapters', ()))
+            )
+            level_links.extend(
+                ClassLevelLink(exercise_id=exercise.id, classlevel_id=level_id)
+                for level_id in dict.fromkeys(item.get('class_levels', ()))
+            )
+            if item.get('solution_content'):
+                solutions[exercise.id] = Solution(
+                    exercise=exercise, content=item['solution_content'], author=author
+                )
+
+        ChapterLink.objects.bulk_create(chapter_links)
+        ClassLevelLink.objects.bulk_create(level_links)
+        Solution.objects.bulk_create(solutions.values())
+        record_initial_revisions(exercises, author)
+        record_initial_revisions(list(solutions.values()), author)
+        store_signatures(exercises)
+
+        # Bulk inserts send no save/m2m signals: do what the receivers in
+        # things/signals.py would have done, once for the whole batch
+        linked_ids = {link.exercise_id for link in chapter_links}
+
+        def refresh():
+            invalidate_outlines()
+            if linked_ids:
+                refresh_related_many(linked_ids)
+
+        transaction.on_commit(refresh)
+
+    return [
+        {
+            'id': exercise.id,
+            'solution_id': solutions[exercise.id].id if exercise.id in solutions else None,
+        }
+        for exercise in exercises
+    ]
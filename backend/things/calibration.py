@@ -0,0 +1,238 @@
+"""
+Empirical difficulty calibration.
+
+The view history, the upvotes on exercises and the view counts are loaded
+into NumPy arrays once; everything else is array arithmetic (bincount over
+exercise positions), so the job costs a few passes over the history
+whatever its size.
+
+For every class level, exercises are measured on the learners who opened
+them:
+
+- difficulty compares how often an exercise was completed with how often
+  its learners complete the other exercises of the level, on a logit
+  scale: 0 is as expected, positive is harder. Both rates are shrunk
+  towards a prior by PRIOR_WEIGHT pseudo-attempts, the hand-picked label
+  (easy, medium, hard) setting the prior, so an exercise nobody opened
+  keeps the difficulty its label implies;
+- discrimination is the correlation between completing the exercise and
+  the learner's completion rate on the rest of the level: high when
+  the exercise separates strong learners from weak ones, near 0 or
+  negative when it does not. It needs MIN_RESPONDENTS learners;
+- upvote_rate is the share of learners who upvoted it, views_per_attempt
+  how often it was reopened.
+
+Results replace the rows of ExerciseCalibration; the attempt-weighted mean
+difficulty over the exercise's class levels goes to
+Exercise.calibrated_difficulty, the indexed sort key. Run with `manage.py
+calibrate_exercises`.
+"""
+
+import numpy as np
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import ViewHistory
+from .models import Exercise, ExerciseCalibration, Vote
+
+
+LABEL_PRIORS = {'easy': -1.0, 'medium': 0.0, 'hard': 1.0}
+PRIOR_WEIGHT = 5.0
+MIN_RESPONDENTS = 10
+# Rates are clipped this far from 0 and 1 before taking logits
+EPSILON = 1e-4
+
+READ_CHUNK = 10000
+WRITE_BATCH = 1000
+
+HISTORY_DTYPE = [('user', np.int64), ('exercise', np.int64), ('completed', np.bool_)]
+LINK_DTYPE = [('exercise', np.int64), ('class_level', np.int64)]
+VOTE_DTYPE = [('user', np.int64), ('exercise', np.int64)]
+EXERCISE_DTYPE = [('id', np.int64), ('label', 'U10'), ('views', np.float64), ('current', np.float64)]
+
+
+def label_difficulty(label):
+    """
+    Calibrated difficulty implied by a hand-picked label, used until the
+    exercise is measured.
+    """
+    return LABEL_PRIORS.get(label, LABEL_PRIORS['medium'])
+
+
+def labels_between(gte=None, lte=None):
+    """
+    Labels whose implied difficulty lies within the bounds.
+    """
+    return [
+        label for label, prior in LABEL_PRIORS.items()
+        if (gte is None or prior >= gte) and (lte is None or prior <= lte)
+    ]
+
+
+def logit(rate):
+    rate = np.clip(rate, EPSILON, 1 - EPSILON)
+    return np.log(rate / (1 - rate))
+
+
+def sigmoid(value):
+    return 1 / (1 + np.exp(-value))
+
+
+#----------------------------LOADING-------------------------------
+
+def _array(queryset, dtype):
+    return np.fromiter(queryset.order_by().iterator(chunk_size=READ_CHUNK), dtype=dtype)
+
+
+def load_data():
+    """
+    Return (exercises, history, links, upvotes) structured arrays;
+    exercises are sorted by id.
+    """
+    exercises = _array(
+        Exercise.objects.values_list('id', 'difficulty', 'view_count', 'calibrated_difficulty'),
+        EXERCISE_DTYPE,
+    )
+    exercises.sort(order='id')
+    history = _array(ViewHistory.objects.values_list('user_id', 'content_id', 'completed'), HISTORY_DTYPE)
+    links = _array(Exercise.class_levels.through.objects.values_list('exercise_id', 'classlevel_id'), LINK_DTYPE)
+    upvotes = _array(
+        Vote.objects.filter(
+            content_type=ContentType.objects.get_for_model(Exercise), value=Vote.UP
+        ).values_list('user_id', 'object_id'),
+        VOTE_DTYPE,
+    )
+    return exercises, history, links, upvotes
+
+
+def positions(exercise_ids, ids):
+    """
+    Positions of `ids` in the sorted `exercise_ids`, -1 for unknown ids.
+    """
+    if not len(exercise_ids):
+        return np.full(len(ids), -1, dtype=np.int64)
+    found = np.minimum(np.searchsorted(exercise_ids, ids), len(exercise_ids) - 1)
+    return np.where(exercise_ids[found] == ids, found, -1)
+
+
+#----------------------------STATISTICS-------------------------------
+
+def calibrate_level(users, exercises, completed, upvoted, members, priors, size):
+    """
+    Statistics of one class level. `users`, `exercises` (positions below
+    `size`), `completed` and `upvoted` have one entry per history row of the
+    level; `members` are the positions of the level's exercises and
+    `priors` their label priors. Returns a dict of arrays aligned with
+    `members`.
+    """
+    completed = completed.astype(np.float64)
+
+    def per_exercise(weights=None, rows=exercises):
+        return np.bincount(rows, weights=weights, minlength=size)[members]
+
+    attempts = per_exercise()
+    completions = per_exercise(completed)
+    level_rate = (completed.sum() + 1) / (len(completed) + 2)
+
+    # Each learner's record on the other exercises of the level
+    _, user_index = np.unique(users, return_inverse=True)
+    other_attempts = np.bincount(user_index)[user_index] - 1
+    other_completions = np.bincount(user_index, weights=completed)[user_index] - completed
+    ability = (other_completions + PRIOR_WEIGHT * level_rate) / (other_attempts + PRIOR_WEIGHT)
+
+    expected = (per_exercise(ability) + PRIOR_WEIGHT * level_rate) / (attempts + PRIOR_WEIGHT)
+    prior_rate = sigmoid(logit(level_rate) - priors)
+    observed = (completions + PRIOR_WEIGHT * prior_rate) / (attempts + PRIOR_WEIGHT)
+    difficulty = logit(expected) - logit(observed)
+
+    # Point-biserial correlation from per-exercise sums, over the learners
+    # who attempted something else in the level
+    informed = other_attempts > 0
+    rows = exercises[informed]
+    x = completed[informed]
+    y = other_completions[informed] / other_attempts[informed]
+    n = per_exercise(rows=rows)
+    sum_x, sum_y = per_exercise(x, rows), per_exercise(y, rows)
+    covariance = n * per_exercise(x * y, rows) - sum_x * sum_y
+    variance = (n * per_exercise(x * x, rows) - sum_x ** 2) * (n * per_exercise(y * y, rows) - sum_y ** 2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        discrimination = np.where(
+            (n >= MIN_RESPONDENTS) & (variance > 0), covariance / np.sqrt(variance), np.nan
+        )
+
+    return {
+        'attempts': attempts.astype(np.int64),
+        'completions': completions.astype(np.int64),
+        'difficulty': difficulty,
+        'discrimination': discrimination,
+        'upvote_rate': per_exercise(upvoted.astype(np.float64)) / np.maximum(attempts, 1),
+    }
+
+
+#----------------------------BUILD-------------------------------
+
+def build_calibration(batch_size=WRITE_BATCH):
+    """
+    Recompute every calibration row and Exercise.calibrated_difficulty.
+    Returns the number of rows written.
+    """
+    exercises, history, links, upvotes = load_data()
+    exercise_ids, size = exercises['id'], len(exercises)
+    priors = np.array([label_difficulty(label) for label in exercises['label'].tolist()])
+
+    row_positions = positions(exercise_ids, history['exercise'])
+    history = history[row_positions >= 0]
+    row_positions = row_positions[row_positions >= 0]
+
+    # An upvote counts when its author opened the exercise
+    width = int(exercise_ids[-1]) + 1 if size else 1
+    upvotes = upvotes[upvotes['exercise'] < width]
+    upvoted = np.isin(history['user'] * width + history['exercise'], upvotes['user'] * width + upvotes['exercise'])
+
+    total_attempts = np.bincount(row_positions, minlength=size)
+    views_per_attempt = exercises['views'] / np.maximum(total_attempts, 1)
+
+    weighted, weights = np.zeros(size), np.zeros(size)
+    now = timezone.now()
+    calibrations = []
+    for class_level_id in np.unique(links['class_level']).tolist():
+        members = positions(exercise_ids, links['exercise'][links['class_level'] == class_level_id])
+        members = np.unique(members[members >= 0])
+        in_level = np.isin(row_positions, members)
+        result = calibrate_level(
+            history['user'][in_level], row_positions[in_level], history['completed'][in_level],
+            upvoted[in_level], members, priors[members], size,
+        )
+
+        weight = result['attempts'] + PRIOR_WEIGHT
+        weighted[members] += weight * result['difficulty']
+        weights[members] += weight
+
+        for index, position in enumerate(members.tolist()):
+            discrimination = result['discrimination'][index]
+            calibrations.append(ExerciseCalibration(
+                exercise_id=int(exercise_ids[position]),
+                class_level_id=class_level_id,
+                attempts=int(result['attempts'][index]),
+                completions=int(result['completions'][index]),
+                difficulty=float(result['difficulty'][index]),
+                discrimination=None if np.isnan(discrimination) else float(discrimination),
+                upvote_rate=float(result['upvote_rate'][index]),
+                views_per_attempt=float(views_per_attempt[position]),
+                computed_at=now,
+            ))
+
+    # Exercises without a class level keep their label's difficulty
+    overall = np.where(weights > 0, weighted / np.maximum(weights, 1e-12), priors)
+    changed = np.flatnonzero(np.abs(overall - exercises['current']) > 1e-9)
+    updates = [
+        Exercise(id=int(exercise_ids[position]), calibrated_difficulty=float(overall[position]))
+        for position in changed.tolist()
+    ]
+
+    with transaction.atomic():
+        ExerciseCalibration.objects.all().delete()
+        ExerciseCalibration.objects.bulk_create(calibrations, batch_size=batch_size)
+        Exercise.objects.bulk_update(updates, ['calibrated_difficulty'], batch_size=batch_size)
+    return len(calibrations)
@@ -0,0 +1,304 @@
+"""
+Near-duplicate exercise detection.
+
+An exercise body is reduced to tokens (words, LaTeX commands and symbols)
+after dropping the markup that does not change what is asked: HTML, spacing
+commands, \\left/\\right, display styles and whitespace inside formulas.
+Runs of SHINGLE_SIZE tokens are its shingles and NUM_PERM min-hashes of the
+shingle set are its signature, stored in ExerciseSignature; the share of
+equal positions in two signatures estimates the Jaccard similarity of the
+two shingle sets. A body without tokens (only an image, say) has no
+signature and is never compared.
+
+Lookups go through an in-memory LSH index (locality-sensitive hashing):
+signatures are cut into BANDS bands of ROWS positions and two exercises are
+candidates when a whole band matches, which happens with high probability
+above a similarity of about (1 / BANDS) ** (1 / ROWS), about 0.7, and
+rarely below. A lookup hashes BANDS keys and compares the signatures of the
+few candidates, whatever the size of the corpus.
+
+Each process loads the index on first use (config/warmup.py does it before
+the workers fork) and then catches up on the signatures written since with
+one indexed query per lookup, so exercises posted through another worker
+are found too.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Exercise, ExerciseSignature
+from .utils import strip_html
+
+
+logger = logging.getLogger('django')
+
+SHINGLE_SIZE = 4
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+DUPLICATE_THRESHOLD = 0.7
+MAX_DUPLICATES = 5
+
+# Universal hashing (a * x + b) mod PRIME over 32-bit shingle hashes: with a
+# and b below PRIME every product fits in 64 bits
+PRIME = (1 << 32) - 5
+_rng = np.random.default_rng(20240611)
+PERM_A = _rng.integers(1, PRIME, NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.integers(0, PRIME, NUM_PERM, dtype=np.uint64)
+
+# Signatures committed this long after their timestamp are still picked up
+SYNC_OVERLAP = timedelta(minutes=1)
+
+LATEX_NOISE_RE = re.compile(
+    r'\\(?:left|right|displaystyle|textstyle|limits|nolimits|[,;:!]|[qt]?quad)(?![A-Za-z])|\\ '
+)
+LATEX_ALIASES = {
+    r'\dfrac': r'\frac',
+    r'\tfrac': r'\frac',
+    r'\le': r'\leq',
+    r'\ge': r'\geq',
+    r'\ne': r'\neq',
+}
+TOKEN_RE = re.compile(r'\\[A-Za-z]+|\w+|[^\w\s$]')
+
+
+#----------------------------SIGNATURES-------------------------------
+
+def normalize(content):
+    """
+    Lower-cased tokens of an exercise body, markup removed.
+    """
+    text = LATEX_NOISE_RE.sub(' ', strip_html(content))
+    tokens = TOKEN_RE.findall(text.lower())
+    return [LATEX_ALIASES.get(token, token) for token in tokens]
+
+
+def shingles(tokens, size=SHINGLE_SIZE):
+    """
+    32-bit hashes of the runs of `size` tokens (of all tokens when fewer).
+    """
+    if len(tokens) < size:
+        runs = [tokens] if tokens else []
+    else:
+        runs = [tokens[index:index + size] for index in range(len(tokens) - size + 1)]
+    hashes = {
+        int.from_bytes(hashlib.blake2b(' '.join(run).encode('utf-8'), digest_size=4).digest(), 'little')
+        for run in runs
+    }
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+def signature(content):
+    """
+    MinHash signature of an exercise body, NUM_PERM uint32, or None when the
+    body has no tokens: all such bodies would get the same signature and
+    match each other.
+    """
+    hashes = shingles(normalize(content))
+    if not len(hashes):
+        return None
+    values = (np.outer(hashes, PERM_A) + PERM_B) % PRIME
+    return values.min(axis=0).astype(np.uint32)
+
+
+def to_bytes(values):
+    return values.astype('<u4').tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(bytes(data), dtype='<u4').astype(np.uint32)
+
+
+def similarity(first, second):
+    """
+    Estimated Jaccard similarity of two signatures.
+    """
+    return float(np.count_nonzero(first == second)) / NUM_PERM
+
+
+def store_signatures(exercises):
+    """
+    Compute and upsert the signatures of saved exercises, one query.
+    Exercises without a signature lose the one they had.
+    """
+    rows, empty = [], []
+    for exercise in exercises:
+        values = signature(exercise.content)
+        if values is None:
+            empty.append(exercise.pk)
+        else:
+            rows.append(ExerciseSignature(exercise_id=exercise.pk, minhash=to_bytes(values)))
+    if empty:
+        ExerciseSignature.objects.filter(exercise_id__in=empty).delete()
+    ExerciseSignature.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['exercise'],
+        update_fields=['minhash', 'updated_at'],
+    )
+
+
+#----------------------------LSH INDEX-------------------------------
+
+def band_keys(values):
+    """
+    One hashable key per band: (band number, band bytes).
+    """
+    data = to_bytes(values)
+    width = ROWS * 4
+    return [(band, data[band * width:(band + 1) * width]) for band in range(BANDS)]
+
+
+class LSHIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = defaultdict(set)
+        self.signatures = {}
+
+    def add(self, exercise_id, values):
+        with self.lock:
+            self._remove(exercise_id)
+            self.signatures[exercise_id] = values
+            for key in band_keys(values):
+                self.buckets[key].add(exercise_id)
+
+    def _remove(self, exercise_id):
+        previous = self.signatures.pop(exercise_id, None)
+        if previous is None:
+            return
+        for key in band_keys(previous):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(exercise_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def query(self, values, threshold=DUPLICATE_THRESHOLD, exclude=None):
+        """
+        Return [(exercise_id, similarity)] above `threshold`, most similar first.
+        """
+        with self.lock:
+            candidates = set()
+            for key in band_keys(values):
+                candidates.update(self.buckets.get(key, ()))
+            candidates.discard(exclude)
+            scored = [
+                (exercise_id, similarity(values, self.signatures[exercise_id]))
+                for exercise_id in candidates
+            ]
+        scored = [(exercise_id, score) for exercise_id, score in scored if score >= threshold]
+        return sorted(scored, key=lambda entry: (-entry[1], entry[0]))
+
+    def pairs(self, threshold=DUPLICATE_THRESHOLD):
+        """
+        Every pair of indexed exercises sharing a band and above `threshold`.
+        """
+        seen = set()
+        with self.lock:
+            for bucket in self.buckets.values():
+                members = sorted(bucket)
+                for position, first in enumerate(members):
+                    for second in members[position + 1:]:
+                        if (first, second) in seen:
+                            continue
+                        seen.add((first, second))
+                        if similarity(self.signatures[first], self.signatures[second]) >= threshold:
+                            yield first, second
+
+
+class SharedIndex:
+    """
+    The process's LSHIndex, loaded lazily and kept in sync with the table.
+    """
+    def __init__(self):
+        self.index = None
+        self.synced_at = None
+        self.lock = threading.Lock()
+
+    def _load(self, rows):
+        for exercise_id, minhash in rows:
+            self.index.add(exercise_id, from_bytes(minhash))
+
+    def get(self):
+        with self.lock:
+            if self.index is None:
+                self.index = LSHIndex()
+                self.synced_at = ExerciseSignature.objects.aggregate(latest=Max('updated_at'))['latest'] or timezone.now()
+                self._load(ExerciseSignature.objects.values_list('exercise_id', 'minhash').iterator(chunk_size=2000))
+                logger.info("Loaded %d exercise signatures", len(self.index.signatures))
+            else:
+                rows = list(
+                    ExerciseSignature.objects.filter(updated_at__gte=self.synced_at - SYNC_OVERLAP)
+                    .values_list('exercise_id', 'minhash', 'updated_at')
+                )
+                self._load((exercise_id, minhash) for exercise_id, minhash, _ in rows)
+                self.synced_at = max([self.synced_at] + [updated_at for _, _, updated_at in rows])
+            return self.index
+
+
+shared_index = SharedIndex()
+
+
+#----------------------------LOOKUPS-------------------------------
+
+def find_duplicates(content, exclude=None, threshold=DUPLICATE_THRESHOLD, limit=MAX_DUPLICATES):
+    """
+    Visible exercises whose body is nearly the same as `content`:
+    [{'id', 'title', 'similarity'}], most similar first.
+    """
+    values = signature(content)
+    if values is None:
+        return []
+    matches = shared_index.get().query(values, threshold, exclude=exclude)
+    if not matches:
+        return []
+    titles = dict(
+        Exercise.objects.filter(id__in=[exercise_id for exercise_id, _ in matches], is_hidden=False)
+        .values_list('id', 'title')
+    )
+    return [
+        {'id': exercise_id, 'title': titles[exercise_id], 'similarity': round(score, 2)}
+        for exercise_id, score in matches if exercise_id in titles
+    ][:limit]
+
+
+def cluster_duplicates(threshold=DUPLICATE_THRESHOLD):
+    """
+    Group every exercise with its near duplicates (union-find over the
+    candidate pairs of a freshly built index). Returns the groups of two or
+    more exercise ids, largest first.
+    """
+    index = LSHIndex()
+    for exercise_id, minhash in ExerciseSignature.objects.values_list('exercise_id', 'minhash').iterator(chunk_size=2000):
+        index.add(exercise_id, from_bytes(minhash))
+
+    parents = {}
+
+    def find(node):
+        root = node
+        while parents.get(root, root) != root:
+            root = parents[root]
+        while node != root:
+            parents[node], node = root, parents.get(node, node)
+        return root
+
+    for first, second in index.pairs(threshold):
+        first_root, second_root = find(first), find(second)
+        if first_root != second_root:
+            parents[max(first_root, second_root)] = min(first_root, second_root)
+
+    groups = defaultdict(list)
+    for node in parents:
+        groups[find(node)].append(node)
+    for root in list(groups):
+        if root not in groups[root]:
+            groups[root].append(root)
+    return sorted((sorted(group) for group in groups.values()), key=lambda group: (-len(group), group[0]))
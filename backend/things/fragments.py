@@ -0,0 +1,147 @@
+"""
+Cached exercise detail.
+
+The detail payload (exercise, solution, comment tree, authors, taxonomy) is
+the same for every viewer except a few per-user fields. It is serialized
+once per exercise with those fields left empty and cached until
+things/signals.py (or a write path that bypasses signals) invalidates it.
+Each response then merges an overlay read with a single query: the viewer's
+votes on the exercise, its solution and comments, their completion state,
+and the view counter, which changes too often to be part of the fragment.
+
+Invalidation replaces a per-exercise version token instead of deleting the
+fragment, so a rebuild that read the database before a write committed
+stores an entry that is already stale and is ignored.
+"""
+
+import uuid
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, IntegerField, Q, Value
+from django.db.models.functions import Cast
+
+from config import metrics
+from users.models import ViewHistory
+from .models import Exercise, Solution, Comment, Vote
+
+
+CACHE_TIMEOUT = 60 * 60
+
+# Kind column markers in the overlay query; content type ids are positive
+VIEW_COUNT = 0
+COMPLETED = -1
+
+
+#----------------------------CACHE-------------------------------
+
+def _keys(exercise_id):
+    return f'exercise-detail:{exercise_id}', f'exercise-detail:version:{exercise_id}'
+
+
+def _token():
+    return uuid.uuid4().hex
+
+
+def invalidate_exercises(exercise_ids):
+    tokens = {_keys(exercise_id)[1]: _token() for exercise_id in set(exercise_ids) if exercise_id is not None}
+    if tokens:
+        cache.set_many(tokens, None)
+
+
+def invalidate_on_commit(exercise_ids):
+    exercise_ids = set(exercise_ids)
+    if exercise_ids:
+        transaction.on_commit(lambda: invalidate_exercises(exercise_ids))
+
+
+def exercises_of(model, object_ids):
+    """
+    Ids of the exercises whose detail shows the given objects.
+    """
+    if model is Exercise:
+        return set(object_ids)
+    if model in (Solution, Comment):
+        return set(model.objects.filter(id__in=object_ids).values_list('exercise_id', flat=True))
+    return set()
+
+
+def get_fragment(exercise_id, build):
+    """
+    Return the shared detail of an exercise, calling `build()` to serialize
+    it on a miss.
+    """
+    fragment_key, version_key = _keys(exercise_id)
+    cached = cache.get_many([fragment_key, version_key])
+    version, entry = cached.get(version_key), cached.get(fragment_key)
+    if entry is not None and entry[0] == version:
+        metrics.inc('cache_requests_total', cache='exercise_detail', result='hit')
+        return entry[1]
+    metrics.inc('cache_requests_total', cache='exercise_detail', result='miss')
+
+    if version is None:
+        cache.add(version_key, _token(), None)
+        version = cache.get(version_key)
+    data = build()
+    cache.set(fragment_key, (version, data), CACHE_TIMEOUT)
+    return data
+
+
+#----------------------------OVERLAY-------------------------------
+
+def _walk_comments(comments):
+    for comment in comments:
+        yield comment
+        yield from _walk_comments(comment.get('replies') or [])
+
+
+def apply_overlay(data, user):
+    """
+    Fill the per-user fields of a fragment in place for `user`.
+    """
+    exercise_id = data['id']
+    solution = data.get('solution')
+    comments = list(_walk_comments(data.get('comments') or []))
+
+    # Every column is an annotation so the branches of the UNION line up
+    columns = ('overlay_kind', 'overlay_id', 'overlay_value')
+    rows = Exercise.objects.filter(pk=exercise_id).order_by().annotate(
+        overlay_kind=Value(VIEW_COUNT, IntegerField()), overlay_id=F('id'), overlay_value=F('view_count'),
+    ).values_list(*columns)
+
+    if user.is_authenticated:
+        content_types = ContentType.objects.get_for_models(Exercise, Solution, Comment)
+        targets = Q(content_type=content_types[Exercise], object_id=exercise_id)
+        if solution:
+            targets |= Q(content_type=content_types[Solution], object_id=solution['id'])
+        if comments:
+            targets |= Q(content_type=content_types[Comment], object_id__in=[comment['id'] for comment in comments])
+
+        votes = Vote.objects.filter(targets, user=user).order_by().annotate(
+            overlay_kind=F('content_type_id'), overlay_id=F('object_id'), overlay_value=F('value'),
+        ).values_list(*columns)
+        completion = ViewHistory.objects.filter(user=user, content_id=exercise_id).order_by().annotate(
+            overlay_kind=Value(COMPLETED, IntegerField()), overlay_id=F('content_id'),
+            overlay_value=Cast('completed', IntegerField()),
+        ).values_list(*columns)
+        rows = rows.union(votes, completion, all=True)
+
+    user_votes = {}
+    data['completed'] = False if user.is_authenticated else None
+    for kind, object_id, value in rows:
+        if kind == VIEW_COUNT:
+            data['view_count'] = value
+        elif kind == COMPLETED:
+            data['completed'] = bool(value)
+        else:
+            user_votes[(kind, object_id)] = value
+
+    if user_votes:
+        content_types = ContentType.objects.get_for_models(Exercise, Solution, Comment)
+        data['user_vote'] = user_votes.get((content_types[Exercise].id, exercise_id))
+        if solution:
+            solution['user_vote'] = user_votes.get((content_types[Solution].id, solution['id']))
+        for comment in comments:
+            comment['user_vote'] = user_votes.get((content_types[Comment].id, comment['id']))
+    return data
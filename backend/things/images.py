@@ -0,0 +1,249 @@
+"""
+Content-addressed image uploads.
+
+HashingUploadHandler streams the request body to a temporary file under
+MEDIA_ROOT and hashes it on the way, so uploads are never held in memory.
+The file is then moved to a path derived from its SHA-256: uploading the
+same diagram again reuses the stored object. Resized variants are generated
+after commit by a small thread pool. Stored files never change, so their
+URLs are served with a cache-forever policy.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.db import connection, transaction
+from PIL import Image
+
+from .models import UploadedImage
+
+
+logger = logging.getLogger('django')
+
+# Pillow format -> (extension, MIME type). SVG is left out on purpose: it can carry scripts.
+IMAGE_FORMATS = {
+    'PNG': ('png', 'image/png'),
+    'JPEG': ('jpg', 'image/jpeg'),
+    'GIF': ('gif', 'image/gif'),
+    'WEBP': ('webp', 'image/webp'),
+}
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+#----------------------------PATHS-------------------------------
+
+def _media_path(relative):
+    return os.path.join(settings.MEDIA_ROOT, relative)
+
+
+def _temporary_dir():
+    path = _media_path('tmp')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def content_path(digest, extension, width=None):
+    suffix = f'_{width}' if width else ''
+    return f'images/{digest[:2]}/{digest[2:4]}/{digest}{suffix}.{extension}'
+
+
+def media_url(path):
+    return settings.MEDIA_URL + path
+
+
+def _move_into_place(source, relative):
+    destination = _media_path(relative)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    # Same filesystem as the temporary dir, so the rename is atomic
+    os.replace(source, destination)
+    os.chmod(destination, 0o644)
+
+
+#----------------------------UPLOAD HANDLER-------------------------------
+
+class HashedUpload(UploadedFile):
+    """
+    An uploaded file spooled to MEDIA_ROOT/tmp, with its running SHA-256.
+    """
+    def __init__(self, name, content_type, charset, content_type_extra):
+        fd, self.temporary_path = tempfile.mkstemp(dir=_temporary_dir(), suffix='.upload')
+        super().__init__(os.fdopen(fd, 'w+b'), name, content_type, 0, charset, content_type_extra)
+        self.hasher = hashlib.sha256()
+
+    def temporary_file_path(self):
+        return self.temporary_path
+
+    def append(self, chunk):
+        self.file.write(chunk)
+        self.hasher.update(chunk)
+
+    def discard(self):
+        self.close()
+        try:
+            os.unlink(self.temporary_path)
+        except FileNotFoundError:
+            pass
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Write each uploaded file to disk chunk by chunk while hashing it. Files
+    over IMAGE_UPLOAD_MAX_SIZE are dropped as soon as they cross the limit
+    and flagged in `rejected`. Call discard_all() once the request is done.
+    """
+    def __init__(self, request=None, max_size=None):
+        super().__init__(request)
+        self.max_size = max_size or settings.IMAGE_UPLOAD_MAX_SIZE
+        self.file = None
+        self.files = []
+        self.rejected = []
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = HashedUpload(self.file_name, self.content_type, self.charset, self.content_type_extra)
+        self.files.append(self.file)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            self.file.discard()
+            self.rejected.append(self.field_name)
+            raise SkipFile()
+        self.file.append(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        return self.file
+
+    def upload_interrupted(self):
+        self.discard_all()
+
+    def discard_all(self):
+        for upload in self.files:
+            upload.discard()
+
+
+#----------------------------STORAGE-------------------------------
+
+def _inspect(path):
+    """
+    Return (format, width, height), raising ValueError for anything that is
+    not a complete image in an accepted format.
+    """
+    try:
+        with Image.open(path) as image:
+            image_format, (width, height) = image.format, image.size
+            image.verify()
+    except Exception as error:
+        # Pillow raises a variety of errors on truncated or malformed files
+        raise ValueError('Not a valid image') from error
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f'Unsupported image format {image_format}')
+    return image_format, width, height
+
+
+def store_upload(upload, user=None):
+    """
+    Store a HashedUpload, or reuse the image already stored with the same
+    content. Returns (image, created); the temporary file is consumed either way.
+    """
+    digest = upload.hasher.hexdigest()
+    existing = UploadedImage.objects.filter(sha256=digest).first()
+    if existing is not None:
+        upload.discard()
+        return existing, False
+
+    try:
+        image_format, width, height = _inspect(upload.temporary_path)
+        extension, mime_type = IMAGE_FORMATS[image_format]
+        path = content_path(digest, extension)
+        upload.close()
+        _move_into_place(upload.temporary_path, path)
+    finally:
+        upload.discard()
+
+    # A concurrent upload of the same bytes may have won: it wrote the same file
+    image, created = UploadedImage.objects.get_or_create(sha256=digest, defaults={
+        'path': path,
+        'mime_type': mime_type,
+        'size': upload.size,
+        'width': width,
+        'height': height,
+        'uploaded_by': user,
+    })
+    if created:
+        transaction.on_commit(lambda: schedule_variants(image.id))
+    return image, created
+
+
+#----------------------------VARIANTS-------------------------------
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # One pool per process: threads do not survive a pre-forking server's fork()
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS,
+                thread_name_prefix='image-variants',
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def schedule_variants(image_id):
+    _get_executor().submit(_generate_in_worker, image_id)
+
+
+def _generate_in_worker(image_id):
+    try:
+        generate_variants(image_id)
+    except Exception:
+        logger.exception("Generating variants of image %s failed", image_id)
+    finally:
+        connection.close()
+
+
+def generate_variants(image_id):
+    """
+    Write the missing resized copies of an image. Returns the variants map.
+    """
+    image = UploadedImage.objects.get(id=image_id)
+    extension = image.path.rsplit('.', 1)[-1]
+    variants = dict(image.variants)
+    widths = [
+        width for width in settings.IMAGE_VARIANT_WIDTHS
+        if width < image.width and str(width) not in variants
+    ]
+    if not widths:
+        return variants
+
+    with Image.open(_media_path(image.path)) as source:
+        source.load()
+        for width in widths:
+            path = content_path(image.sha256, extension, width)
+            if not os.path.exists(_media_path(path)):
+                height = max(1, round(image.height * width / image.width))
+                resized = source.resize((width, height), Image.Resampling.LANCZOS)
+                fd, temporary = tempfile.mkstemp(dir=_temporary_dir(), suffix=f'.{extension}')
+                with os.fdopen(fd, 'wb') as output:
+                    resized.save(output, format=source.format)
+                _move_into_place(temporary, path)
+            variants[str(width)] = path
+
+    UploadedImage.objects.filter(id=image_id).update(variants=variants)
+    return variants
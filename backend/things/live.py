@@ -0,0 +1,238 @@
+"""
+Live exercise updates.
+
+Write paths publish compact deltas (new vote scores, new comments) on a
+per-exercise channel once their transaction commits; open exercise pages
+receive them over Server-Sent Events instead of refetching.
+
+The broker is chosen with LIVE_BROKER. LocalBroker fans messages out inside
+the current process, which is all a single ASGI worker (or the dev server)
+needs. RedisBroker publishes through Redis so every worker sees every
+message; each process still keeps one listener that feeds its local
+subscribers, so the number of Redis connections does not grow with the
+number of open pages.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger('django')
+
+# Pending messages per subscriber; a client that falls this far behind is
+# disconnected and resynchronises by reloading when EventSource reconnects
+QUEUE_SIZE = 100
+
+
+def exercise_channel(exercise_id):
+    return f'exercise:{exercise_id}'
+
+
+#----------------------------SUBSCRIPTIONS-------------------------------
+
+class Subscription:
+    """
+    A queue of messages for one open stream, bound to the event loop that
+    created it. Brokers may push from any thread.
+    """
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+
+    def push(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The loop is gone: the stream ended without unsubscribing yet
+            pass
+
+    def _put(self, message):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout):
+        """
+        Return the next message, None once the subscriber fell behind, or
+        raise asyncio.TimeoutError after `timeout` seconds of silence.
+        """
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+#----------------------------BROKERS-------------------------------
+
+class LocalBroker:
+    """
+    In-process fan-out. Messages only reach streams served by this process.
+    """
+    def __init__(self, **options):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+    def deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.push(message)
+
+
+class RedisBroker(LocalBroker):
+    """
+    Publish through Redis PUBLISH; one pattern subscription per process
+    relays every message to the local subscribers.
+    """
+    def __init__(self, url='redis://localhost:6379/0', prefix='fidni:live:', **options):
+        import redis
+
+        super().__init__(**options)
+        self.url = url
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+
+    def subscribe(self, channel):
+        self._ensure_listener()
+        return super().subscribe(channel)
+
+    def publish(self, channel, message):
+        self.client.publish(self.prefix + channel, json.dumps(message, separators=(',', ':')))
+
+    def _ensure_listener(self):
+        # Threads do not survive a pre-forking server's fork(): start one per process
+        with self._listener_lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            threading.Thread(target=self._listen, name='live-broker', daemon=True).start()
+
+    def _listen(self):
+        import redis
+
+        while True:
+            try:
+                pubsub = redis.Redis.from_url(self.url).pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.prefix + '*')
+                for item in pubsub.listen():
+                    channel = item['channel'].decode('utf-8')[len(self.prefix):]
+                    self.deliver(channel, json.loads(item['data']))
+            except redis.RedisError:
+                logger.exception("Live broker lost its Redis subscription, reconnecting")
+                threading.Event().wait(1)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.LIVE_BROKER)(**settings.LIVE_BROKER_OPTIONS)
+    return _broker
+
+
+#----------------------------PUBLISHING-------------------------------
+
+def _publish_on_commit(exercise_id, event, data):
+    message = {'event': event, 'data': data}
+
+    def publish():
+        try:
+            get_broker().publish(exercise_channel(exercise_id), message)
+        except Exception:
+            # Live updates are best effort: the write already succeeded
+            logger.exception("Publishing %s on exercise %s failed", event, exercise_id)
+
+    transaction.on_commit(publish)
+
+
+def publish_votes(deltas):
+    """
+    Publish new scores. `deltas` are (exercise_id, kind, object_id, score)
+    tuples, `kind` being a key of votes.VOTE_TARGETS.
+    """
+    for exercise_id, kind, object_id, score in deltas:
+        _publish_on_commit(exercise_id, 'vote', {'type': kind, 'id': object_id, 'vote_count': score})
+
+
+def publish_comment(comment):
+    """
+    Publish a new comment in the shape the exercise page renders; per-user
+    fields get their defaults for everyone.
+    """
+    _publish_on_commit(comment.exercise_id, 'comment', {
+        'id': comment.id,
+        'parent_id': comment.parent_id,
+        'content': comment.content,
+        'author': {'id': comment.author_id, 'username': comment.author.username},
+        'created_at': comment.created_at.isoformat(),
+        'replies': [],
+        'vote_count': 0,
+        'user_vote': None,
+    })
+
+
+#----------------------------STREAM-------------------------------
+
+def format_event(message):
+    data = json.dumps(message['data'], separators=(',', ':'))
+    return f"event: {message['event']}\ndata: {data}\n\n"
+
+
+async def event_stream(subscription):
+    """
+    Yield SSE frames from `subscription` until the client disconnects (the
+    server then cancels the generator) or falls behind.
+    """
+    try:
+        yield f'retry: {settings.LIVE_RETRY_MS}\n\n'
+        while True:
+            try:
+                message = await subscription.get(settings.LIVE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                continue
+            if message is None:
+                break
+            yield format_event(message)
+    finally:
+        subscription.close()
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from things.models import Exercise
+
+
+class Command(BaseCommand):
+    help = "Recompute excerpt, word/formula counts and content hash for existing exercises"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help="Also recompute rows that already have a content hash",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = ['excerpt', 'word_count', 'formula_count', 'content_hash']
+
+        queryset = Exercise.objects.only('id', 'content', *fields).order_by('id')
+        if not options['force']:
+            queryset = queryset.filter(content_hash='')
+
+        batch = []
+        updated = 0
+        for exercise in queryset.iterator(chunk_size=batch_size):
+            exercise.refresh_content_artifacts()
+            batch.append(exercise)
+            if len(batch) >= batch_size:
+                Exercise.objects.bulk_update(batch, fields)
+                updated += len(batch)
+                batch = []
+
+        if batch:
+            Exercise.objects.bulk_update(batch, fields)
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {updated} exercises"))
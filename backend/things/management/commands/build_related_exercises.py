@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from things.related import TOP_K, build_related_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the related-exercises table from shared theorems, chapters and lessons"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=TOP_K)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rows = build_related_index(top_k=options['top_k'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} related-exercise rows"))
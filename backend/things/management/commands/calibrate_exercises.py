@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from things.calibration import WRITE_BATCH, build_calibration
+
+
+class Command(BaseCommand):
+    help = "Recompute the empirical difficulty and discrimination of every exercise per class level"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=WRITE_BATCH)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = build_calibration(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {rows} calibration rows in {time.perf_counter() - started:.1f}s"
+        ))
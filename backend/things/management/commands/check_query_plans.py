@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from things.query_plans import MIN_ROWS, find_sequential_scans
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the canonical query of every endpoint and fail on sequential scans of large tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-rows', type=int, default=MIN_ROWS,
+                            help="Tables with fewer rows may be scanned sequentially")
+        parser.add_argument('--show-plans', action='store_true')
+
+    def handle(self, *args, **options):
+        failures = 0
+        for name, plan, offenders in find_sequential_scans(options['min_rows']):
+            if offenders:
+                failures += 1
+                scanned = ', '.join(f'{table} (~{rows} rows)' for table, rows in offenders)
+                self.stdout.write(self.style.ERROR(f"{name}: sequential scan of {scanned}"))
+            else:
+                self.stdout.write(f"{name}: ok")
+            if options['show_plans'] or offenders:
+                self.stdout.write(plan + '\n')
+
+        if failures:
+            raise CommandError(f"{failures} queries scan large tables sequentially")
+        self.stdout.write(self.style.SUCCESS("No sequential scans of large tables"))
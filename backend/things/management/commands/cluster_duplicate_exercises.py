@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from things.duplicates import DUPLICATE_THRESHOLD, cluster_duplicates, store_signatures
+from things.models import Exercise
+
+
+class Command(BaseCommand):
+    help = "Group existing exercises with their near duplicates (MinHash/LSH), signing unsigned exercises first"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=DUPLICATE_THRESHOLD)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--resign',
+            action='store_true',
+            help="Recompute every signature, e.g. after changing the normalization",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Exercise.objects.only('id', 'content').order_by('id')
+        if not options['resign']:
+            queryset = queryset.filter(signature__isnull=True)
+
+        batch, signed = [], 0
+        for exercise in queryset.iterator(chunk_size=batch_size):
+            batch.append(exercise)
+            if len(batch) >= batch_size:
+                store_signatures(batch)
+                signed += len(batch)
+                batch = []
+        if batch:
+            store_signatures(batch)
+            signed += len(batch)
+
+        groups = cluster_duplicates(options['threshold'])
+        titles = dict(
+            Exercise.objects.filter(id__in=[exercise_id for group in groups for exercise_id in group])
+            .values_list('id', 'title')
+        )
+        for group in groups:
+            self.stdout.write(', '.join(f'{exercise_id} {titles.get(exercise_id, "")!r}' for exercise_id in group))
+        self.stdout.write(self.style.SUCCESS(
+            f"Signed {signed} exercises, found {len(groups)} groups of near duplicates"
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from things.revisions import KEEP_RECENT, compact_all
+
+
+class Command(BaseCommand):
+    help = "Thin out old exercise and solution revisions, keeping the recent ones and one per day before them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-recent', type=int, default=KEEP_RECENT)
+
+    def handle(self, *args, **options):
+        deleted = compact_all(keep_recent=options['keep_recent'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} revisions"))
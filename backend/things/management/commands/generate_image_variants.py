@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from things.images import generate_variants
+from things.models import UploadedImage
+
+
+class Command(BaseCommand):
+    help = "Generate the resized variants missing from uploaded images (e.g. after a worker restart)"
+
+    def handle(self, *args, **options):
+        expected = len(settings.IMAGE_VARIANT_WIDTHS)
+        processed = 0
+        for image in UploadedImage.objects.only('id', 'width', 'variants').iterator():
+            wanted = sum(1 for width in settings.IMAGE_VARIANT_WIDTHS if width < image.width)
+            if len(image.variants) < min(wanted, expected):
+                generate_variants(image.id)
+                processed += 1
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {processed} images"))
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.6 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('things', '0002_theorem_lesson_theorem'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='lesson',
+            old_name='theorem',
+            new_name='theorems',
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='theorems',
+            field=models.ManyToManyField(related_name='exercises', to='things.theorem'),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='excerpt',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='formula_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
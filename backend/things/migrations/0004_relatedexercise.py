@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-19 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('things', '0003_exercise_content_artifacts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedExercise',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_entries', to='things.exercise')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='things.exercise')),
+            ],
+            options={
+                'ordering': ['exercise', 'rank'],
+                'indexes': [models.Index(fields=['exercise', 'rank'], name='things_rela_exercis_b5cb13_idx')],
+                'unique_together': {('exercise', 'related')},
+            },
+        ),
+    ]
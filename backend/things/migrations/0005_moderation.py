@@ -0,0 +1,51 @@
+# Generated by Django 5.1.6 on 2026-10-19 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('things', '0004_relatedexercise'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='is_hidden',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='is_hidden',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='is_hidden',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='solution',
+            name='is_hidden',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ReportSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('report_count', models.PositiveIntegerField(default=0)),
+                ('last_reported_at', models.DateTimeField()),
+                ('reasons', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('hidden', 'Hidden'), ('restored', 'Restored')], default='open', max_length=10)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='contenttypes.contenttype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', '-report_count', '-last_reported_at'], name='things_repo_status_e2ade3_idx')],
+                'unique_together': {('content_type', 'object_id')},
+            },
+        ),
+    ]
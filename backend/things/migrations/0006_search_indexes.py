@@ -0,0 +1,44 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+# Full-text indexes used by the admin search (things/admin.py). They are
+# expression indexes that only exist on PostgreSQL, so they are created here
+# rather than declared on the models.
+SEARCH_INDEXES = [
+    ('exercise', 'things_exercise_search_idx', ('title', 'content')),
+    ('solution', 'things_solution_search_idx', ('content',)),
+    ('comment', 'things_comment_search_idx', ('content',)),
+]
+
+
+def _indexes(apps):
+    for model_name, name, fields in SEARCH_INDEXES:
+        index = GinIndex(SearchVector(*fields, config='simple'), name=name)
+        yield apps.get_model('things', model_name), index
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model, index in _indexes(apps):
+        schema_editor.add_index(model, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model, index in _indexes(apps):
+        schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('things', '0005_moderation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.6 on 2026-10-19 16:05
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_sort_keys(apps, schema_editor):
+    Exercise = apps.get_model('things', 'Exercise')
+    Comment = apps.get_model('things', 'Comment')
+    Vote = apps.get_model('things', 'Vote')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+
+    comments = Comment.objects.filter(exercise=OuterRef('pk')).order_by().values('exercise').annotate(
+        total=Count('id')
+    ).values('total')
+    Exercise.objects.update(comment_count=Coalesce(Subquery(comments, output_field=IntegerField()), 0))
+
+    content_type = ContentType.objects.filter(app_label='things', model='exercise').first()
+    if content_type is None:
+        return
+    votes = Vote.objects.filter(content_type=content_type, object_id=OuterRef('pk')).order_by().values(
+        'object_id'
+    ).annotate(total=Sum('value')).values('total')
+    Exercise.objects.update(vote_score=Coalesce(Subquery(votes, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('things', '0008_uploadedimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercise',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='vote_score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_sort_keys, migrations.RunPython.noop),
+    ]
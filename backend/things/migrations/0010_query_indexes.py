@@ -0,0 +1,55 @@
+# Generated by Django 5.1.6 on 2026-10-19 16:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Auto-created M2M tables only index each column on its own. Filters start
+# from the taxonomy side (exercises of these class levels), so these
+# composite indexes let them read exercise ids straight from the index.
+THROUGH_INDEXES = [
+    ('things_exercise_class_levels', 'things_exercise_class_levels_rev_idx', ('classlevel_id', 'exercise_id')),
+    ('things_exercise_chapters', 'things_exercise_chapters_rev_idx', ('chapter_id', 'exercise_id')),
+    ('things_chapter_class_levels', 'things_chapter_class_levels_rev_idx', ('classlevel_id', 'chapter_id')),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('things', '0009_exercise_sort_keys'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['subject', 'difficulty', '-created_at'], name='things_exer_subject_5e5ce7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['created_at', 'id'], name='things_exer_created_5e5204_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['vote_score', 'id'], name='things_exer_vote_sc_da3bdf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['comment_count', 'id'], name='things_exer_comment_636ad4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['view_count', 'id'], name='things_exer_view_co_2f28b5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['user', 'content_type', 'value', '-created_at'], name='things_vote_user_id_865c44_idx'),
+        ),
+    ] + [
+        migrations.RunSQL(
+            f'CREATE INDEX {name} ON {table} ({", ".join(columns)})',
+            f'DROP INDEX {name}',
+        )
+        for table, name, columns in THROUGH_INDEXES
+    ]
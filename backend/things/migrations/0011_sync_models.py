@@ -0,0 +1,151 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def assign_default_subfields(apps, schema_editor):
+    """
+    Chapters and theorems created before subfields existed are filed under
+    one subfield per subject, named after it, to be split up from the admin.
+    """
+    Subject = apps.get_model('things', 'Subject')
+    Subfield = apps.get_model('things', 'Subfield')
+    Chapter = apps.get_model('things', 'Chapter')
+    Theorem = apps.get_model('things', 'Theorem')
+
+    subject_ids = set(Chapter.objects.filter(subfield__isnull=True).values_list('subject_id', flat=True))
+    subject_ids |= set(Theorem.objects.filter(subfield__isnull=True).values_list('subject_id', flat=True))
+    for subject in Subject.objects.filter(id__in=subject_ids):
+        subfield = Subfield.objects.create(name=subject.name, subject=subject)
+        subfield.class_levels.set(subject.class_levels.all())
+        Chapter.objects.filter(subject=subject, subfield__isnull=True).update(subfield=subfield)
+        Theorem.objects.filter(subject=subject, subfield__isnull=True).update(subfield=subfield)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('things', '0010_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chapter',
+            name='subject',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='chapters', to='things.subject'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='comments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='exercise',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='comments', to='things.exercise'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='replies', to='things.comment'),
+        ),
+        migrations.AlterField(
+            model_name='exam',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='examples', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='exam',
+            name='subject',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='examples', to='things.subject'),
+        ),
+        migrations.AlterField(
+            model_name='exercise',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='exercises', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='exercise',
+            name='subject',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='exercises', to='things.subject'),
+        ),
+        migrations.AlterField(
+            model_name='lesson',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='lessons', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='lesson',
+            name='subject',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='lessons', to='things.subject'),
+        ),
+        migrations.AlterField(
+            model_name='report',
+            name='content_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='contenttypes.contenttype'),
+        ),
+        migrations.AlterField(
+            model_name='report',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='solution',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='solutions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='solution',
+            name='exercise',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, related_name='solution', to='things.exercise'),
+        ),
+        migrations.AlterField(
+            model_name='theorem',
+            name='subject',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='theorems', to='things.subject'),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='content_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='contenttypes.contenttype'),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='Subfield',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('class_levels', models.ManyToManyField(related_name='subfields', to='things.classlevel')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='subfields', to='things.subject')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='subfield',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='chapters', to='things.subfield'),
+        ),
+        migrations.AddField(
+            model_name='theorem',
+            name='subfield',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='theorems', to='things.subfield'),
+        ),
+        migrations.RunPython(assign_default_subfields, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='chapter',
+            name='subfield',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='chapters', to='things.subfield'),
+        ),
+        migrations.AlterField(
+            model_name='theorem',
+            name='subfield',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='theorems', to='things.subfield'),
+        ),
+    ]
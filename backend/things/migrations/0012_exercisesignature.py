@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-19 18:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('things', '0011_sync_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseSignature',
+            fields=[
+                ('exercise', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='things.exercise')),
+                ('minhash', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.1.6 on 2026-10-19 19:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# things.calibration.LABEL_PRIORS when this migration was written
+LABEL_PRIORS = {'easy': -1.0, 'medium': 0.0, 'hard': 1.0}
+
+
+def place_by_label(apps, schema_editor):
+    """
+    Existing exercises start at the difficulty their label implies.
+    """
+    Exercise = apps.get_model('things', 'Exercise')
+    for label, prior in LABEL_PRIORS.items():
+        Exercise.objects.filter(difficulty=label).update(calibrated_difficulty=prior)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('things', '0012_exercisesignature'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseCalibration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('completions', models.PositiveIntegerField(default=0)),
+                ('difficulty', models.FloatField()),
+                ('discrimination', models.FloatField(blank=True, null=True)),
+                ('upvote_rate', models.FloatField(default=0.0)),
+                ('views_per_attempt', models.FloatField(default=0.0)),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='calibrated_difficulty',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['calibrated_difficulty', 'id'], name='things_exer_calibra_bc0734_idx'),
+        ),
+        migrations.RunPython(place_by_label, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='exercisecalibration',
+            name='class_level',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='things.classlevel'),
+        ),
+        migrations.AddField(
+            model_name='exercisecalibration',
+            name='exercise',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calibrations', to='things.exercise'),
+        ),
+        migrations.AddIndex(
+            model_name='exercisecalibration',
+            index=models.Index(fields=['class_level', 'difficulty'], name='things_exer_class_l_76e2cd_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='exercisecalibration',
+            unique_together={('exercise', 'class_level')},
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
 
+from .utils import compute_content_artifacts
 
 
 #----------------------------CLASSLEVEL-------------------------------
@@ -51,7 +52,7 @@ class Chapter(models.Model):
         unique_together = ['subject', 'order']
 
     def __str__(self):
-        return f"{self.name}_{self.class_levels.name}"
+        return self.name
     
 
 
@@ -92,6 +93,8 @@ class Vote(models.Model):
         unique_together = ('user', 'content_type', 'object_id')
         indexes = [
             models.Index(fields=['content_type', 'object_id']),
+            # A user's upvoted exercises, newest first (saved content, history)
+            models.Index(fields=['user', 'content_type', 'value', '-created_at']),
         ]
 
 class VotableMixin(models.Model):
@@ -102,11 +105,22 @@ class VotableMixin(models.Model):
 
     @property
     def vote_count(self):
+        # Set for a whole page at once by things/preload.py
+        if 'vote_total' in self.__dict__:
+            return self.vote_total
         return self.votes.filter(value=Vote.UP).count() - self.votes.filter(value=Vote.DOWN).count()
+
+
+class ModeratableMixin(models.Model):
+    # Set by moderators from the report queue (things/moderation.py)
+    is_hidden = models.BooleanField(default=False)
+
+    class Meta:
+        abstract = True
     
 #----------------------------EXERCISE-------------------------------
 
-class Exercise(VotableMixin, models.Model):
+class Exercise(VotableMixin, ModeratableMixin, models.Model):
     DIFFICULTY_CHOICES = [
         ('easy', 'easy'),
         ('medium', 'medium'),
@@ -125,25 +139,115 @@ class Exercise(VotableMixin, models.Model):
     subject = models.ForeignKey(Subject, on_delete=models.PROTECT, related_name='exercises', null=True)
     theorems = models.ManyToManyField(Theorem, related_name='exercises' )
 
+    # Derived from `content` on write so list endpoints can defer the body
+    excerpt = models.TextField(blank=True, default='')
+    word_count = models.PositiveIntegerField(default=0)
+    formula_count = models.PositiveIntegerField(default=0)
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+
+    # Denormalized sort keys, kept by things/votes.py and things/signals.py
+    vote_score = models.IntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # Empirical difficulty over all class levels, on a logit scale around 0
+    # (average); set by things/calibration.py
+    calibrated_difficulty = models.FloatField(default=0.0)
+
+    revisions = GenericRelation('Revision')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['subject', 'difficulty', '-created_at']),
+            # One per whitelisted sort key (ExerciseViewSet.SORT_KEYS)
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['vote_score', 'id']),
+            models.Index(fields=['comment_count', 'id']),
+            models.Index(fields=['view_count', 'id']),
+            models.Index(fields=['calibrated_difficulty', 'id']),
+        ]
+
     def __str__(self):
         return self.title
+
+    def refresh_content_artifacts(self):
+        for field, value in compute_content_artifacts(self.content).items():
+            setattr(self, field, value)
     
 
+#----------------------------RELATED EXERCISES-------------------------------
+
+class RelatedExercise(models.Model):
+    """
+    Precomputed top-k neighbours of an exercise, see things/related.py.
+    """
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['exercise', 'rank']
+        unique_together = ('exercise', 'related')
+        indexes = [
+            models.Index(fields=['exercise', 'rank']),
+        ]
+
+
+#----------------------------CALIBRATION-------------------------------
+
+class ExerciseCalibration(models.Model):
+    """
+    Difficulty of an exercise measured on the learners of one class level,
+    see things/calibration.py.
+    """
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='calibrations')
+    class_level = models.ForeignKey(ClassLevel, on_delete=models.CASCADE, related_name='+')
+    attempts = models.PositiveIntegerField(default=0)
+    completions = models.PositiveIntegerField(default=0)
+    # Logit scale: 0 is an average exercise of the class level, +1 is
+    # noticeably harder than its solvers' record predicts
+    difficulty = models.FloatField()
+    # Correlation between completing this exercise and completing the others;
+    # null with too few learners
+    discrimination = models.FloatField(null=True, blank=True)
+    upvote_rate = models.FloatField(default=0.0)
+    views_per_attempt = models.FloatField(default=0.0)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('exercise', 'class_level')
+        indexes = [
+            models.Index(fields=['class_level', 'difficulty']),
+        ]
+
+
+#----------------------------DUPLICATES-------------------------------
+
+class ExerciseSignature(models.Model):
+    """
+    MinHash signature of an exercise body, see things/duplicates.py.
+    """
+    exercise = models.OneToOneField(Exercise, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    minhash = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+
 #----------------------------SOLUTION-------------------------------
 
-class Solution(VotableMixin, models.Model):
+class Solution(VotableMixin, ModeratableMixin, models.Model):
     exercise = models.OneToOneField(Exercise, on_delete=models.PROTECT, related_name='solution')
     content = models.TextField()
     author = models.ForeignKey(User, on_delete=models.PROTECT, related_name='solutions')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    revisions = GenericRelation('Revision')
+
     def __str__(self):
         return f"Solution for {self.exercise.title}"
 
 #----------------------------COMMENT-------------------------------
 
-class Comment(VotableMixin, models.Model):
+class Comment(VotableMixin, ModeratableMixin, models.Model):
     exercise = models.ForeignKey(Exercise, on_delete=models.PROTECT, related_name='comments')
     author = models.ForeignKey(User, on_delete=models.PROTECT, related_name='comments')
     content = models.TextField()
@@ -156,7 +260,7 @@ class Comment(VotableMixin, models.Model):
 
 #----------------------------LESSON-------------------------------
 
-class Lesson(VotableMixin, models.Model):
+class Lesson(VotableMixin, ModeratableMixin, models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
     subject = models.ForeignKey(Subject, on_delete=models.PROTECT, related_name='lessons')
@@ -201,4 +305,85 @@ class Report(models.Model):
         ]
 
     def __str__(self):
-        return f"Report by {self.user.username} on {self.content_object}"
\ No newline at end of file
+        return f"Report by {self.user.username} on {self.content_object}"
+
+
+class ReportSummary(models.Model):
+    """
+    One row per reported object, maintained on report insert so the
+    moderation queue never has to GROUP BY the whole Report table.
+    """
+    OPEN = 'open'
+    HIDDEN = 'hidden'
+    RESTORED = 'restored'
+
+    STATUS_CHOICES = [
+        (OPEN, 'Open'),
+        (HIDDEN, 'Hidden'),
+        (RESTORED, 'Restored'),
+    ]
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.PROTECT)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    report_count = models.PositiveIntegerField(default=0)
+    last_reported_at = models.DateTimeField()
+    reasons = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=OPEN)
+
+    class Meta:
+        unique_together = ('content_type', 'object_id')
+        indexes = [
+            models.Index(fields=['status', '-report_count', '-last_reported_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.report_count} reports on {self.content_type.model} {self.object_id}"
+
+
+#----------------------------REVISION-------------------------------
+
+class Revision(models.Model):
+    """
+    One stored edit of an exercise or solution body. `data` holds either a
+    compressed full snapshot or a compressed diff against the previous
+    revision, see things/revisions.py.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.PROTECT)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    number = models.PositiveIntegerField()
+    is_snapshot = models.BooleanField(default=False)
+    data = models.BinaryField()
+    length = models.PositiveIntegerField(default=0)
+    author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['content_type', 'object_id', '-number']
+        unique_together = ('content_type', 'object_id', 'number')
+
+    def __str__(self):
+        return f"Revision {self.number} of {self.content_type.model} {self.object_id}"
+
+
+#----------------------------IMAGE-------------------------------
+
+class UploadedImage(models.Model):
+    """
+    Content-addressed image: stored once per distinct SHA-256, however many
+    times it is uploaded. Paths are relative to MEDIA_ROOT, see things/images.py.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    path = models.CharField(max_length=255)
+    mime_type = models.CharField(max_length=50)
+    size = models.PositiveIntegerField()
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    # {width: path} of the resized copies generated so far
+    variants = models.JSONField(default=dict, blank=True)
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.path
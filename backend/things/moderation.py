@@ -0,0 +1,153 @@
+"""
+Report aggregation and bulk moderation.
+
+Every Report insert updates the ReportSummary of its target, which is what
+the moderation queue reads. Bulk actions work on summaries and run in
+chunked transactions so a large selection never holds locks for long.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from .fragments import exercises_of, invalidate_on_commit
+from .models import Exercise, Solution, Comment, Lesson, Report, ReportSummary
+from .outline import invalidate_outlines
+
+
+CHUNK_SIZE = 200
+REASON_KEY_LENGTH = 50
+
+
+#----------------------------AGGREGATION-------------------------------
+
+def reason_key(reason):
+    return ' '.join((reason or '').lower().split())[:REASON_KEY_LENGTH] or 'unspecified'
+
+
+def record_report(report):
+    """
+    Fold a newly inserted report into its object's summary. The summary row
+    is locked so concurrent reports on the same object do not lose counts.
+    """
+    with transaction.atomic():
+        summary, _ = ReportSummary.objects.select_for_update().get_or_create(
+            content_type_id=report.content_type_id,
+            object_id=report.object_id,
+            defaults={'last_reported_at': report.created_at},
+        )
+        key = reason_key(report.reason)
+        summary.reasons[key] = summary.reasons.get(key, 0) + 1
+        summary.report_count += 1
+        summary.last_reported_at = max(summary.last_reported_at, report.created_at)
+        # New reports on restored content put it back in the queue
+        if summary.status == ReportSummary.RESTORED:
+            summary.status = ReportSummary.OPEN
+        summary.save()
+    return summary
+
+
+#----------------------------BULK ACTIONS-------------------------------
+
+def _chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _group_by_model(summaries):
+    """
+    Return {model: [object ids]} for the moderatable models among summaries.
+    """
+    groups = {}
+    for summary in summaries:
+        model = summary.content_type.model_class()
+        if model is not None and hasattr(model, 'is_hidden'):
+            groups.setdefault(model, []).append(summary.object_id)
+    return groups
+
+
+def _set_hidden(summary_ids, hidden, status):
+    processed = 0
+    for chunk in _chunks(summary_ids):
+        with transaction.atomic():
+            summaries = list(
+                ReportSummary.objects.select_for_update().filter(id__in=chunk).select_related('content_type')
+            )
+            for model, object_ids in _group_by_model(summaries).items():
+                model.objects.filter(id__in=object_ids).update(is_hidden=hidden)
+                # update() sends no signals: drop the cached detail of the exercises involved
+                invalidate_on_commit(exercises_of(model, object_ids))
+                if model in (Exercise, Lesson):
+                    # Outline counts leave hidden content out
+                    transaction.on_commit(invalidate_outlines)
+            ReportSummary.objects.filter(id__in=[summary.id for summary in summaries]).update(status=status)
+            processed += len(summaries)
+    return processed
+
+
+def bulk_hide(summary_ids):
+    return _set_hidden(summary_ids, True, ReportSummary.HIDDEN)
+
+
+def bulk_restore(summary_ids):
+    return _set_hidden(summary_ids, False, ReportSummary.RESTORED)
+
+
+def _delete_reports(model, object_ids):
+    content_type = ContentType.objects.get_for_model(model)
+    Report.objects.filter(content_type=content_type, object_id__in=object_ids).delete()
+    ReportSummary.objects.filter(content_type=content_type, object_id__in=object_ids).delete()
+
+
+def _delete_comments(comment_ids):
+    # Replies PROTECT their parent: detach them first, then delete in one go.
+    # Votes go with the comments through their GenericRelation.
+    Comment.objects.filter(parent_id__in=comment_ids).exclude(id__in=comment_ids).update(parent=None)
+    Comment.objects.filter(id__in=comment_ids).update(parent=None)
+    _delete_reports(Comment, comment_ids)
+    Comment.objects.filter(id__in=comment_ids).delete()
+
+
+def _delete_solutions(solution_ids):
+    _delete_reports(Solution, solution_ids)
+    Solution.objects.filter(id__in=solution_ids).delete()
+
+
+def _delete_exercises(exercise_ids):
+    _delete_comments(list(Comment.objects.filter(exercise_id__in=exercise_ids).values_list('id', flat=True)))
+    _delete_solutions(list(Solution.objects.filter(exercise_id__in=exercise_ids).values_list('id', flat=True)))
+    _delete_reports(Exercise, exercise_ids)
+    # Votes, history, related index and M2M links cascade
+    Exercise.objects.filter(id__in=exercise_ids).delete()
+
+
+DELETERS = {
+    Exercise: _delete_exercises,
+    Solution: _delete_solutions,
+    Comment: _delete_comments,
+}
+
+
+def bulk_delete(summary_ids):
+    """
+    Delete the reported objects together with everything that PROTECTs
+    them (solutions, comment threads, votes), one chunk per transaction.
+    Summaries of models without a deleter are left untouched.
+    """
+    processed = 0
+    for chunk in _chunks(summary_ids):
+        with transaction.atomic():
+            summaries = list(ReportSummary.objects.filter(id__in=chunk).select_related('content_type'))
+            for model, object_ids in _group_by_model(summaries).items():
+                deleter = DELETERS.get(model)
+                if deleter is not None:
+                    deleter(object_ids)
+                    processed += len(object_ids)
+    return processed
+
+
+BULK_ACTIONS = {
+    'hide': bulk_hide,
+    'restore': bulk_restore,
+    'delete': bulk_delete,
+}
@@ -0,0 +1,146 @@
+"""
+Subject -> Subfield -> Chapter outline of a class level, with content counts.
+
+Counts are computed per chapter with one grouped query per relation
+(exercises, theorems, lessons) and summed up the tree, so content filed
+under several chapters is counted once in each of them. Lessons have no
+chapter of their own: they are counted in the chapters of their theorems.
+Hidden exercises and lessons are not counted.
+The whole outline is cached and invalidated by things/signals.py whenever
+content or taxonomy changes.
+"""
+
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from config import metrics
+
+from .models import Chapter, Exercise, Theorem
+
+
+CACHE_TIMEOUT = 60 * 60
+VERSION_KEY = 'outline:version'
+
+DIFFICULTIES = [choice for choice, _ in Exercise.DIFFICULTY_CHOICES]
+
+
+#----------------------------CACHE-------------------------------
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def invalidate_outlines():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 1, None)
+
+
+def get_outline(class_level):
+    key = f'outline:{_version()}:{class_level.id}'
+    outline = cache.get(key)
+    metrics.inc('cache_requests_total', cache='outline', result='miss' if outline is None else 'hit')
+    if outline is None:
+        outline = build_outline(class_level)
+        cache.set(key, outline, CACHE_TIMEOUT)
+    return outline
+
+
+#----------------------------COUNTS-------------------------------
+
+def _empty_counts():
+    return {
+        'exercises': 0,
+        'lessons': 0,
+        'theorems': 0,
+        'difficulty': {difficulty: 0 for difficulty in DIFFICULTIES},
+    }
+
+
+def _add_counts(total, counts):
+    for key in ('exercises', 'lessons', 'theorems'):
+        total[key] += counts[key]
+    for difficulty, count in counts['difficulty'].items():
+        total['difficulty'][difficulty] = total['difficulty'].get(difficulty, 0) + count
+
+
+def _chapter_counts(chapter_ids, class_level):
+    counts = defaultdict(_empty_counts)
+
+    exercises = Exercise.chapters.through.objects.filter(
+        chapter_id__in=chapter_ids,
+        exercise__class_levels=class_level,
+        exercise__is_hidden=False,
+    ).values('chapter_id', 'exercise__difficulty').annotate(total=Count('exercise_id', distinct=True))
+    for row in exercises:
+        chapter = counts[row['chapter_id']]
+        chapter['exercises'] += row['total']
+        chapter['difficulty'][row['exercise__difficulty']] = row['total']
+
+    theorems = Theorem.chapters.through.objects.filter(
+        chapter_id__in=chapter_ids,
+        theorem__class_levels=class_level,
+    ).values('chapter_id').annotate(total=Count('theorem_id', distinct=True))
+    for row in theorems:
+        counts[row['chapter_id']]['theorems'] = row['total']
+
+    lessons = Theorem.chapters.through.objects.filter(
+        chapter_id__in=chapter_ids,
+        theorem__lessons__class_levels=class_level,
+        theorem__lessons__is_hidden=False,
+    ).values('chapter_id').annotate(total=Count('theorem__lessons', distinct=True))
+    for row in lessons:
+        counts[row['chapter_id']]['lessons'] = row['total']
+
+    return counts
+
+
+#----------------------------TREE-------------------------------
+
+def build_outline(class_level):
+    chapters = list(
+        Chapter.objects.filter(class_levels=class_level)
+        .select_related('subject', 'subfield')
+        .order_by('subject__name', 'subfield__name', 'order')
+    )
+    counts = _chapter_counts([chapter.id for chapter in chapters], class_level)
+
+    subjects = {}
+    for chapter in chapters:
+        subject = subjects.setdefault(chapter.subject_id, {
+            'id': chapter.subject_id,
+            'name': chapter.subject.name,
+            'counts': _empty_counts(),
+            'subfields': {},
+        })
+        subfield = subject['subfields'].setdefault(chapter.subfield_id, {
+            'id': chapter.subfield_id,
+            'name': chapter.subfield.name,
+            'counts': _empty_counts(),
+            'chapters': [],
+        })
+
+        chapter_counts = counts[chapter.id]
+        subfield['chapters'].append({
+            'id': chapter.id,
+            'name': chapter.name,
+            'order': chapter.order,
+            'counts': chapter_counts,
+        })
+        _add_counts(subfield['counts'], chapter_counts)
+        _add_counts(subject['counts'], chapter_counts)
+
+    for subject in subjects.values():
+        subject['subfields'] = list(subject['subfields'].values())
+
+    return {
+        'class_level': {'id': class_level.id, 'name': class_level.name, 'order': class_level.order},
+        'subjects': list(subjects.values()),
+    }
@@ -0,0 +1,216 @@
+"""
+Batch loading for serialized pages.
+
+The exercise, solution and comment serializers read a few things per object
+that are not columns: vote totals, the viewer's vote, the visible replies of
+a comment and the statistics on its author's profile. Read one object at a
+time they cost a query or two each, so a page of n exercises with their
+comment threads cost O(n) queries. The functions here load them for a whole
+page with a fixed number of queries and set them on the instances, where
+the models and serializers pick them up. Objects serialized without a
+preload (a comment that was just created) still query for themselves.
+"""
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count, Exists, OuterRef, Prefetch, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Chapter, Exercise, Solution, Comment, Vote
+
+
+#----------------------------QUERYSETS-------------------------------
+
+def visible_comments():
+    return Comment.objects.filter(is_hidden=False).select_related('author__profile').order_by('id')
+
+
+def _taxonomy():
+    return [
+        Prefetch('chapters', queryset=Chapter.objects.select_related('subject').prefetch_related(
+            'class_levels', 'subject__class_levels'
+        )),
+        'class_levels',
+        'subject__class_levels',
+    ]
+
+
+def has_visible_solution():
+    return Exists(Solution.objects.filter(exercise=OuterRef('pk'), is_hidden=False))
+
+
+def with_card(queryset):
+    """
+    `queryset` of exercises with what ExerciseListSerializer walks: the
+    author profile and the taxonomy, plus a `has_solution` flag instead of
+    the solution and comment thread.
+    """
+    return queryset.select_related('author__profile', 'subject').prefetch_related(
+        *_taxonomy()
+    ).annotate(has_solution=has_visible_solution())
+
+
+def with_nested(queryset):
+    """
+    `queryset` of exercises with the joins and prefetches ExerciseSerializer
+    walks: author and solution author profiles, chapters with their subject,
+    taxonomy levels and the visible comments.
+    """
+    return queryset.select_related(
+        'author__profile', 'solution__author__profile', 'subject'
+    ).prefetch_related(
+        *_taxonomy(),
+        Prefetch('comments', queryset=visible_comments()),
+    )
+
+
+#----------------------------VOTES-------------------------------
+
+def attach_votes(objects, user):
+    """
+    Set `vote_total` and, for an authenticated `user`, `viewer_vote` on
+    exercises, solutions and comments, with one query.
+    """
+    objects = [obj for obj in objects if obj is not None]
+    if not objects:
+        return
+    content_types = ContentType.objects.get_for_models(*{type(obj) for obj in objects})
+    targets = Q()
+    for model, content_type in content_types.items():
+        targets |= Q(content_type=content_type, object_id__in=[obj.pk for obj in objects if type(obj) is model])
+
+    aggregates = {'total': Sum('value')}
+    if user.is_authenticated:
+        aggregates['viewer'] = Sum('value', filter=Q(user=user))
+    rows = Vote.objects.filter(targets).order_by().values('content_type_id', 'object_id').annotate(**aggregates)
+    found = {(row['content_type_id'], row['object_id']): row for row in rows}
+
+    for obj in objects:
+        row = found.get((content_types[type(obj)].id, obj.pk), {})
+        obj.vote_total = row.get('total') or 0
+        if user.is_authenticated:
+            obj.viewer_vote = row.get('viewer')
+
+
+#----------------------------REPLIES-------------------------------
+
+def link_replies(comments):
+    """
+    Set `visible_replies` on each comment from the others, for a list that
+    holds every visible comment of its exercises. No query.
+    """
+    replies = {}
+    for comment in comments:
+        replies.setdefault(comment.parent_id, []).append(comment)
+    for comment in comments:
+        comment.visible_replies = replies.get(comment.id, [])
+
+
+def load_replies(comments):
+    """
+    Set `visible_replies` on each comment and on all their visible
+    descendants, fetched one level per query. Returns the descendants.
+    """
+    descendants = []
+    level = list(comments)
+    for comment in level:
+        comment.visible_replies = []
+    while level:
+        parents = {comment.id: comment for comment in level}
+        level = list(visible_comments().filter(parent_id__in=parents))
+        for reply in level:
+            reply.visible_replies = []
+            parents[reply.parent_id].visible_replies.append(reply)
+        descendants.extend(level)
+    return descendants
+
+
+#----------------------------AUTHORS-------------------------------
+
+def _count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def attach_author_stats(users):
+    """
+    Set `stats` on the (already loaded) profiles of `users` with one query;
+    read by the UserProfile properties behind UserProfileSerializer.
+    """
+    # A page holds several instances of the same author
+    profiles = {}
+    for user in users:
+        if user is None:
+            continue
+        try:
+            profiles.setdefault(user.id, []).append(user.profile)
+        except ObjectDoesNotExist:
+            continue
+    if not profiles:
+        return
+
+    rows = User.objects.filter(id__in=profiles).annotate(
+        total_contributions=_count(Exercise.objects.all(), 'author'),
+        total_comments=_count(Comment.objects.all(), 'author'),
+        total_upvotes_received=Coalesce(Subquery(
+            Exercise.objects.filter(author=OuterRef('pk'), votes__value=Vote.UP).order_by().values(
+                'author'
+            ).annotate(total=Count('votes')).values('total')
+        ), 0),
+    ).values_list('id', 'total_contributions', 'total_comments', 'total_upvotes_received')
+    for user_id, contributions, comments, upvotes in rows:
+        for profile in profiles[user_id]:
+            profile.stats = {
+                'total_contributions': contributions,
+                'total_comments': comments,
+                'total_upvotes_received': upvotes,
+            }
+
+
+#----------------------------PAGES-------------------------------
+
+def preload_exercises(exercises, user, nested=True):
+    """
+    Preload a page of exercises from `with_nested()` for ExerciseSerializer;
+    with `nested=False` (compound documents) only the exercises' own votes.
+    """
+    exercises = list(exercises)
+    if not nested:
+        attach_votes(exercises, user)
+        return
+
+    solutions, comments = [], []
+    for exercise in exercises:
+        solution = getattr(exercise, 'solution', None)
+        if solution is not None:
+            solutions.append(solution)
+        thread = list(exercise.comments.all())
+        link_replies(thread)
+        comments.extend(thread)
+
+    attach_votes(exercises + solutions + comments, user)
+    attach_author_stats(obj.author for obj in exercises + solutions + comments)
+
+
+def preload_cards(exercises, user):
+    """
+    Preload a page of exercises from `with_card()` for ExerciseListSerializer.
+    """
+    exercises = list(exercises)
+    attach_votes(exercises, user)
+    attach_author_stats(exercise.author for exercise in exercises)
+
+
+def preload_solutions(solutions, user):
+    solutions = list(solutions)
+    attach_votes(solutions, user)
+    attach_author_stats(solution.author for solution in solutions)
+
+
+def preload_comments(comments, user):
+    comments = list(comments)
+    comments += load_replies(comments)
+    attach_votes(comments, user)
+    attach_author_stats(comment.author for comment in comments)
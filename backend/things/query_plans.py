@@ -0,0 +1,149 @@
+"""
+Query plan audit.
+
+`canonical_queries()` builds the queries the API endpoints run, through the
+views' own get_queryset() where there is one. `find_sequential_scans()`
+runs EXPLAIN on each and reports full scans of tables with at least
+`min_rows` rows: small tables are legitimately scanned, large ones mean an
+index is missing or a filter cannot use it. Used by `manage.py
+check_query_plans`.
+"""
+
+import re
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from users.models import NotificationEvent, Recommendation, ViewHistory
+from .models import Exercise, Comment, Vote, RelatedExercise, ReportSummary, Revision
+
+
+MIN_ROWS = 10000
+PAGE_SIZE = 30
+
+# PostgreSQL: "Seq Scan on things_exercise u0"; SQLite: "SCAN things_exercise"
+# (without USING INDEX, which is a full index scan in index order)
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on "?(\w+)"?'),
+    'sqlite': re.compile(r'\bSCAN "?(\w+)\b"?(?! USING (?:COVERING )?INDEX)'),
+}
+# Django aliases tables in subqueries: FROM "things_vote" U0
+ALIAS_RE = re.compile(r'"(\w+)" ([A-Z]\d+)\b')
+
+
+#----------------------------CANONICAL QUERIES-------------------------------
+
+def _viewset_queryset(viewset_class, action, params=None):
+    request = APIRequestFactory().get('/', params or {})
+    view = viewset_class(action=action, request=Request(request), format_kwarg=None, kwargs={})
+    return view.get_queryset()
+
+
+def canonical_queries():
+    """
+    Yield (name, queryset) for the queries behind each endpoint. Ids are
+    those of existing rows when there are any; EXPLAIN does not need them
+    to exist.
+    """
+    # Imported here: views import this app's whole API surface
+    from .views import ExerciseViewSet
+
+    exercise_id = Exercise.objects.values_list('id', flat=True).first() or 1
+    user = User.objects.order_by('id').first() or User(id=1)
+    exercise_type = ContentType.objects.get_for_model(Exercise)
+    sample = Exercise.objects.filter(id=exercise_id).values('subject_id', 'difficulty').first() or {}
+    subject_id = sample.get('subject_id') or 1
+    chapter_id = Exercise.chapters.through.objects.values_list('chapter_id', flat=True).first() or 1
+    class_level_id = Exercise.class_levels.through.objects.values_list('classlevel_id', flat=True).first() or 1
+
+    def exercises(**params):
+        return _viewset_queryset(ExerciseViewSet, 'list', params)[:PAGE_SIZE]
+
+    for sort in ExerciseViewSet.SORT_KEYS:
+        yield f'exercise list, sort={sort}', exercises(sort=sort)
+    yield 'exercise list by subject and difficulty', exercises(**{
+        'subjects[]': subject_id, 'difficulties[]': sample.get('difficulty', 'easy'),
+    })
+    yield 'exercise list by class level', exercises(**{'class_levels[]': class_level_id})
+    yield 'exercise list by chapter', exercises(**{'chapters[]': chapter_id})
+    yield 'exercise list by class level and calibrated difficulty', exercises(**{
+        'class_levels[]': class_level_id, 'calibrated_min': -1, 'calibrated_max': 1,
+    })
+    yield 'exercise detail', _viewset_queryset(ExerciseViewSet, 'retrieve').filter(pk=exercise_id)
+    yield 'exercise comments', Comment.objects.filter(exercise_id=exercise_id, is_hidden=False)
+    yield 'exercise votes of a user', Vote.objects.filter(
+        user=user, content_type=exercise_type, object_id=exercise_id
+    )
+    yield 'related exercises', RelatedExercise.objects.filter(exercise_id=exercise_id)
+    yield 'exercise revisions', Revision.objects.filter(
+        content_type=exercise_type, object_id=exercise_id
+    ).order_by('-number')[:20]
+
+    upvoted = Exercise.objects.filter(
+        votes__user=user, votes__value=Vote.UP, votes__content_type=exercise_type
+    ).order_by('-votes__created_at')
+    yield 'saved content', upvoted
+    yield 'history, upvoted', upvoted[:5]
+    yield 'history, recently viewed', Exercise.objects.filter(
+        viewhistory__user=user
+    ).order_by('-viewhistory__viewed_at')[:5]
+    yield 'view history of a user', ViewHistory.objects.filter(user=user)[:PAGE_SIZE]
+    yield 'feed', Recommendation.objects.filter(user=user).order_by('rank')[:20]
+    yield 'pending notifications', NotificationEvent.objects.filter(
+        processed_at__isnull=True, created_at__lte=timezone.now() - timedelta(minutes=5)
+    ).order_by('created_at')[:500]
+    yield 'moderation queue', ReportSummary.objects.filter(status=ReportSummary.OPEN).order_by(
+        '-report_count', '-last_reported_at'
+    )[:PAGE_SIZE]
+
+
+#----------------------------PLANS-------------------------------
+
+def table_sizes():
+    """
+    Return {table: row count}, estimated from the statistics on PostgreSQL.
+    """
+    tables = connection.introspection.table_names()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT relname, reltuples::bigint FROM pg_class WHERE relkind = 'r' AND relname = ANY(%s)",
+                [tables],
+            )
+            return dict(cursor.fetchall())
+        sizes = {}
+        for table in tables:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+            sizes[table] = cursor.fetchone()[0]
+        return sizes
+
+
+def sequential_scans(queryset):
+    """
+    Return (plan, [tables scanned sequentially]) for a queryset.
+    """
+    pattern = SEQ_SCAN_PATTERNS.get(connection.vendor)
+    if pattern is None:
+        raise NotImplementedError(f'Query plans are not parsed for {connection.vendor}')
+    sql = str(queryset.query)
+    aliases = {alias: table for table, alias in ALIAS_RE.findall(sql)}
+    plan = queryset.explain()
+    tables = [aliases.get(name, name) for name in pattern.findall(plan)]
+    return plan, list(dict.fromkeys(tables))
+
+
+def find_sequential_scans(min_rows=MIN_ROWS):
+    """
+    Yield (name, plan, [(table, rows)]) for every canonical query, listing
+    the tables of at least `min_rows` rows it scans sequentially.
+    """
+    sizes = table_sizes()
+    for name, queryset in canonical_queries():
+        plan, tables = sequential_scans(queryset)
+        offenders = [(table, sizes.get(table, 0)) for table in tables if sizes.get(table, 0) >= min_rows]
+        yield name, plan, offenders
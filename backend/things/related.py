@@ -0,0 +1,240 @@
+"""
+Related-exercises index.
+
+Two exercises are related when they share theorems, chapters or lessons
+(reached through their theorems). Each shared feature contributes its weight
+scaled by an inverse document frequency, so a chapter holding half the corpus
+counts for less than a rarely used theorem; candidates also get a bonus for
+being at a similar difficulty. The top-k neighbours of every exercise are
+stored in RelatedExercise and served as a single indexed read.
+"""
+
+import math
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+
+from .models import Exercise, Lesson, RelatedExercise
+
+
+TOP_K = 10
+
+FEATURE_WEIGHTS = {
+    'theorem': 3.0,
+    'chapter': 1.0,
+    'lesson': 0.5,
+}
+DIFFICULTY_WEIGHT = 0.5
+DIFFICULTY_LEVELS = {'easy': 0, 'medium': 1, 'hard': 2}
+
+
+#----------------------------SCORING-------------------------------
+
+def feature_weight(kind, document_frequency, total):
+    return FEATURE_WEIGHTS[kind] * math.log(1 + total / document_frequency)
+
+
+def top_related(exercise_id, features, postings, weights, difficulties, top_k=TOP_K):
+    """
+    Score every exercise sharing at least one feature with `exercise_id`.
+
+    `postings[feature]` is an array of exercise ids carrying that feature and
+    `difficulties` an array indexed by exercise id. Returns up to `top_k`
+    (related_id, score) pairs, best first.
+    """
+    features = [feature for feature in features if feature in postings]
+    if not features:
+        return []
+
+    ids = np.concatenate([postings[feature] for feature in features])
+    contributions = np.concatenate([
+        np.full(len(postings[feature]), weights[feature]) for feature in features
+    ])
+
+    candidates, inverse = np.unique(ids, return_inverse=True)
+    scores = np.bincount(inverse, weights=contributions)
+
+    own_difficulty = difficulties[exercise_id]
+    scores += DIFFICULTY_WEIGHT * (1 - np.abs(difficulties[candidates] - own_difficulty) / 2)
+
+    # Summation order differs between batch and incremental runs; round so
+    # both produce the same ranking for tied candidates
+    scores = np.round(scores, 6)
+
+    keep = candidates != exercise_id
+    candidates, scores = candidates[keep], scores[keep]
+
+    if len(candidates) > top_k:
+        best = np.argpartition(-scores, top_k)[:top_k]
+        candidates, scores = candidates[best], scores[best]
+
+    order = np.lexsort((candidates, -scores))
+    return list(zip(candidates[order].tolist(), scores[order].tolist()))
+
+
+#----------------------------LOADING-------------------------------
+
+def _link_features(exercise_ids=None, theorem_ids=None, chapter_ids=None, lesson_ids=None):
+    """
+    Return (exercise_id, feature) pairs read from the through tables,
+    optionally restricted to some exercises or some features.
+    """
+    # Hidden exercises are neither indexed nor offered as neighbours
+    theorem_links = Exercise.theorems.through.objects.filter(exercise__is_hidden=False)
+    chapter_links = Exercise.chapters.through.objects.filter(exercise__is_hidden=False)
+    lesson_links = Lesson.theorems.through.objects.all()
+
+    if exercise_ids is not None:
+        theorem_links = theorem_links.filter(exercise_id__in=exercise_ids)
+        chapter_links = chapter_links.filter(exercise_id__in=exercise_ids)
+        lesson_links = lesson_links.filter(theorem_id__in=theorem_links.values('theorem_id'))
+    if theorem_ids is not None or chapter_ids is not None or lesson_ids is not None:
+        theorem_links = theorem_links.filter(theorem_id__in=theorem_ids or [])
+        chapter_links = chapter_links.filter(chapter_id__in=chapter_ids or [])
+        lesson_links = lesson_links.filter(lesson_id__in=lesson_ids or [])
+
+    lessons_by_theorem = defaultdict(list)
+    for lesson_id, theorem_id in lesson_links.values_list('lesson_id', 'theorem_id').iterator():
+        lessons_by_theorem[theorem_id].append(lesson_id)
+
+    pairs = set()
+    for exercise_id, theorem_id in theorem_links.values_list('exercise_id', 'theorem_id').iterator():
+        pairs.add((exercise_id, ('theorem', theorem_id)))
+        for lesson_id in lessons_by_theorem.get(theorem_id, ()):
+            pairs.add((exercise_id, ('lesson', lesson_id)))
+    for exercise_id, chapter_id in chapter_links.values_list('exercise_id', 'chapter_id').iterator():
+        pairs.add((exercise_id, ('chapter', chapter_id)))
+
+    # Lessons are reached through theorems: when filtering by lesson, pull in
+    # the exercises of every theorem those lessons cover.
+    if lesson_ids:
+        lesson_theorems = Lesson.theorems.through.objects.filter(lesson_id__in=lesson_ids)
+        theorem_lessons = defaultdict(list)
+        for lesson_id, theorem_id in lesson_theorems.values_list('lesson_id', 'theorem_id'):
+            theorem_lessons[theorem_id].append(lesson_id)
+        links = Exercise.theorems.through.objects.filter(
+            theorem_id__in=list(theorem_lessons), exercise__is_hidden=False
+        )
+        for exercise_id, theorem_id in links.values_list('exercise_id', 'theorem_id').iterator():
+            for lesson_id in theorem_lessons[theorem_id]:
+                pairs.add((exercise_id, ('lesson', lesson_id)))
+
+    return pairs
+
+
+def _build_postings(pairs, total):
+    members = defaultdict(list)
+    for exercise_id, feature in pairs:
+        members[feature].append(exercise_id)
+
+    postings = {feature: np.array(ids, dtype=np.int64) for feature, ids in members.items()}
+    weights = {
+        feature: feature_weight(feature[0], len(ids), total) for feature, ids in postings.items()
+    }
+    return postings, weights
+
+
+def _difficulty_array(rows):
+    size = max((exercise_id for exercise_id, _ in rows), default=0) + 1
+    difficulties = np.full(size, DIFFICULTY_LEVELS['medium'], dtype=np.float64)
+    for exercise_id, difficulty in rows:
+        difficulties[exercise_id] = DIFFICULTY_LEVELS.get(difficulty, DIFFICULTY_LEVELS['medium'])
+    return difficulties
+
+
+def _to_rows(exercise_id, neighbours):
+    return [
+        RelatedExercise(exercise_id=exercise_id, related_id=related_id, score=score, rank=rank)
+        for rank, (related_id, score) in enumerate(neighbours)
+    ]
+
+
+#----------------------------BATCH-------------------------------
+
+def build_related_index(top_k=TOP_K, batch_size=1000):
+    """
+    Rebuild the whole RelatedExercise table. Returns the number of rows written.
+    """
+    exercises = list(Exercise.objects.filter(is_hidden=False).values_list('id', 'difficulty').iterator())
+    difficulties = _difficulty_array(exercises)
+    total = len(exercises)
+
+    pairs = _link_features()
+    postings, weights = _build_postings(pairs, total)
+
+    features_by_exercise = defaultdict(list)
+    for exercise_id, feature in pairs:
+        features_by_exercise[exercise_id].append(feature)
+
+    rows = []
+    for exercise_id, features in features_by_exercise.items():
+        rows.extend(_to_rows(
+            exercise_id,
+            top_related(exercise_id, features, postings, weights, difficulties, top_k)
+        ))
+
+    with transaction.atomic():
+        RelatedExercise.objects.all().delete()
+        RelatedExercise.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+#----------------------------INCREMENTAL-------------------------------
+
+def refresh_related(exercise_id, top_k=TOP_K):
+    """
+    Recompute the neighbours of a single exercise after its relations changed.
+    Only the postings of that exercise's own features are read.
+    """
+    return refresh_related_many([exercise_id], top_k)
+
+
+def _feature_ids(pairs):
+    ids_by_kind = defaultdict(set)
+    for _, (kind, feature_id) in pairs:
+        ids_by_kind[kind].add(feature_id)
+    return {
+        'theorem_ids': list(ids_by_kind['theorem']),
+        'chapter_ids': list(ids_by_kind['chapter']),
+        'lesson_ids': list(ids_by_kind['lesson']),
+    }
+
+
+def refresh_related_many(exercise_ids, top_k=TOP_K):
+    """
+    Same as refresh_related for several exercises (e.g. a batch upload).
+
+    The exercises currently listing a changed one are rescored with it, so
+    it leaves the lists it no longer belongs in. Exercises that would now
+    rank it without listing it yet pick it up at the next
+    `manage.py build_related_exercises` run: finding them means rescoring
+    every exercise sharing a feature with it, a whole chapter or more.
+    """
+    exercise_ids = set(exercise_ids)
+    holders = set(RelatedExercise.objects.filter(related_id__in=exercise_ids).values_list('exercise_id', flat=True))
+    affected = exercise_ids | holders
+
+    own = _link_features(exercise_ids=affected)
+    features_by_exercise = defaultdict(list)
+    for owner_id, feature in own:
+        features_by_exercise[owner_id].append(feature)
+
+    pairs = _link_features(**_feature_ids(own))
+    postings, weights = _build_postings(pairs, Exercise.objects.filter(is_hidden=False).count())
+
+    candidate_ids = {candidate_id for candidate_id, _ in pairs} | affected
+    difficulties = _difficulty_array(
+        list(Exercise.objects.filter(id__in=candidate_ids).values_list('id', 'difficulty'))
+    )
+
+    rows = []
+    for exercise_id in affected:
+        rows.extend(_to_rows(
+            exercise_id,
+            top_related(exercise_id, features_by_exercise[exercise_id], postings, weights, difficulties, top_k)
+        ))
+    with transaction.atomic():
+        RelatedExercise.objects.filter(exercise_id__in=affected).delete()
+        RelatedExercise.objects.bulk_create(rows)
+    return len(rows)
@@ -0,0 +1,231 @@
+"""
+Revision history of exercise and solution bodies.
+
+Revisions are numbered per object. A revision is stored either as a full
+zlib-compressed snapshot or as a compressed diff against the previous
+revision: a list of token ranges copied from it and literal inserted text.
+A new snapshot is written once the chain since the last one reaches
+SNAPSHOT_INTERVAL rows, or whenever the diff would not be smaller, so
+reading any revision replays at most SNAPSHOT_INTERVAL - 1 diffs fetched
+with a single query. Compaction thins out old revisions and re-encodes the
+survivors.
+"""
+
+import json
+import re
+import zlib
+from difflib import SequenceMatcher
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, Subquery
+
+from .models import Revision
+
+
+SNAPSHOT_INTERVAL = 10
+KEEP_RECENT = 50
+
+# Words with their trailing whitespace; joining the tokens gives back the text
+TOKEN_RE = re.compile(r'\S+\s*|\s+')
+
+
+#----------------------------ENCODING-------------------------------
+
+def tokenize(text):
+    return TOKEN_RE.findall(text)
+
+
+def encode_snapshot(text):
+    return zlib.compress(text.encode('utf-8'))
+
+
+def encode_delta(previous, text):
+    old, new = tokenize(previous), tokenize(text)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(new[j1:j2]))
+    return zlib.compress(json.dumps(ops, separators=(',', ':')).encode('utf-8'))
+
+
+def apply_delta(previous, data):
+    old = tokenize(previous)
+    parts = []
+    for op in json.loads(zlib.decompress(data)):
+        if isinstance(op, list):
+            parts.extend(old[op[0]:op[1]])
+        else:
+            parts.append(op)
+    return ''.join(parts)
+
+
+def encode(previous, text, chain_length):
+    """
+    Return (is_snapshot, data) for `text` following `previous` (None when
+    there is no earlier revision) at the end of a chain of `chain_length` rows.
+    """
+    snapshot = encode_snapshot(text)
+    if previous is None or chain_length >= SNAPSHOT_INTERVAL:
+        return True, snapshot
+    delta = encode_delta(previous, text)
+    if len(delta) >= len(snapshot):
+        return True, snapshot
+    return False, delta
+
+
+def _replay(chain):
+    text = None
+    for revision in chain:
+        if revision.is_snapshot:
+            text = zlib.decompress(revision.data).decode('utf-8')
+        else:
+            text = apply_delta(text, revision.data)
+    return text
+
+
+#----------------------------READING-------------------------------
+
+def revisions_of(obj):
+    return Revision.objects.filter(content_type=ContentType.objects.get_for_model(obj), object_id=obj.pk)
+
+
+def _chain(revisions, number=None):
+    """
+    Rows from the nearest snapshot up to revision `number` (the latest when
+    None), oldest first.
+    """
+    if number is not None:
+        revisions = revisions.filter(number__lte=number)
+    last_snapshot = revisions.filter(is_snapshot=True).order_by('-number').values('number')[:1]
+    return list(revisions.filter(number__gte=Subquery(last_snapshot)).order_by('number'))
+
+
+def get_revision(obj, number):
+    """
+    Return (revision, content) for revision `number` of `obj`, or None.
+    """
+    chain = _chain(revisions_of(obj), number)
+    if not chain or chain[-1].number != number:
+        return None
+    return chain[-1], _replay(chain)
+
+
+#----------------------------WRITING-------------------------------
+
+def record_revision(obj, author=None, previous=None):
+    """
+    Store `obj.content` as a new revision unless it matches the latest one.
+
+    `previous` is the body before the edit being recorded: objects created
+    before revisions were kept get it stored first, as their revision 1.
+    """
+    with transaction.atomic():
+        # Serialize concurrent edits of the same object
+        list(type(obj).objects.select_for_update().filter(pk=obj.pk).values_list('pk'))
+
+        content_type = ContentType.objects.get_for_model(obj)
+        chain = _chain(revisions_of(obj))
+        latest = _replay(chain)
+        number = chain[-1].number if chain else 0
+        chain_length = len(chain)
+
+        if not chain and previous is not None and previous != obj.content:
+            number += 1
+            Revision.objects.create(
+                content_type=content_type, object_id=obj.pk, number=number,
+                is_snapshot=True, data=encode_snapshot(previous), length=len(previous),
+                author=getattr(obj, 'author', None),
+            )
+            latest, chain_length = previous, 1
+
+        if latest == obj.content:
+            return None
+
+        is_snapshot, data = encode(latest, obj.content, chain_length)
+        return Revision.objects.create(
+            content_type=content_type, object_id=obj.pk, number=number + 1,
+            is_snapshot=is_snapshot, data=data, length=len(obj.content), author=author,
+        )
+
+
+def record_initial_revisions(objs, author=None):
+    """
+    Store revision 1 of freshly bulk-created objects of one model.
+    """
+    if not objs:
+        return
+    content_type = ContentType.objects.get_for_model(objs[0])
+    Revision.objects.bulk_create([
+        Revision(
+            content_type=content_type, object_id=obj.pk, number=1, is_snapshot=True,
+            data=encode_snapshot(obj.content), length=len(obj.content), author=author,
+        )
+        for obj in objs
+    ])
+
+
+#----------------------------COMPACTION-------------------------------
+
+def compact_revisions(content_type_id, object_id, keep_recent=KEEP_RECENT):
+    """
+    Keep the `keep_recent` latest revisions of an object and, before them,
+    only the last revision of each day. Survivors keep their numbers and are
+    re-encoded against their new predecessors. Returns the number of
+    revisions deleted.
+    """
+    with transaction.atomic():
+        rows = list(
+            Revision.objects.select_for_update()
+            .filter(content_type_id=content_type_id, object_id=object_id)
+            .order_by('number')
+        )
+        if len(rows) <= keep_recent:
+            return 0
+
+        texts, text = [], None
+        for row in rows:
+            text = _replay([row]) if row.is_snapshot else apply_delta(text, row.data)
+            texts.append(text)
+
+        cutoff = len(rows) - keep_recent
+        last_of_day = {}
+        for index in range(cutoff):
+            last_of_day[rows[index].created_at.date()] = index
+        kept = sorted(last_of_day.values()) + list(range(cutoff, len(rows)))
+
+        kept_set = set(kept)
+        dropped = [row.id for index, row in enumerate(rows) if index not in kept_set]
+        if not dropped:
+            return 0
+
+        survivors, previous, chain_length = [], None, 0
+        for index in kept:
+            row = rows[index]
+            row.is_snapshot, row.data = encode(previous, texts[index], chain_length)
+            chain_length = 1 if row.is_snapshot else chain_length + 1
+            previous = texts[index]
+            survivors.append(row)
+
+        Revision.objects.filter(id__in=dropped).delete()
+        Revision.objects.bulk_update(survivors, ['is_snapshot', 'data'], batch_size=500)
+        return len(dropped)
+
+
+def compact_all(keep_recent=KEEP_RECENT):
+    """
+    Compact every object with more than `keep_recent` revisions. Returns the
+    number of revisions deleted.
+    """
+    objects = (
+        Revision.objects.values('content_type_id', 'object_id')
+        .annotate(total=Count('id'))
+        .filter(total__gt=keep_recent)
+        .order_by()
+    )
+    return sum(
+        compact_revisions(entry['content_type_id'], entry['object_id'], keep_recent)
+        for entry in objects.iterator()
+    )
@@ -1,13 +1,43 @@
 from rest_framework import serializers
-from .models import ClassLevel, Subject, Chapter, Exercise, Solution, Comment, Vote
+from django.contrib.auth.models import AnonymousUser, User
+from .models import ClassLevel, Subject, Chapter, Theorem, Exercise, Solution, Comment, Vote, RelatedExercise, Report, ReportSummary, Revision, UploadedImage
 from users.serializers import UserSerializer
-from users.models import ViewHistory
+from users.models import ViewHistory, Recommendation, ReviewSchedule
+from .votes import VOTE_TARGETS, VOTE_VALUES, BATCH_LIMIT as VOTE_BATCH_LIMIT
+from .bulk import BATCH_LIMIT as EXERCISE_BATCH_LIMIT, check_taxonomy
+from .revisions import record_revision
+from .duplicates import find_duplicates
+from .preload import attach_author_stats
+from .images import media_url
 import logging 
 
 
 logger = logging.getLogger('django')
 
 
+def viewer(context):
+    """
+    The requesting user, anonymous for shared representations serialized
+    without a request (cached fragments, see things/fragments.py).
+    """
+    request = context.get('request')
+    return request.user if request is not None else AnonymousUser()
+
+
+def viewer_vote(obj, context):
+    """
+    The requesting user's vote on `obj`, preloaded for the page by
+    things/preload.py when it was.
+    """
+    user = viewer(context)
+    if not user.is_authenticated:
+        return None
+    if 'viewer_vote' in obj.__dict__:
+        return obj.viewer_vote
+    vote = obj.votes.filter(user=user).first()
+    return vote.value if vote else None
+
+
 #----------------------------CLASS LEVELS/ SUBJECT / CHAPTER-------------------------------
 
 
@@ -47,16 +77,14 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ['id', 'content', 'author', 'created_at', 'replies', 'vote_count', 'user_vote','parent_id']
 
     def get_replies(self, obj):
-        if obj.replies.exists():
-            return CommentSerializer(obj.replies.all(), many=True, context=self.context).data
-        return []
+        # Preloaded for the page by things/preload.py
+        replies = obj.__dict__.get('visible_replies')
+        if replies is None:
+            replies = obj.replies.filter(is_hidden=False).select_related('author__profile').order_by('id')
+        return CommentSerializer(replies, many=True, context=self.context).data
 
     def get_user_vote(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            vote = obj.votes.filter(user=user).first()
-            return vote.value if vote else None
-        return None
+        return viewer_vote(obj, self.context)
 #----------------------------SOLUTION-------------------------------
 
 
@@ -70,12 +98,7 @@ class SolutionSerializer(serializers.ModelSerializer):
         fields = ['id', 'content', 'author', 'created_at', 'updated_at', 'vote_count', 'user_vote']
 
     def get_user_vote(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            vote = obj.votes.filter(user=user).first()
-
-            return vote.value if vote else None
-        return None
+        return viewer_vote(obj, self.context)
     
 #----------------------------EXERCISE-------------------------------
 
@@ -84,8 +107,9 @@ class ExerciseSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     chapters = ChapterSerializer(many=True, read_only=True)
     comments = CommentSerializer(many=True, read_only=True)
-    solution = SolutionSerializer(read_only=True)
-    vote_count = serializers.IntegerField(read_only=True)
+    solution = serializers.SerializerMethodField()
+    # Kept in step with the votes by things/votes.py
+    vote_count = serializers.IntegerField(source='vote_score', read_only=True)
     user_vote = serializers.SerializerMethodField()
     difficulty = serializers.CharField(source='get_difficulty_display')
     view_count = serializers.IntegerField(read_only=True)
@@ -96,12 +120,14 @@ class ExerciseSerializer(serializers.ModelSerializer):
         model = Exercise
         fields = ['id', 'title', 'content', 'difficulty', 'chapters', 'author', 'created_at', 'updated_at', 'view_count', 'comments', 'solution', 'vote_count', 'user_vote', 'difficulty', 'class_levels', 'subject']
 
+    def get_solution(self, obj):
+        solution = getattr(obj, 'solution', None)
+        if solution is None or solution.is_hidden:
+            return None
+        return SolutionSerializer(solution, context=self.context).data
+
     def get_user_vote(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            vote = obj.votes.filter(user=user).first()
-            return vote.value if vote else None
-        return None
+        return viewer_vote(obj, self.context)
 
     def update(self, instance, validated_data):
         chapters = validated_data.pop('chapters', None)
@@ -112,8 +138,151 @@ class ExerciseSerializer(serializers.ModelSerializer):
             instance.chapters.set(chapters)
         if class_levels is not None:
             instance.class_levels.set(class_levels)
+        if 'content' in validated_data:
+            instance.refresh_content_artifacts()
         instance.save()
         return instance
+
+
+class ExerciseListSerializer(ExerciseSerializer):
+    """
+    Card representation: ships the precomputed excerpt instead of the full
+    body, and a solution flag and comment count instead of the solution and
+    the comment thread, which only the detail shows.
+    """
+    # Annotated by things/preload.py:with_card
+    has_solution = serializers.BooleanField(read_only=True)
+    comment_count = serializers.IntegerField(read_only=True)
+
+    class Meta(ExerciseSerializer.Meta):
+        fields = [
+            field for field in ExerciseSerializer.Meta.fields if field not in ('content', 'solution', 'comments')
+        ] + ['excerpt', 'word_count', 'formula_count', 'content_hash', 'has_solution', 'comment_count']
+
+
+class RelatedExerciseSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='related_id')
+    title = serializers.CharField(source='related.title')
+    difficulty = serializers.CharField(source='related.difficulty')
+    excerpt = serializers.CharField(source='related.excerpt')
+
+    class Meta:
+        model = RelatedExercise
+        fields = ['id', 'title', 'difficulty', 'excerpt', 'score']
+
+
+class RecommendationSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='exercise_id')
+    title = serializers.CharField(source='exercise.title')
+    difficulty = serializers.CharField(source='exercise.difficulty')
+    excerpt = serializers.CharField(source='exercise.excerpt')
+
+    class Meta:
+        model = Recommendation
+        fields = ['id', 'title', 'difficulty', 'excerpt', 'score', 'rank']
+
+
+class ReviewSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='exercise_id')
+    title = serializers.CharField(source='exercise.title')
+    difficulty = serializers.CharField(source='exercise.difficulty')
+    excerpt = serializers.CharField(source='exercise.excerpt')
+
+    class Meta:
+        model = ReviewSchedule
+        fields = ['id', 'title', 'difficulty', 'excerpt', 'next_due', 'interval_days', 'repetitions', 'last_reviewed_at']
+
+
+#----------------------------COMPOUND DOCUMENTS-------------------------------
+
+
+class ExerciseCompoundSerializer(ExerciseListSerializer):
+    """
+    Card representation where related objects are referenced by id; the
+    objects themselves are serialized once per response by `build_included`.
+    """
+    author = serializers.PrimaryKeyRelatedField(read_only=True)
+    chapters = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    class_levels = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    subject = serializers.PrimaryKeyRelatedField(read_only=True)
+    theorems = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    comments = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    solution = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    class Meta(ExerciseListSerializer.Meta):
+        fields = ExerciseListSerializer.Meta.fields + ['theorems', 'solution', 'comments']
+
+
+class SubjectRefSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Subject
+        fields = ['id', 'name', 'class_levels']
+
+
+class ChapterRefSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Chapter
+        fields = ['id', 'name', 'order', 'subject', 'subfield', 'class_levels']
+
+
+class TheoremRefSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Theorem
+        fields = ['id', 'name', 'subject', 'subfield', 'chapters', 'class_levels']
+
+
+def build_included(items):
+    """
+    Collect every entity referenced by a page of `ExerciseCompoundSerializer`
+    data and serialize each one once, with one query per entity type.
+    """
+    chapter_ids, class_level_ids, subject_ids, theorem_ids, author_ids = set(), set(), set(), set(), set()
+    for item in items:
+        chapter_ids.update(item['chapters'])
+        class_level_ids.update(item['class_levels'])
+        theorem_ids.update(item['theorems'])
+        if item['subject'] is not None:
+            subject_ids.add(item['subject'])
+        if item['author'] is not None:
+            author_ids.add(item['author'])
+
+    # Theorems and chapters point at further chapters, subjects and levels
+    theorems = TheoremRefSerializer(
+        Theorem.objects.filter(id__in=theorem_ids).prefetch_related('chapters', 'class_levels'),
+        many=True
+    ).data
+    for theorem in theorems:
+        chapter_ids.update(theorem['chapters'])
+        class_level_ids.update(theorem['class_levels'])
+        subject_ids.add(theorem['subject'])
+
+    chapters = ChapterRefSerializer(
+        Chapter.objects.filter(id__in=chapter_ids).prefetch_related('class_levels'),
+        many=True
+    ).data
+    for chapter in chapters:
+        class_level_ids.update(chapter['class_levels'])
+        subject_ids.add(chapter['subject'])
+
+    subjects = SubjectRefSerializer(
+        Subject.objects.filter(id__in=subject_ids).prefetch_related('class_levels'),
+        many=True
+    ).data
+    for subject in subjects:
+        class_level_ids.update(subject['class_levels'])
+
+    class_levels = ClassLevelSerializer(ClassLevel.objects.filter(id__in=class_level_ids), many=True).data
+    authors = list(User.objects.filter(id__in=author_ids).select_related('profile'))
+    attach_author_stats(authors)
+    authors = UserSerializer(authors, many=True).data
+
+    return {
+        'chapters': {chapter['id']: chapter for chapter in chapters},
+        'subjects': {subject['id']: subject for subject in subjects},
+        'class_levels': {class_level['id']: class_level for class_level in class_levels},
+        'theorems': {theorem['id']: theorem for theorem in theorems},
+        'authors': {author['id']: author for author in authors},
+    }
     
 
     
@@ -121,6 +290,8 @@ class ExerciseCreateSerializer(serializers.ModelSerializer):
     solution_content = serializers.CharField(required=False, allow_blank=True)
     chapters = serializers.PrimaryKeyRelatedField(many=True, queryset=Chapter.objects.all(), required=False)
     class_levels = serializers.PrimaryKeyRelatedField(many=True, queryset=ClassLevel.objects.all(), required=False)
+    # Existing exercises with nearly the same body (things/duplicates.py), on creation
+    possible_duplicates = serializers.SerializerMethodField()
 
     class Meta:
         model = Exercise
@@ -131,20 +302,28 @@ class ExerciseCreateSerializer(serializers.ModelSerializer):
             'chapters',
             'class_levels',
             'solution_content',
-            'subject'
+            'subject',
+            'possible_duplicates',
         ]
 
+    def get_possible_duplicates(self, obj):
+        return getattr(obj, 'possible_duplicates', [])
+
     def create(self, validated_data):
         solution_content = validated_data.pop('solution_content', None)
         chapters = validated_data.pop('chapters', [])
         class_levels = validated_data.pop('class_levels', [])
 
-        logger.info(**validated_data)
+        logger.info("Creating exercise %r", validated_data.get('title'))
         
-        exercise = Exercise.objects.create(
+        exercise = Exercise(
             author=self.context['request'].user,
             **validated_data
         )
+        exercise.possible_duplicates = find_duplicates(exercise.content)
+        exercise.refresh_content_artifacts()
+        exercise.save()
+        record_revision(exercise, exercise.author)
 
         if chapters:
             exercise.chapters.set(chapters)
@@ -152,11 +331,12 @@ class ExerciseCreateSerializer(serializers.ModelSerializer):
             exercise.class_levels.set(class_levels)
         
         if solution_content:
-            Solution.objects.create(
+            solution = Solution.objects.create(
                 exercise=exercise,
                 content=solution_content,
                 author=exercise.author
             )
+            record_revision(solution, exercise.author)
         
         return exercise
 
@@ -164,6 +344,8 @@ class ExerciseCreateSerializer(serializers.ModelSerializer):
         solution_content = validated_data.pop('solution_content', None)
         chapters = validated_data.pop('chapters', None)
         class_levels = validated_data.pop('class_levels', None)
+        editor = self.context['request'].user
+        previous_content = instance.content
         
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
@@ -178,11 +360,39 @@ class ExerciseCreateSerializer(serializers.ModelSerializer):
                 exercise=instance,
                 defaults={'author': instance.author}
             )
+            previous_solution = None if created else solution.content
             solution.content = solution_content
             solution.save()
+            record_revision(solution, editor, previous=previous_solution)
         
+        if 'content' in validated_data:
+            instance.refresh_content_artifacts()
         instance.save()
+        if 'content' in validated_data:
+            record_revision(instance, editor, previous=previous_content)
         return instance
+class ExerciseBatchItemSerializer(serializers.ModelSerializer):
+    # Plain ids: the taxonomy is checked for the whole batch at once
+    solution_content = serializers.CharField(required=False, allow_blank=True)
+    chapters = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    class_levels = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    subject = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+
+    class Meta:
+        model = Exercise
+        fields = [field for field in ExerciseCreateSerializer.Meta.fields if field != 'possible_duplicates']
+
+
+class ExerciseBatchSerializer(serializers.Serializer):
+    exercises = ExerciseBatchItemSerializer(many=True, allow_empty=False, max_length=EXERCISE_BATCH_LIMIT)
+
+    def validate_exercises(self, items):
+        errors = check_taxonomy(items)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+
 class ViewHistorySerializer(serializers.ModelSerializer):
     content = ExerciseSerializer()
 
@@ -202,6 +412,16 @@ class VoteSerializer(serializers.ModelSerializer):
         fields = ['id', 'value', 'created_at', 'updated_at']
 
 
+class VoteItemSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=list(VOTE_TARGETS))
+    id = serializers.IntegerField(min_value=1)
+    value = serializers.ChoiceField(choices=VOTE_VALUES)
+
+
+class VoteBatchSerializer(serializers.Serializer):
+    votes = VoteItemSerializer(many=True, allow_empty=False, max_length=VOTE_BATCH_LIMIT)
+
+
 class TheoremSerializer(serializers.ModelSerializer):
     subject = SubjectSerializer(read_only=True)
     class_levels = ClassLevelSerializer(many=True, read_only=True)
@@ -230,11 +450,7 @@ class LessonSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'content', 'chapters', 'author', 'created_at', 'updated_at', 'view_count', 'comments', 'solution', 'vote_count', 'user_vote', 'class_levels', 'subject']
 
     def get_user_vote(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            vote = obj.votes.filter(user=user).first()
-            return vote.value if vote else None
-        return None
+        return viewer_vote(obj, self.context)
 
     def update(self, instance, validated_data):
         chapters = validated_data.pop('chapters', None)
@@ -246,4 +462,52 @@ class LessonSerializer(serializers.ModelSerializer):
         if class_levels is not None:
             instance.class_levels.set(class_levels)
         instance.save()
-        return instance
\ No newline at end of file
+        return instance
+
+
+#----------------------------REVISIONS-------------------------------
+
+class RevisionSerializer(serializers.ModelSerializer):
+    author = UserSerializer(read_only=True)
+
+    class Meta:
+        model = Revision
+        fields = ['number', 'is_snapshot', 'length', 'author', 'created_at']
+
+
+#----------------------------IMAGES-------------------------------
+
+class UploadedImageSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+    variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadedImage
+        fields = ['url', 'sha256', 'mime_type', 'size', 'width', 'height', 'variants']
+
+    def _absolute(self, path):
+        request = self.context.get('request')
+        url = media_url(path)
+        return request.build_absolute_uri(url) if request else url
+
+    def get_url(self, obj):
+        return self._absolute(obj.path)
+
+    def get_variants(self, obj):
+        return {width: self._absolute(path) for width, path in obj.variants.items()}
+
+
+#----------------------------MODERATION-------------------------------
+
+class ReportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Report
+        fields = ['reason']
+
+
+class ReportSummarySerializer(serializers.ModelSerializer):
+    content_type = serializers.CharField(source='content_type.model', read_only=True)
+
+    class Meta:
+        model = ReportSummary
+        fields = ['id', 'content_type', 'object_id', 'report_count', 'last_reported_at', 'reasons', 'status']
@@ -0,0 +1,234 @@
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, QuerySet, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from users.models import UserProfile
+from users.notifications import notify_lesson_update
+from .calibration import label_difficulty
+from .duplicates import store_signatures
+from .fragments import exercises_of, invalidate_on_commit
+from .models import ClassLevel, Subject, Subfield, Chapter, Theorem, Exercise, Solution, Comment, Vote, Lesson, Report
+from .moderation import record_report
+from .outline import invalidate_outlines
+from .related import refresh_related_many
+
+
+#----------------------------RELATED EXERCISES-------------------------------
+
+@receiver(m2m_changed, sender=Exercise.theorems.through)
+@receiver(m2m_changed, sender=Exercise.chapters.through)
+def refresh_related_on_relation_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        exercise_ids = {instance.pk}
+    elif pk_set:
+        exercise_ids = set(pk_set)
+    else:
+        # Reverse clear (e.g. chapter.exercises.clear()) does not report ids
+        return
+
+    transaction.on_commit(lambda: refresh_related_many(exercise_ids))
+
+
+#----------------------------OUTLINE-------------------------------
+
+OUTLINE_MODELS = [ClassLevel, Subject, Subfield, Chapter, Theorem, Exercise, Lesson]
+OUTLINE_RELATIONS = [
+    Chapter.class_levels.through,
+    Theorem.chapters.through,
+    Theorem.class_levels.through,
+    Exercise.chapters.through,
+    Exercise.class_levels.through,
+    Lesson.theorems.through,
+    Lesson.class_levels.through,
+]
+
+
+def invalidate_outlines_on_save(sender, **kwargs):
+    transaction.on_commit(invalidate_outlines)
+
+
+def invalidate_outlines_on_relation_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(invalidate_outlines)
+
+
+for model in OUTLINE_MODELS:
+    post_save.connect(invalidate_outlines_on_save, sender=model, dispatch_uid=f'outline_save_{model.__name__}')
+    post_delete.connect(invalidate_outlines_on_save, sender=model, dispatch_uid=f'outline_delete_{model.__name__}')
+for through in OUTLINE_RELATIONS:
+    m2m_changed.connect(
+        invalidate_outlines_on_relation_change, sender=through, dispatch_uid=f'outline_m2m_{through.__name__}'
+    )
+
+
+#----------------------------EXERCISE DETAIL-------------------------------
+
+# Exercise lookups reaching the taxonomy objects nested in the detail payload
+DETAIL_TAXONOMY = {
+    Chapter: ['chapters'],
+    Subject: ['subject', 'chapters__subject'],
+    ClassLevel: ['class_levels', 'chapters__class_levels', 'subject__class_levels', 'chapters__subject__class_levels'],
+}
+
+
+def _exercises_showing(model, object_ids):
+    if model in DETAIL_TAXONOMY:
+        condition = Q()
+        for lookup in DETAIL_TAXONOMY[model]:
+            condition |= Q(**{f'{lookup}__in': object_ids})
+        return set(Exercise.objects.filter(condition).values_list('id', flat=True).distinct())
+    return exercises_of(model, object_ids)
+
+
+@receiver(post_save, sender=Exercise)
+@receiver(post_delete, sender=Exercise)
+@receiver(post_save, sender=Solution)
+@receiver(post_delete, sender=Solution)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_detail_on_content_change(sender, instance, **kwargs):
+    invalidate_on_commit([instance.pk if sender is Exercise else instance.exercise_id])
+
+
+@receiver(post_save, sender=Vote)
+@receiver(post_delete, sender=Vote)
+def invalidate_detail_on_vote(sender, instance, **kwargs):
+    # The API path upserts without signals and invalidates itself (things/votes.py)
+    model = ContentType.objects.get_for_id(instance.content_type_id).model_class()
+    invalidate_on_commit(exercises_of(model, [instance.object_id]))
+
+
+@receiver(post_save, sender=Chapter)
+@receiver(post_delete, sender=Chapter)
+@receiver(post_save, sender=Subject)
+@receiver(post_save, sender=ClassLevel)
+def invalidate_detail_on_taxonomy_change(sender, instance, **kwargs):
+    invalidate_on_commit(_exercises_showing(sender, [instance.pk]))
+
+
+# Relations whose owner side is nested in the detail payload -> owner field name
+DETAIL_RELATIONS = {
+    Exercise.chapters.through: 'chapters',
+    Exercise.class_levels.through: 'class_levels',
+    Chapter.class_levels.through: 'class_levels',
+    Subject.class_levels.through: 'class_levels',
+}
+
+
+def invalidate_detail_on_relation_change(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        owner, owner_ids = type(instance), [instance.pk]
+    elif action == 'pre_clear':
+        # clear() does not report ids: read the owners while the rows still exist
+        owner = model
+        owner_ids = list(model.objects.filter(**{DETAIL_RELATIONS[sender]: instance}).values_list('pk', flat=True))
+    else:
+        owner, owner_ids = model, list(pk_set)
+    invalidate_on_commit(_exercises_showing(owner, owner_ids))
+
+
+for through in DETAIL_RELATIONS:
+    m2m_changed.connect(
+        invalidate_detail_on_relation_change, sender=through, dispatch_uid=f'detail_m2m_{through.__name__}'
+    )
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=UserProfile)
+def invalidate_detail_on_author_change(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    user_id = instance.pk if sender is User else instance.user_id
+    invalidate_on_commit(
+        Exercise.objects.filter(
+            Q(author_id=user_id) | Q(solution__author_id=user_id) | Q(comments__author_id=user_id)
+        ).values_list('id', flat=True).distinct()
+    )
+
+
+#----------------------------SORT KEYS-------------------------------
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        Exercise.objects.filter(id=instance.exercise_id).update(comment_count=F('comment_count') + 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, origin=None, **kwargs):
+    if not isinstance(origin, QuerySet):
+        Exercise.objects.filter(id=instance.exercise_id, comment_count__gt=0).update(
+            comment_count=F('comment_count') - 1
+        )
+        return
+
+    # Queryset deletes (moderation, admin actions, exercise cascades) recount
+    # the exercises involved once on commit instead of once per comment
+    exercise_ids = origin.__dict__.get('_recount_exercise_ids')
+    if exercise_ids is None:
+        exercise_ids = origin.__dict__['_recount_exercise_ids'] = set()
+        transaction.on_commit(lambda: recount_comments(exercise_ids))
+    exercise_ids.add(instance.exercise_id)
+
+
+def recount_comments(exercise_ids):
+    Exercise.objects.filter(id__in=exercise_ids).update(
+        comment_count=Coalesce(
+            Subquery(
+                Comment.objects.filter(exercise_id=OuterRef('pk')).order_by().values('exercise_id')
+                .annotate(count=Count('id')).values('count')
+            ),
+            0,
+        )
+    )
+
+
+@receiver(pre_save, sender=Exercise)
+def place_by_label(sender, instance, update_fields=None, raw=False, **kwargs):
+    # New and relabelled exercises sort by their label until the next
+    # calibration run (things/calibration.py) measures them
+    if raw or update_fields is not None:
+        return
+    if instance.pk is not None:
+        previous = Exercise.objects.filter(pk=instance.pk).values_list('difficulty', flat=True).first()
+        if previous == instance.difficulty:
+            return
+    instance.calibrated_difficulty = label_difficulty(instance.difficulty)
+
+
+#----------------------------DUPLICATES-------------------------------
+
+@receiver(post_save, sender=Exercise)
+def store_signature(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'content' not in update_fields:
+        return
+    if 'content' in instance.get_deferred_fields():
+        return
+    store_signatures([instance])
+
+
+#----------------------------REPORTS-------------------------------
+
+@receiver(post_save, sender=Report)
+def summarize_report(sender, instance, created, **kwargs):
+    if created:
+        record_report(instance)
+
+
+#----------------------------NOTIFICATIONS-------------------------------
+
+@receiver(post_save, sender=Lesson)
+def notify_on_lesson_save(sender, instance, update_fields=None, **kwargs):
+    # Runs in the saving transaction, so the outbox row commits with the lesson
+    if update_fields is not None and set(update_fields) <= {'view_count'}:
+        return
+    notify_lesson_update(instance)
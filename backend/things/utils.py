@@ -0,0 +1,57 @@
+import hashlib
+import html
+import re
+
+
+#----------------------------CONTENT ARTIFACTS-------------------------------
+
+EXCERPT_LENGTH = 280
+
+# Same delimiters as the frontend Mathematics extension ($...$ and $$...$$)
+FORMULA_RE = re.compile(r'\$\$[^$]+\$\$|\$[^$]+\$')
+TAG_RE = re.compile(r'<[^>]+>')
+BLOCK_TAG_RE = re.compile(r'</?(p|div|br|li|h[1-6])[^>]*>', re.IGNORECASE)
+SPACE_RE = re.compile(r'\s+')
+WORD_RE = re.compile(r'\w+')
+
+
+def strip_html(content):
+    text = BLOCK_TAG_RE.sub(' ', content or '')
+    text = TAG_RE.sub('', text)
+    return SPACE_RE.sub(' ', html.unescape(text)).strip()
+
+
+def make_excerpt(text, length=EXCERPT_LENGTH):
+    """
+    Truncate text to roughly `length` characters without cutting a formula
+    or a word in half, so the excerpt still renders with KaTeX.
+    """
+    if len(text) <= length:
+        return text
+
+    cut = length
+    for match in FORMULA_RE.finditer(text):
+        if match.start() < length < match.end():
+            cut = match.start()
+            break
+    else:
+        space = text.rfind(' ', 0, length)
+        if space > 0:
+            cut = space
+
+    return text[:cut].rstrip() + '…'
+
+
+def compute_content_artifacts(content):
+    """
+    Derive the list-card fields of a piece of content in a single pass.
+    """
+    text = strip_html(content)
+    prose = FORMULA_RE.sub(' ', text)
+
+    return {
+        'excerpt': make_excerpt(text),
+        'word_count': len(WORD_RE.findall(prose)),
+        'formula_count': len(FORMULA_RE.findall(text)),
+        'content_hash': hashlib.sha256((content or '').encode('utf-8')).hexdigest(),
+    }
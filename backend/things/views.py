@@ -1,19 +1,40 @@
-from rest_framework import viewsets, status, permissions
+from rest_framework import viewsets, status, permissions, views
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import MultiPartParser
 
 
+from django.contrib.auth.models import AnonymousUser
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Count, Q
-
-
-from .models import ClassLevel, Subject, Chapter, Exercise, Solution, Comment, Vote, Lesson
-from .serializers import ClassLevelSerializer, SubjectSerializer, ChapterSerializer, ExerciseSerializer, SolutionSerializer, CommentSerializer, ExerciseCreateSerializer,LessonSerializer,TheoremSerializer
+from django.db.models import Count, Prefetch, Q
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
+
+
+from .models import ClassLevel, Subject, Chapter, Exercise, ExerciseCalibration, Solution, Comment, Vote, Lesson, RelatedExercise, Report, ReportSummary
+from .serializers import ClassLevelSerializer, SubjectSerializer, ChapterSerializer, ExerciseSerializer, ExerciseListSerializer, ExerciseCompoundSerializer, RelatedExerciseSerializer, build_included, SolutionSerializer, CommentSerializer, ExerciseCreateSerializer,LessonSerializer,TheoremSerializer,ReportSerializer,ReportSummarySerializer,VoteBatchSerializer,ExerciseBatchSerializer,RevisionSerializer,UploadedImageSerializer
+from .moderation import BULK_ACTIONS
+from .bulk import create_exercises
+from .images import IMMUTABLE_MAX_AGE, HashingUploadHandler, store_upload
+from .calibration import labels_between
+from .outline import get_outline
+from .revisions import get_revision, record_revision, revisions_of
+from .fragments import apply_overlay, get_fragment
+from .preload import attach_author_stats, has_visible_solution, preload_cards, preload_comments, preload_exercises, preload_solutions, visible_comments, with_card, with_nested
+from .live import event_stream, exercise_channel, get_broker, publish_comment
+from .votes import VOTE_VALUES, apply_vote, apply_votes, target_fields
+from users.notifications import notify_comment
 
 
 import logging
+import math
 
 
 logger = logging.getLogger('django')
@@ -40,48 +61,108 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size = 1000
     page_size_query_param = 'page_size'
     max_page_size = 1000
-    
+
+class PageSizePagination(PageNumberPagination):
+    # PAGE_SIZE from the settings unless the client asks for another
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+#----------------------------PRELOAD-------------------------------
+
+class PreloadMixin:
+    """
+    Batch-load what the serializer reads per object (things/preload.py) for
+    the page, or the single object, about to be serialized, so that a page
+    costs the same number of queries whatever its size.
+    """
+    def preload(self, objects):
+        """
+        Load in place what the serializer reads from `objects`. Nothing by
+        default: a viewset whose serializer reads only its own columns needs
+        no override.
+        """
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            self.preload(page)
+        return page
+
+    def get_object(self):
+        obj = super().get_object()
+        if self.action == 'retrieve':
+            self.preload([obj])
+        return obj
+
+
+#----------------------------PUBLIC CACHE-------------------------------
+
+class PublicCacheMixin:
+    """
+    Mark anonymous read responses as publicly cacheable, which lets
+    CompressionMiddleware keep the compressed body for `public_cache_max_age`.
+    """
+    public_cache_max_age = 300
+    # Actions with their own invalidation, which a public cache would bypass
+    uncached_actions = ()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if (
+            request.method in permissions.SAFE_METHODS
+            and getattr(self, 'action', None) not in self.uncached_actions
+            and not request.user.is_authenticated
+            and response.status_code == status.HTTP_200_OK
+        ):
+            patch_cache_control(response, public=True, max_age=self.public_cache_max_age)
+        return response
+
 
 #----------------------------CLASS LEVEL/ SUBJECT/ CHAPTER-------------------------------
 
-class ClassLevelViewSet(viewsets.ReadOnlyModelViewSet):
+class ClassLevelViewSet(PublicCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = ClassLevel.objects.all()
     serializer_class = ClassLevelSerializer
+    uncached_actions = ('outline',)
+
+    @action(detail=True, methods=['get'])
+    def outline(self, request, pk=None):
+        # Subject -> Subfield -> Chapter tree with content counts, cached (things/outline.py)
+        return Response(get_outline(self.get_object()))
 
-class SubjectViewSet(viewsets.ReadOnlyModelViewSet):
+class SubjectViewSet(PublicCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
 
     def get_queryset(self):
-        queryset = Subject.objects.all()
+        queryset = Subject.objects.prefetch_related('class_levels').order_by('id')
         class_level_id = self.request.query_params.getlist('class_level[]')
 
         filters = Q()
-        if class_level_id or class_level_id != '':
+        if class_level_id:
             filters |= Q(class_levels__id__in=class_level_id)
         queryset = queryset.filter(filters)
 
         return queryset
 
 
-class ChapterViewSet(viewsets.ReadOnlyModelViewSet):
+class ChapterViewSet(PublicCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Chapter.objects.all()
     serializer_class = ChapterSerializer
     pagination_class = StandardResultsSetPagination
 
     def get_queryset(self):
-        queryset = Chapter.objects.all()
+        queryset = Chapter.objects.select_related('subject').prefetch_related('class_levels', 'subject__class_levels')
         subject_id = self.request.query_params.getlist('subject[]')
         class_level_id = self.request.query_params.getlist('class_level[]')
 
-
-        logger.info(self.request)
-
-
         # Filter out empty strings and convert to integers
         subject_ids = [int(id) for id in subject_id if id.isdigit()]
         class_level_ids = [int(id) for id in class_level_id if id.isdigit()]
 
+        logger.debug("Chapter filters: subjects=%s class_levels=%s", subject_ids, class_level_ids)
+
         filters_subject = Q()
         filters_class_level = Q()
 
@@ -93,64 +174,133 @@ class ChapterViewSet(viewsets.ReadOnlyModelViewSet):
         filters = filters_subject & filters_class_level
         queryset = queryset.filter(filters)
 
-        logger.info(queryset)
         return queryset
     
 
+def get_visible_object(view, pk, *fields):
+    # Only the id is needed: skip the viewset's annotations and prefetches
+    obj = get_object_or_404(view.get_queryset().model.objects.only('id', *fields), pk=pk, is_hidden=False)
+    view.check_object_permissions(view.request, obj)
+    return obj
+
+
 #----------------------------VOTEMIXIN-------------------------------
 
 class VoteMixin:
     @action(detail=True, methods=['post'])
     def vote(self, request, pk=None):
-        obj = self.get_object()
         vote_value = request.data.get('value')
 
-        if vote_value not in [Vote.UP, Vote.DOWN, Vote.UNVOTE]:
+        if vote_value not in VOTE_VALUES:
             return Response({'error': 'Invalid vote value'}, status=status.HTTP_400_BAD_REQUEST)
 
-        vote, created = Vote.objects.get_or_create(
+        obj = get_visible_object(self, pk, *target_fields(self.get_queryset().model))
+        vote_count, user_vote = apply_vote(request.user, obj, vote_value)
+        return Response({'id': obj.id, 'vote_count': vote_count, 'user_vote': user_vote})
+
+#----------------------------REPORTMIXIN-------------------------------
+
+class ReportMixin:
+    @action(detail=True, methods=['post'])
+    def report(self, request, pk=None):
+        obj = self.get_object()
+        serializer = ReportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        content_type = ContentType.objects.get_for_model(obj)
+        if Report.objects.filter(user=request.user, content_type=content_type, object_id=obj.id).exists():
+            return Response({'error': 'Already reported'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The ReportSummary is maintained by a post_save receiver (things/signals.py)
+        Report.objects.create(
             user=request.user,
-            content_type=ContentType.objects.get_for_model(obj),
+            content_type=content_type,
             object_id=obj.id,
-            defaults={'value': vote_value}
+            reason=serializer.validated_data['reason']
         )
+        return Response(status=status.HTTP_201_CREATED)
+
+#----------------------------REVISIONMIXIN-------------------------------
+
+class RevisionPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class RevisionMixin:
+    @action(detail=True, methods=['get'])
+    def revisions(self, request, pk=None):
+        obj = get_visible_object(self, pk)
+        queryset = revisions_of(obj).defer('data').select_related('author__profile').order_by('-number')
+        paginator = RevisionPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        attach_author_stats(revision.author for revision in page)
+        return paginator.get_paginated_response(RevisionSerializer(page, many=True).data)
+
+    @action(detail=True, methods=['get'], url_path=r'revisions/(?P<number>\d+)')
+    def revision(self, request, pk=None, number=None):
+        obj = get_visible_object(self, pk)
+        found = get_revision(obj, int(number))
+        if found is None:
+            raise NotFound()
+        revision, content = found
+        attach_author_stats([revision.author])
+        return Response(dict(RevisionSerializer(revision).data, content=content))
 
-        if not created:
-            if vote_value == Vote.UNVOTE:
-                vote.delete()
-            elif vote.value != vote_value:
-                vote.value = vote_value
-                vote.save()
 
-        return Response(self.get_serializer(obj).data)
-    
 #----------------------------EXERCISE-------------------------------
 
 
-class ExerciseViewSet(VoteMixin, viewsets.ModelViewSet):
+class ExerciseViewSet(PublicCacheMixin, PreloadMixin, VoteMixin, ReportMixin, RevisionMixin, viewsets.ModelViewSet):
     queryset = Exercise.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = PageSizePagination
+    public_cache_max_age = 30
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return ExerciseCreateSerializer
+        if self.action == 'list':
+            if self.is_compound_request():
+                return ExerciseCompoundSerializer
+            return ExerciseListSerializer
         return ExerciseSerializer
 
-    def get_queryset(self):
-        queryset = Exercise.objects.all().select_related(
-            'author', 'solution', 'subject'
-        ).prefetch_related(
-            'chapters',
-            'class_levels',
-            'comments',
-            'votes'
-        ).annotate(
-            vote_count_annotation=Count('votes', filter=Q(votes__value=Vote.UP)) - 
-                                  Count('votes', filter=Q(votes__value=Vote.DOWN))
-        )
+    def is_compound_request(self):
+        return self.request.query_params.get('compound') in ('1', 'true')
+
+    # Public sort names -> ordering, each backed by an index on Exercise
+    SORT_KEYS = {
+        'newest': ('-created_at', '-id'),
+        'oldest': ('created_at', 'id'),
+        'most_upvoted': ('-vote_score', '-id'),
+        'most_commented': ('-comment_count', '-id'),
+        'most_viewed': ('-view_count', '-id'),
+        # Empirical difficulty measured by things/calibration.py
+        'easiest': ('calibrated_difficulty', 'id'),
+        'hardest': ('-calibrated_difficulty', '-id'),
+    }
+    # Values accepted before the whitelist
+    SORT_ALIASES = {'-created_at': 'newest', 'created_at': 'oldest', 'votes': 'most_upvoted'}
+    DEFAULT_SORT = 'newest'
 
-        
+    def get_queryset(self):
+        queryset = Exercise.objects.filter(is_hidden=False)
+        if self.action == 'list' and self.is_compound_request():
+            # Related objects are only referenced by id, see build_included
+            queryset = queryset.select_related('solution').prefetch_related(
+                'chapters', 'class_levels', 'theorems',
+                Prefetch('comments', queryset=Comment.objects.filter(is_hidden=False).only('id', 'exercise_id')),
+            ).annotate(has_solution=has_visible_solution())
+        elif self.action == 'list':
+            queryset = with_card(queryset)
+        else:
+            queryset = with_nested(queryset)
 
+        # Cards only need the precomputed excerpt
+        if self.action == 'list':
+            queryset = queryset.defer('content')
 
         # Filtering
         class_levels = self.request.query_params.getlist('class_levels[]')
@@ -158,23 +308,99 @@ class ExerciseViewSet(VoteMixin, viewsets.ModelViewSet):
         chapters = self.request.query_params.getlist('chapters[]')
         difficulties = self.request.query_params.getlist('difficulties[]')
 
+        # M2M filters are semi-joins on the through tables' (taxonomy, exercise)
+        # indexes, so no row is duplicated and no DISTINCT defeats the sort index
         if class_levels:
-            queryset = queryset.filter(class_levels__id__in=class_levels)
+            queryset = queryset.filter(id__in=Exercise.class_levels.through.objects.filter(
+                classlevel_id__in=class_levels
+            ).values('exercise_id'))
         if subjects:
             queryset = queryset.filter(subject__id__in=subjects)
         if chapters:
-            queryset = queryset.filter(chapters__id__in=chapters)
+            queryset = queryset.filter(id__in=Exercise.chapters.through.objects.filter(
+                chapter_id__in=chapters
+            ).values('exercise_id'))
         if difficulties:
             queryset = queryset.filter(difficulty__in=difficulties)
 
-        # Sorting
-        sort_by = self.request.query_params.get('sort', '-created_at')
-        if sort_by == 'votes':
-            queryset = queryset.order_by('-vote_count_annotation')
+        # Calibrated difficulty range: measured within the requested class
+        # levels when there are some, over all of them otherwise
+        calibrated = self.get_calibrated_range()
+        if calibrated and class_levels:
+            # Semi-joins on the (class_level, difficulty) index; exercises not
+            # yet measured in these levels are placed by their label
+            calibrations = ExerciseCalibration.objects.filter(class_level_id__in=class_levels)
+            queryset = queryset.filter(
+                Q(id__in=calibrations.filter(
+                    **{f'difficulty__{bound}': value for bound, value in calibrated.items()}
+                ).values('exercise_id'))
+                | (~Q(id__in=calibrations.values('exercise_id')) & Q(difficulty__in=labels_between(**calibrated)))
+            )
+        elif calibrated:
+            queryset = queryset.filter(**{
+                f'calibrated_difficulty__{bound}': value for bound, value in calibrated.items()
+            })
+
+        return queryset.order_by(*self.get_ordering())
+
+    def get_calibrated_range(self):
+        """
+        {'gte': low, 'lte': high} from calibrated_min and calibrated_max.
+        """
+        bounds = {}
+        for parameter, bound in (('calibrated_min', 'gte'), ('calibrated_max', 'lte')):
+            value = self.request.query_params.get(parameter)
+            if value in (None, ''):
+                continue
+            try:
+                bounds[bound] = float(value)
+            except ValueError:
+                bounds[bound] = math.nan
+            if not math.isfinite(bounds[bound]):
+                raise ValidationError({parameter: "Expected a number"})
+        return bounds
+
+    def get_ordering(self):
+        sort_by = self.request.query_params.get('sort', self.DEFAULT_SORT)
+        sort_by = self.SORT_ALIASES.get(sort_by, sort_by)
+        if sort_by not in self.SORT_KEYS:
+            raise ValidationError({'sort': f"Unknown sort, expected one of: {', '.join(self.SORT_KEYS)}"})
+        return self.SORT_KEYS[sort_by]
+
+    def preload(self, objects):
+        if self.action == 'retrieve':
+            # The shared fragment is serialized without a viewer
+            preload_exercises(objects, AnonymousUser())
+        elif self.action == 'list' and not self.is_compound_request():
+            preload_cards(objects, self.request.user)
         else:
-            queryset = queryset.order_by(sort_by)
+            preload_exercises(objects, self.request.user, nested=not self.is_compound_request())
 
-        return queryset.distinct()
+    def list(self, request, *args, **kwargs):
+        if not self.is_compound_request():
+            return super().list(request, *args, **kwargs)
+
+        # ?compound=1: exercises reference related objects by id and each
+        # object is serialized once in `included`
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        data = self.get_serializer(page if page is not None else queryset, many=True).data
+        included = build_included(data)
+
+        if page is not None:
+            response = self.get_paginated_response(data)
+        else:
+            response = Response({'results': data})
+        response.data['included'] = included
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        # Shared fragment from the cache plus the viewer's overlay (things/fragments.py)
+        pk = kwargs[self.lookup_field]
+        if not str(pk).isdigit():
+            raise NotFound()
+        data = get_fragment(int(pk), lambda: ExerciseSerializer(self.get_object()).data)
+        return Response(apply_overlay(data, request.user))
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -186,7 +412,7 @@ class ExerciseViewSet(VoteMixin, viewsets.ModelViewSet):
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data)
-        print(serializer.is_valid(raise_exception=True))
+        serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
         return Response(serializer.data)
 
@@ -204,37 +430,31 @@ class ExerciseViewSet(VoteMixin, viewsets.ModelViewSet):
             raise PermissionDenied("You must be logged in to create an exercise.")
         serializer.save()
 
-    @action(detail=True, methods=['post'])
-    def vote(self, request, pk=None):
-        exercise = self.get_object()
-        vote_value = request.data.get('value')
-
-        logger.info(f"Vote request for Exercise ID {exercise.id} with vote value: {vote_value}")
-        logger.info(f"Request data: {request.data}")
-
-        if vote_value not in [Vote.UP, Vote.DOWN, Vote.UNVOTE]:
-            logger.error(f"Invalid vote value: {vote_value} for Exercise ID {exercise.id}")
-            return Response(
-                {'error': 'Invalid vote value'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        vote, created = Vote.objects.get_or_create(
-            user=request.user,
-            content_type=ContentType.objects.get_for_model(exercise),
-            object_id=exercise.id,
-            defaults={'value': vote_value}
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        serializer = ExerciseBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['exercises']
+
+        logger.info("Creating %d exercises in batch", len(items))
+        created = create_exercises(request.user, items)
+        results = [dict(entry, index=index) for index, entry in enumerate(created)]
+        return Response({'results': results}, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        # Served from the precomputed index (things/related.py), one indexed read
+        if not str(pk).isdigit():
+            raise NotFound()
+        entries = RelatedExercise.objects.filter(exercise_id=pk, exercise__is_hidden=False, related__is_hidden=False).select_related('related').only(
+            'score', 'rank', 'related_id',
+            'related__title', 'related__difficulty', 'related__excerpt'
         )
-
-        if not created:
-            if vote_value == Vote.UNVOTE:
-                vote.delete()
-            elif vote.value != vote_value:
-                vote.value = vote_value
-                vote.save()
-        # Refresh the exercise object to get updated vote count
-        exercise.refresh_from_db()
-        return Response(self.get_serializer(exercise).data)
+        data = RelatedExerciseSerializer(entries, many=True).data
+        # An empty list is only checked against the table when it happens
+        if not data and not Exercise.objects.filter(pk=pk, is_hidden=False).exists():
+            raise NotFound()
+        return Response(data)
 
     @action(detail=True, methods=['post'])
     def comment(self, request, pk=None):
@@ -243,14 +463,16 @@ class ExerciseViewSet(VoteMixin, viewsets.ModelViewSet):
             data=request.data,
             context={'request': request}
         )
-        logger.info(f"Comment request for Exercise ID {exercise.id}")
-        logger.info(f"Request data: {request.data}")
+        logger.info("Comment request for Exercise ID %s", exercise.id)
         if serializer.is_valid():
-            serializer.save(
-                exercise=exercise,
-                author=request.user,
-                parent_id=request.data.get('parent')  # Pass parent_id here
-            )
+            with transaction.atomic():
+                comment = serializer.save(
+                    exercise=exercise,
+                    author=request.user,
+                    parent_id=request.data.get('parent')  # Pass parent_id here
+                )
+                notify_comment(comment)
+                publish_comment(comment)
             return Response(
                 serializer.data,
                 status=status.HTTP_201_CREATED
@@ -261,23 +483,157 @@ class ExerciseViewSet(VoteMixin, viewsets.ModelViewSet):
         )
     
 #----------------------------SOLUTION-------------------------------
-class SolutionViewSet(VoteMixin, viewsets.ModelViewSet):
-    queryset = Solution.objects.all()
+class SolutionViewSet(PreloadMixin, VoteMixin, ReportMixin, RevisionMixin, viewsets.ModelViewSet):
+    queryset = Solution.objects.filter(is_hidden=False).select_related('author__profile').order_by('id')
     serializer_class = SolutionSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = PageSizePagination
+
+    def preload(self, objects):
+        preload_solutions(objects, self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        solution = serializer.save(author=self.request.user)
+        record_revision(solution, self.request.user)
+
+    def perform_update(self, serializer):
+        previous_content = serializer.instance.content
+        solution = serializer.save()
+        record_revision(solution, self.request.user, previous=previous_content)
 
 
 #----------------------------COMMENT-------------------------------
-class CommentViewSet(VoteMixin, viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+class CommentViewSet(PreloadMixin, VoteMixin, ReportMixin, viewsets.ModelViewSet):
+    queryset = visible_comments()
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = PageSizePagination
+
+    def preload(self, objects):
+        preload_comments(objects, self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            comment = serializer.save(author=self.request.user)
+            notify_comment(comment)
+            publish_comment(comment)
+
+
+#----------------------------VOTE BATCH-------------------------------
+
+class VoteViewSet(viewsets.ViewSet):
+    permission_classes = [permissions.IsAuthenticated]
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        serializer = VoteBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            results = apply_votes(request.user, serializer.validated_data['votes'])
+        except LookupError as error:
+            return Response({'error': 'Unknown targets', 'missing': error.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': results})
+
+
+#----------------------------LIVE UPDATES-------------------------------
+
+async def exercise_events(request, pk):
+    """
+    Server-Sent Events stream of vote and comment deltas for one exercise.
+    Needs the ASGI application: a WSGI worker would be held for the whole
+    life of the connection.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Live updates are served by the ASGI application'}, status=501)
+    if not await Exercise.objects.filter(pk=pk, is_hidden=False).aexists():
+        return JsonResponse({'error': 'Not found'}, status=404)
+
+    subscription = get_broker().subscribe(exercise_channel(pk))
+    response = StreamingHttpResponse(event_stream(subscription), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+#----------------------------IMAGES-------------------------------
+
+class ImageUploadView(views.APIView):
+    """
+    Store an uploaded image by content hash (things/images.py).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Must be set before anything (including the CSRF check) reads the body
+        self.upload_handler = HashingUploadHandler(request)
+        request.upload_handlers = [self.upload_handler]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Temporary files are left behind by rejected or failed requests too
+        self.upload_handler.discard_all()
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def post(self, request):
+        upload = request.FILES.get('image')
+        if 'image' in self.upload_handler.rejected:
+            return Response(
+                {'error': f'Image larger than {settings.IMAGE_UPLOAD_MAX_SIZE} bytes'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        if upload is None:
+            return Response({'error': 'No image provided'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            image, created = store_upload(upload, request.user)
+        except ValueError as error:
+            return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = UploadedImageSerializer(image, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+def serve_image(request, path):
+    # Paths are content hashes: a stored file never changes
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
+
+
+#----------------------------MODERATION-------------------------------
+
+class ModerationPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class ReportSummaryViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Moderation queue: reported objects, most reported first.
+    """
+    serializer_class = ReportSummarySerializer
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = ModerationPagination
+
+    def get_queryset(self):
+        status_filter = self.request.query_params.get('status', ReportSummary.OPEN)
+        return ReportSummary.objects.filter(status=status_filter).select_related(
+            'content_type'
+        ).order_by('-report_count', '-last_reported_at')
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        bulk_action = BULK_ACTIONS.get(request.data.get('action'))
+        ids = request.data.get('ids')
+
+        if bulk_action is None:
+            return Response({'error': 'Invalid action'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(ids, list) or not all(isinstance(id, int) for id in ids):
+            return Response({'error': 'ids must be a list of report summary ids'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'processed': bulk_action(ids)})
 
 
 #----------------------------LESSON-------------------------------
@@ -340,7 +696,7 @@ class LessonViewSet(VoteMixin, viewsets.ModelViewSet):
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data)
-        print(serializer.is_valid(raise_exception=True))
+        serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
         return Response(serializer.data)
 
@@ -358,38 +714,6 @@ class LessonViewSet(VoteMixin, viewsets.ModelViewSet):
             raise PermissionDenied("You must be logged in to create an exercise.")
         serializer.save()
 
-    @action(detail=True, methods=['post'])
-    def vote(self, request, pk=None):
-        exercise = self.get_object()
-        vote_value = request.data.get('value')
-
-        logger.info(f"Vote request for Exercise ID {exercise.id} with vote value: {vote_value}")
-        logger.info(f"Request data: {request.data}")
-
-        if vote_value not in [Vote.UP, Vote.DOWN, Vote.UNVOTE]:
-            logger.error(f"Invalid vote value: {vote_value} for Exercise ID {exercise.id}")
-            return Response(
-                {'error': 'Invalid vote value'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        vote, created = Vote.objects.get_or_create(
-            user=request.user,
-            content_type=ContentType.objects.get_for_model(exercise),
-            object_id=exercise.id,
-            defaults={'value': vote_value}
-        )
-
-        if not created:
-            if vote_value == Vote.UNVOTE:
-                vote.delete()
-            elif vote.value != vote_value:
-                vote.value = vote_value
-                vote.save()
-        # Refresh the exercise object to get updated vote count
-        exercise.refresh_from_db()
-        return Response(self.get_serializer(exercise).data)
-
     @action(detail=True, methods=['post'])
     def comment(self, request, pk=None):
         exercise = self.get_object()
@@ -397,8 +721,7 @@ class LessonViewSet(VoteMixin, viewsets.ModelViewSet):
             data=request.data,
             context={'request': request}
         )
-        logger.info(f"Comment request for Exercise ID {exercise.id}")
-        logger.info(f"Request data: {request.data}")
+        logger.info("Comment request for Exercise ID %s", exercise.id)
         if serializer.is_valid():
             serializer.save(
                 exercise=exercise,
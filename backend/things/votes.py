@@ -0,0 +1,215 @@
+"""
+Vote writes.
+
+A vote is applied with a single statement: an INSERT ... ON CONFLICT DO
+UPDATE on (user, content_type, object_id) for up/down votes, a DELETE for
+unvotes. Concurrent requests from the same user therefore cannot trip over
+the unique constraint. Callers get back only the new score and the user's
+vote, read with one aggregate over the (content_type, object_id) index;
+exercise scores are also copied to Exercise.vote_score, the indexed sort key.
+New scores on exercises and on their solutions and comments are published
+to the exercise's live channel after commit, and the exercise's cached
+detail is invalidated (the upsert sends no post_save signal). Votes on
+exercises change their author's reputation: the user's previous votes on
+the targets are read (and locked) first and only the difference is passed
+to users/reputation.py.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Case, IntegerField, Q, Sum, Value, When
+
+from .fragments import invalidate_on_commit
+from .live import publish_votes
+from .models import Exercise, Solution, Comment, Vote
+from users.reputation import record_reputation, upvote_delta
+
+
+VOTE_VALUES = (Vote.UP, Vote.DOWN, Vote.UNVOTE)
+BATCH_LIMIT = 100
+
+VOTE_TARGETS = {
+    'exercise': Exercise,
+    'solution': Solution,
+    'comment': Comment,
+}
+TARGET_KINDS = {model: kind for kind, model in VOTE_TARGETS.items()}
+
+
+def exercise_id_of(obj):
+    return obj.pk if isinstance(obj, Exercise) else obj.exercise_id
+
+
+def target_fields(model):
+    """
+    Fields besides the id that apply_vote reads from a target of `model`.
+    """
+    if model is Exercise:
+        return ('author_id', 'subject_id')
+    return ('exercise',) if model in (Solution, Comment) else ()
+
+
+#----------------------------WRITES-------------------------------
+
+def _upsert(votes):
+    Vote.objects.bulk_create(
+        votes,
+        update_conflicts=True,
+        unique_fields=['user', 'content_type', 'object_id'],
+        update_fields=['value', 'updated_at'],
+    )
+
+
+def _unvote(user, targets):
+    """
+    Delete the user's votes on `targets`, a list of (content_type_id, object_id).
+    """
+    condition = Q()
+    for content_type_id, object_id in targets:
+        condition |= Q(content_type_id=content_type_id, object_id=object_id)
+    Vote.objects.filter(condition, user=user).delete()
+
+
+def _previous_votes(user, targets):
+    """
+    Return {(content_type_id, object_id): value} of the user's current votes
+    on `targets`, locking them until the end of the transaction.
+    """
+    if not targets:
+        return {}
+    condition = Q()
+    for content_type_id, object_id in targets:
+        condition |= Q(content_type_id=content_type_id, object_id=object_id)
+    rows = Vote.objects.select_for_update().filter(condition, user=user).values_list(
+        'content_type_id', 'object_id', 'value'
+    )
+    return {(content_type_id, object_id): value for content_type_id, object_id, value in rows}
+
+
+def scores(targets):
+    """
+    Return {(content_type_id, object_id): score} for the given targets.
+    """
+    condition = Q()
+    for content_type_id, object_id in targets:
+        condition |= Q(content_type_id=content_type_id, object_id=object_id)
+    totals = {target: 0 for target in targets}
+    rows = Vote.objects.filter(condition).values('content_type_id', 'object_id').annotate(score=Sum('value'))
+    for row in rows:
+        totals[(row['content_type_id'], row['object_id'])] = row['score'] or 0
+    return totals
+
+
+def _store_exercise_scores(exercise_scores):
+    """
+    Copy {exercise_id: score} to Exercise.vote_score with one UPDATE.
+    """
+    if not exercise_scores:
+        return
+    Exercise.objects.filter(id__in=list(exercise_scores)).update(vote_score=Case(
+        *[When(id=exercise_id, then=Value(score)) for exercise_id, score in exercise_scores.items()],
+        output_field=IntegerField(),
+    ))
+
+
+def apply_vote(user, obj, value):
+    """
+    Set the user's vote on `obj` and return (score, user_vote).
+    """
+    content_type = ContentType.objects.get_for_model(obj)
+    target = (content_type.id, obj.pk)
+    with transaction.atomic():
+        if isinstance(obj, Exercise):
+            previous = _previous_votes(user, [target]).get(target)
+        if value == Vote.UNVOTE:
+            _unvote(user, [target])
+        else:
+            _upsert([Vote(user=user, content_type=content_type, object_id=obj.pk, value=value)])
+        score = scores([target])[target]
+        if isinstance(obj, Exercise):
+            _store_exercise_scores({obj.pk: score})
+            record_reputation([(obj.author_id, obj.subject_id, upvote_delta(previous, value))])
+        kind = TARGET_KINDS.get(type(obj))
+        if kind is not None:
+            publish_votes([(exercise_id_of(obj), kind, obj.pk, score)])
+            invalidate_on_commit([exercise_id_of(obj)])
+    return score, value
+
+
+#----------------------------BATCH-------------------------------
+
+def apply_votes(user, items):
+    """
+    Apply many votes in one transaction. `items` are dicts with `type`
+    (a VOTE_TARGETS key), `id` and `value`; when the same target appears
+    twice the last vote wins. Targets that do not exist or are hidden raise
+    LookupError listing them, and nothing is written.
+
+    Returns one {type, id, vote_count, user_vote} dict per distinct target.
+    """
+    latest = {}
+    for item in items:
+        latest[(item['type'], item['id'])] = item['value']
+
+    ids_by_type = {}
+    for kind, object_id in latest:
+        ids_by_type.setdefault(kind, set()).add(object_id)
+
+    content_types = ContentType.objects.get_for_models(*[VOTE_TARGETS[kind] for kind in ids_by_type])
+    missing, exercise_ids, exercise_authors = [], {}, {}
+    for kind, object_ids in ids_by_type.items():
+        targets = VOTE_TARGETS[kind].objects.filter(id__in=object_ids, is_hidden=False)
+        if kind == 'exercise':
+            rows = targets.values_list('id', 'author_id', 'subject_id')
+            exercise_authors = {object_id: (author_id, subject_id) for object_id, author_id, subject_id in rows}
+            found = {object_id: object_id for object_id in exercise_authors}
+        else:
+            found = dict(targets.values_list('id', 'exercise_id'))
+        exercise_ids.update(((kind, object_id), exercise_id) for object_id, exercise_id in found.items())
+        missing.extend({'type': kind, 'id': object_id} for object_id in sorted(object_ids - set(found)))
+    if missing:
+        raise LookupError(missing)
+
+    def target(kind, object_id):
+        return content_types[VOTE_TARGETS[kind]].id, object_id
+
+    upserts, unvotes = [], []
+    for (kind, object_id), value in latest.items():
+        if value == Vote.UNVOTE:
+            unvotes.append(target(kind, object_id))
+        else:
+            upserts.append(Vote(
+                user=user,
+                content_type_id=target(kind, object_id)[0],
+                object_id=object_id,
+                value=value,
+            ))
+
+    with transaction.atomic():
+        previous = _previous_votes(user, [target('exercise', object_id) for object_id in exercise_authors])
+        if unvotes:
+            _unvote(user, unvotes)
+        if upserts:
+            _upsert(upserts)
+        totals = scores([target(kind, object_id) for kind, object_id in latest])
+        _store_exercise_scores({
+            object_id: totals[target(kind, object_id)] for kind, object_id in latest if kind == 'exercise'
+        })
+        record_reputation([
+            (*exercise_authors[object_id], upvote_delta(previous.get(target(kind, object_id)), value))
+            for (kind, object_id), value in latest.items() if kind == 'exercise'
+        ])
+        publish_votes([
+            (exercise_ids[key], key[0], key[1], totals[target(*key)]) for key in latest
+        ])
+        invalidate_on_commit(exercise_ids.values())
+
+    return [
+        {
+            'type': kind,
+            'id': object_id,
+            'vote_count': totals[target(kind, object_id)],
+            'user_vote': value,
+        }
+        for (kind, object_id), value in latest.items()
+    ]
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.recommendations import FEED_SIZE, build_recommendations, build_stale_recommendations
+
+
+class Command(BaseCommand):
+    help = "Recompute the personalized exercise feed of every user with some history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-n', type=int, default=FEED_SIZE)
+        parser.add_argument('--users-per-batch', type=int, default=500)
+        parser.add_argument('--stale', action='store_true', help="Only recompute the feeds marked stale")
+        parser.add_argument('--loop', action='store_true', help="With --stale, keep polling instead of exiting")
+        parser.add_argument('--interval', type=int, default=60, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        if not options['stale']:
+            users = build_recommendations(top_n=options['top_n'], users_per_batch=options['users_per_batch'])
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt recommendations for {users} users"))
+            return
+
+        while True:
+            users = build_stale_recommendations(top_n=options['top_n'], users_per_batch=options['users_per_batch'])
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt stale recommendations for {users} users"))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users.reputation import rebuild_reputation
+
+
+class Command(BaseCommand):
+    help = "Recount every user's reputation from the votes and reload the leaderboards"
+
+    def handle(self, *args, **options):
+        users = rebuild_reputation()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt reputation of {users} users"))
@@ -0,0 +1,35 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from users.notifications import BATCH_SIZE, DIGEST_DELAY, purge_processed, send_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver pending notification events as per-user email digests"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--delay', type=int, default=int(DIGEST_DELAY.total_seconds()),
+                            help="Seconds an event waits so later events join the same digest")
+        parser.add_argument('--loop', action='store_true', help="Keep polling instead of exiting when drained")
+        parser.add_argument('--interval', type=int, default=30, help="Seconds between polls with --loop")
+        parser.add_argument('--purge-days', type=int, default=7, help="Delete events processed this long ago")
+
+    def handle(self, *args, **options):
+        delay = timedelta(seconds=options['delay'])
+        while True:
+            events = sent = 0
+            while True:
+                processed, emails = send_batch(options['batch_size'], delay)
+                events, sent = events + processed, sent + emails
+                if processed < options['batch_size']:
+                    break
+            purged = purge_processed(timedelta(days=options['purge_days']))
+            self.stdout.write(self.style.SUCCESS(
+                f"Processed {events} events, sent {sent} digests, purged {purged} old events"
+            ))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
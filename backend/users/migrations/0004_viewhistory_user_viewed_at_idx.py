@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-19 16:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_notificationevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='viewhistory',
+            index=models.Index(fields=['user', '-viewed_at'], name='users_viewh_user_id_332113_idx'),
+        ),
+    ]
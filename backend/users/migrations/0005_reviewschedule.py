@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('things', '0011_sync_models'),
+        ('users', '0004_viewhistory_user_viewed_at_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_due', models.DateTimeField()),
+                ('interval_days', models.PositiveIntegerField(default=0)),
+                ('ease_factor', models.FloatField(default=2.5)),
+                ('repetitions', models.PositiveIntegerField(default=0)),
+                ('last_grade', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('last_reviewed_at', models.DateTimeField(blank=True, null=True)),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='things.exercise')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='review_schedule', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', 'next_due'],
+                'indexes': [models.Index(fields=['user', 'next_due'], name='users_revie_user_id_e28bdf_idx')],
+                'unique_together': {('user', 'exercise')},
+            },
+        ),
+    ]
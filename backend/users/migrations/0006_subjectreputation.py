@@ -0,0 +1,73 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+# things.models.Vote.UP
+UPVOTE = 1
+BATCH_SIZE = 500
+
+
+def backfill_reputation(apps, schema_editor):
+    """
+    Count the upvotes on every author's exercises, overall and per subject.
+    """
+    Exercise = apps.get_model('things', 'Exercise')
+    Vote = apps.get_model('things', 'Vote')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    UserProfile = apps.get_model('users', 'UserProfile')
+    SubjectReputation = apps.get_model('users', 'SubjectReputation')
+
+    content_type = ContentType.objects.filter(app_label='things', model='exercise').first()
+    if content_type is None:
+        return
+    upvotes = dict(
+        Vote.objects.filter(content_type=content_type, value=UPVOTE).order_by().values('object_id')
+        .annotate(total=Count('id')).values_list('object_id', 'total')
+    )
+
+    by_user, by_subject = {}, {}
+    exercises = Exercise.objects.filter(id__in=list(upvotes)).values_list('id', 'author_id', 'subject_id')
+    for exercise_id, author_id, subject_id in exercises.iterator():
+        by_user[author_id] = by_user.get(author_id, 0) + upvotes[exercise_id]
+        if subject_id is not None:
+            key = (author_id, subject_id)
+            by_subject[key] = by_subject.get(key, 0) + upvotes[exercise_id]
+
+    profiles = list(UserProfile.objects.only('id', 'user_id', 'reputation'))
+    for profile in profiles:
+        profile.reputation = by_user.get(profile.user_id, 0)
+    UserProfile.objects.bulk_update(profiles, ['reputation'], batch_size=BATCH_SIZE)
+    SubjectReputation.objects.bulk_create([
+        SubjectReputation(user_id=user_id, subject_id=subject_id, reputation=reputation)
+        for (user_id, subject_id), reputation in by_subject.items()
+    ], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('things', '0011_sync_models'),
+        ('users', '0005_reviewschedule'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubjectReputation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reputation', models.IntegerField(default=0)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='things.subject')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subject_reputations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['subject', 'reputation'], name='users_subje_subject_2fd9d3_idx')],
+                'unique_together': {('user', 'subject')},
+            },
+        ),
+        migrations.RunPython(backfill_reputation, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from things.models import Exercise
+from things.models import Exercise, Subject, Vote
 
 
 #----------------------------USERPROFILE-------------------------------
@@ -21,20 +22,33 @@ class UserProfile(models.Model):
     level = models.IntegerField(default=1)
     experience_points = models.IntegerField(default=0)
 
+    # Set for a whole page of authors at once by things/preload.py
+    stats = None
+
     def __str__(self):
         return f"{self.user.username}'s profile"
 
     @property
     def total_contributions(self):
+        if self.stats is not None:
+            return self.stats['total_contributions']
         return self.user.exercises.count()
 
     @property
     def total_upvotes_received(self):
-        return sum(exercise.upvotes.count() for exercise in self.user.exercises.all())
+        if self.stats is not None:
+            return self.stats['total_upvotes_received']
+        return Vote.objects.filter(
+            content_type=ContentType.objects.get_for_model(Exercise),
+            object_id__in=self.user.exercises.values('id'),
+            value=Vote.UP,
+        ).count()
 
     @property
     def total_comments(self):
-        return self.user.comment_set.count()
+        if self.stats is not None:
+            return self.stats['total_comments']
+        return self.user.comments.count()
 
     @property
     def level_progress(self):
@@ -57,7 +71,115 @@ class ViewHistory(models.Model):
     class Meta:
         ordering = ['-viewed_at']
         unique_together = ['user', 'content']
+        indexes = [
+            models.Index(fields=['user', '-viewed_at']),
+        ]
+
+
+
+#----------------------------REPUTATION-------------------------------
+
+class SubjectReputation(models.Model):
+    """
+    A user's reputation within one subject, kept up to date by
+    users/reputation.py.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='subject_reputations')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='+')
+    reputation = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'subject')
+        indexes = [
+            models.Index(fields=['subject', 'reputation']),
+        ]
+
+
+
+#----------------------------RECOMMENDATIONS-------------------------------
+
+class Recommendation(models.Model):
+    """
+    Precomputed "next exercises" feed of a user, see users/recommendations.py.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['user', 'rank']
+        unique_together = ('user', 'exercise')
+        indexes = [
+            models.Index(fields=['user', 'rank']),
+        ]
+
 
+class StaleFeed(models.Model):
+    """
+    A user whose feed no longer reflects their history, waiting for
+    `manage.py build_recommendations --stale`.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    marked_at = models.DateTimeField()
+
+
+
+#----------------------------REVIEWS-------------------------------
+
+class ReviewSchedule(models.Model):
+    """
+    When a user should next review an exercise they completed, see
+    users/reviews.py.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='review_schedule')
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='+')
+    next_due = models.DateTimeField()
+    interval_days = models.PositiveIntegerField(default=0)
+    ease_factor = models.FloatField(default=2.5)
+    repetitions = models.PositiveIntegerField(default=0)
+    last_grade = models.PositiveSmallIntegerField(null=True, blank=True)
+    last_reviewed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['user', 'next_due']
+        unique_together = ('user', 'exercise')
+        indexes = [
+            models.Index(fields=['user', 'next_due']),
+        ]
+
+
+
+#----------------------------NOTIFICATIONS-------------------------------
+
+class NotificationEvent(models.Model):
+    """
+    Transactional outbox: written in the same transaction as the comment or
+    lesson change it reports, delivered later by users/notifications.py.
+    """
+    COMMENT = 'comment'
+    LESSON_UPDATE = 'lesson_update'
+
+    KIND_CHOICES = [
+        (COMMENT, 'Comment'),
+        (LESSON_UPDATE, 'Lesson update'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    comment = models.ForeignKey('things.Comment', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    lesson = models.ForeignKey('things.Lesson', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(processed_at__isnull=True),
+                name='users_notification_pending_idx',
+            ),
+        ]
 
 
 #----------------------------CREATE USER PROFILE (TOCHANGE)-------------------------------
@@ -72,7 +194,11 @@ def create_user_profile(sender, instance, created, **kwargs):
 #----------------------------SAVE USER PROFILE (TOCHANGE)-------------------------------
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, update_fields=None, **kwargs):
+    # Partial saves (e.g. last_login on every login) change nothing the
+    # related rows hold; re-saving them would fire their receivers for nothing
+    if update_fields is not None:
+        return
     if hasattr(instance, 'profile'):
         instance.profile.save()
     if hasattr(instance, 'notification_settings'):
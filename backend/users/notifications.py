@@ -0,0 +1,188 @@
+"""
+Notification outbox.
+
+Write paths only insert a NotificationEvent inside their own transaction, so
+a comment or lesson change and its notification commit or roll back
+together and no request waits on SMTP. The worker (`manage.py
+send_notifications`) takes pending events in batches, resolves their
+recipients with a few bulk queries, drops those whose NotificationSettings
+opt out, coalesces everything a recipient got into one digest and sends the
+whole batch over a single mail connection.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from config import metrics
+from things.models import Comment, Lesson
+from .models import NotificationEvent, NotificationSettings, ViewHistory
+
+
+logger = logging.getLogger('django')
+
+BATCH_SIZE = 500
+# Events younger than this wait for the next run, so bursts end up in one digest
+DIGEST_DELAY = timedelta(minutes=5)
+
+
+#----------------------------OUTBOX-------------------------------
+
+def notify_comment(comment):
+    """
+    Record a new comment. Call inside the transaction that saved it.
+    """
+    return NotificationEvent.objects.create(
+        kind=NotificationEvent.COMMENT, actor_id=comment.author_id, comment=comment
+    )
+
+
+def notify_lesson_update(lesson):
+    """
+    Record a created or edited lesson. Called by the Lesson post_save receiver
+    (things/signals.py), inside the transaction that saved it.
+    """
+    return NotificationEvent.objects.create(
+        kind=NotificationEvent.LESSON_UPDATE, actor_id=lesson.author_id, lesson=lesson
+    )
+
+
+#----------------------------RECIPIENTS-------------------------------
+
+def _comment_lines(events):
+    """
+    Yield (recipient_id, setting, line) for comment events: the author of
+    the parent comment for replies, and the exercise author.
+    """
+    comments = {
+        row['id']: row
+        for row in Comment.objects.filter(id__in=[event.comment_id for event in events]).values(
+            'id', 'author_id', 'author__username', 'exercise_id', 'exercise__title',
+            'exercise__author_id', 'parent__author_id',
+        )
+    }
+    for event in events:
+        comment = comments.get(event.comment_id)
+        if comment is None:
+            continue
+        link = f"{settings.FRONTEND_URL}/exercises/{comment['exercise_id']}"
+        actor, title = comment['author__username'], comment['exercise__title']
+
+        recipients = {}
+        if comment['parent__author_id'] is not None:
+            recipients[comment['parent__author_id']] = f'{actor} replied to your comment on "{title}": {link}'
+        recipients.setdefault(
+            comment['exercise__author_id'], f'{actor} commented on your exercise "{title}": {link}'
+        )
+        for recipient_id, line in recipients.items():
+            if recipient_id != comment['author_id']:
+                yield recipient_id, 'exercise_replies', line
+
+
+def _lesson_lines(events):
+    """
+    Yield (recipient_id, setting, line) for lesson events: learners who have
+    worked on exercises covering the lesson's theorems.
+    """
+    actors = defaultdict(set)
+    for event in events:
+        actors[event.lesson_id].add(event.actor_id)
+
+    titles = dict(Lesson.objects.filter(id__in=list(actors)).values_list('id', 'title'))
+    learners = ViewHistory.objects.filter(content__theorems__lessons__in=list(titles)).values_list(
+        'user_id', 'content__theorems__lessons'
+    ).distinct()
+    for user_id, lesson_id in learners.iterator():
+        if user_id not in actors[lesson_id]:
+            yield user_id, 'lesson_updates', f'The lesson "{titles[lesson_id]}" was updated'
+
+
+LINE_BUILDERS = {
+    NotificationEvent.COMMENT: _comment_lines,
+    NotificationEvent.LESSON_UPDATE: _lesson_lines,
+}
+
+
+def build_digests(events):
+    """
+    Return {user: [lines]} for the recipients of `events` whose settings
+    allow them, one entry per recipient whatever the number of events.
+    """
+    by_kind = defaultdict(list)
+    for event in events:
+        by_kind[event.kind].append(event)
+
+    pending = defaultdict(dict)
+    for kind, kind_events in by_kind.items():
+        for recipient_id, setting, line in LINE_BUILDERS[kind](kind_events):
+            # dict keeps order and drops repeats (a lesson edited twice)
+            pending[recipient_id][line] = setting
+    if not pending:
+        return {}
+
+    # Users without a settings row get the model defaults
+    defaults = NotificationSettings()
+    preferences = {
+        row.user_id: row for row in NotificationSettings.objects.filter(user_id__in=list(pending))
+    }
+    users = User.objects.filter(id__in=list(pending)).exclude(email='').only('id', 'username', 'email')
+
+    digests = {}
+    for user in users:
+        preference = preferences.get(user.id, defaults)
+        if not preference.email_notifications:
+            continue
+        lines = [line for line, setting in pending[user.id].items() if getattr(preference, setting)]
+        if lines:
+            digests[user] = lines
+    return digests
+
+
+#----------------------------DELIVERY-------------------------------
+
+def _message(user, lines, connection):
+    subject = 'New activity on Fidni' if len(lines) == 1 else f'{len(lines)} new notifications on Fidni'
+    body = '\n'.join([f'Hello {user.username},', ''] + [f'- {line}' for line in lines])
+    return EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [user.email], connection=connection)
+
+
+def send_batch(batch_size=BATCH_SIZE, delay=DIGEST_DELAY):
+    """
+    Deliver one batch of pending events. Events are marked processed in the
+    same transaction that locked them, so a failed send leaves them pending
+    for the next run. Returns (events processed, emails sent).
+    """
+    with transaction.atomic():
+        events = list(
+            NotificationEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True, created_at__lte=timezone.now() - delay)
+            .order_by('created_at')[:batch_size]
+        )
+        if not events:
+            return 0, 0
+
+        digests = build_digests(events)
+        sent = 0
+        if digests:
+            connection = get_connection()
+            messages = [_message(user, lines, connection) for user, lines in digests.items()]
+            # One connection for the whole batch instead of one per message
+            sent = connection.send_messages(messages) or 0
+
+        NotificationEvent.objects.filter(id__in=[event.id for event in events]).update(processed_at=timezone.now())
+    metrics.observe('buffer_flush_size', len(events), buffer='notifications')
+    logger.info("Processed %d notification events, sent %d digests", len(events), sent)
+    return len(events), sent
+
+
+def purge_processed(older_than=timedelta(days=7)):
+    deleted, _ = NotificationEvent.objects.filter(
+        processed_at__lt=timezone.now() - older_than
+    ).delete()
+    return deleted
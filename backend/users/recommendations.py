@@ -0,0 +1,264 @@
+"""
+Personalized "next exercises" feed.
+
+For each learner, candidate exercises are drawn from the chapters of the
+subjects they have worked in. A candidate scores higher when its chapter is
+one the learner is active in, when that chapter is still poorly covered by
+their completions, when its difficulty is one step above what they have
+recently completed, and when they opened it without finishing it. Completed
+exercises are never recommended. Results are stored in Recommendation and
+served by rank.
+
+Completing an exercise only marks the user's feed stale (one upsert in the
+request's transaction); `manage.py build_recommendations --stale`, run
+periodically or with --loop, recomputes the marked feeds in batches
+against a single corpus load.
+"""
+
+from collections import defaultdict
+
+import numpy as np
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from things.models import Chapter, Exercise, Vote
+from .models import Recommendation, StaleFeed, ViewHistory
+
+
+FEED_SIZE = 50
+
+INTEREST_WEIGHT = 1.0
+GAP_WEIGHT = 1.5
+DIFFICULTY_WEIGHT = 1.0
+RESUME_WEIGHT = 0.5
+
+DIFFICULTY_LEVELS = {'easy': 0, 'medium': 1, 'hard': 2}
+# How far above the recent completion level the feed aims
+DIFFICULTY_STEP = 0.5
+RECENT_COMPLETIONS = 10
+
+
+#----------------------------CORPUS-------------------------------
+
+class Corpus:
+    """
+    Exercise/chapter links grouped by chapter (CSR layout), plus the subject
+    of every chapter and the difficulty of every exercise.
+    """
+    def __init__(self, links, chapter_subjects, difficulties):
+        self.chapter_subjects = chapter_subjects
+        self.chapters_by_subject = defaultdict(list)
+        for chapter_id, subject_id in chapter_subjects.items():
+            self.chapters_by_subject[subject_id].append(chapter_id)
+
+        links = np.array(sorted(links, key=lambda link: link[1]), dtype=np.int64).reshape(-1, 2)
+        self.link_exercises = links[:, 0]
+        chapter_ids, starts, counts = np.unique(links[:, 1], return_index=True, return_counts=True)
+        self.slices = {
+            chapter_id: (start, start + count)
+            for chapter_id, start, count in zip(chapter_ids.tolist(), starts.tolist(), counts.tolist())
+        }
+
+        self.chapters_by_exercise = defaultdict(list)
+        for exercise_id, chapter_id in links.tolist():
+            self.chapters_by_exercise[exercise_id].append(chapter_id)
+
+        size = max(difficulties, default=0) + 1
+        self.difficulties = np.full(size, DIFFICULTY_LEVELS['medium'], dtype=np.float64)
+        for exercise_id, difficulty in difficulties.items():
+            self.difficulties[exercise_id] = DIFFICULTY_LEVELS.get(difficulty, DIFFICULTY_LEVELS['medium'])
+
+    @classmethod
+    def load(cls, subject_ids=None):
+        chapters = Chapter.objects.all()
+        if subject_ids is not None:
+            chapters = chapters.filter(subject_id__in=subject_ids)
+        chapter_subjects = dict(chapters.values_list('id', 'subject_id'))
+
+        # Hidden exercises are never candidates
+        links = Exercise.chapters.through.objects.filter(
+            chapter_id__in=list(chapter_subjects), exercise__is_hidden=False
+        )
+        links = list(links.values_list('exercise_id', 'chapter_id').iterator())
+
+        exercise_ids = {exercise_id for exercise_id, _ in links}
+        difficulties = dict(
+            Exercise.objects.filter(id__in=exercise_ids).values_list('id', 'difficulty').iterator()
+        )
+        return cls(links, chapter_subjects, difficulties)
+
+    def chapter_size(self, chapter_id):
+        start, end = self.slices.get(chapter_id, (0, 0))
+        return end - start
+
+    def links_for(self, chapter_ids):
+        """
+        Return parallel arrays (exercise ids, chapter ids) for the given chapters.
+        """
+        exercises, chapters = [], []
+        for chapter_id in chapter_ids:
+            if chapter_id in self.slices:
+                start, end = self.slices[chapter_id]
+                exercises.append(self.link_exercises[start:end])
+                chapters.append(np.full(end - start, chapter_id, dtype=np.int64))
+        if not exercises:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(exercises), np.concatenate(chapters)
+
+
+#----------------------------SCORING-------------------------------
+
+def recommend(corpus, viewed, completed, upvoted, top_n=FEED_SIZE):
+    """
+    `viewed` and `upvoted` are sets of exercise ids, `completed` a list of
+    exercise ids from most to least recent. Returns (exercise_id, score) pairs.
+    """
+    completed_set = set(completed)
+    touched = viewed | completed_set | upvoted
+
+    activity = defaultdict(int)
+    completions = defaultdict(int)
+    for exercise_id in touched:
+        for chapter_id in corpus.chapters_by_exercise.get(exercise_id, ()):
+            activity[chapter_id] += 1
+            if exercise_id in completed_set:
+                completions[chapter_id] += 1
+    if not activity:
+        return []
+
+    subjects = {corpus.chapter_subjects[chapter_id] for chapter_id in activity}
+    chapter_ids = [
+        chapter_id for subject_id in subjects for chapter_id in corpus.chapters_by_subject[subject_id]
+    ]
+
+    # Per-chapter part of the score: activity share plus coverage gap
+    most_active = max(activity.values())
+    chapter_score = {
+        chapter_id: (
+            INTEREST_WEIGHT * activity.get(chapter_id, 0) / most_active
+            + GAP_WEIGHT * (1 - completions.get(chapter_id, 0) / max(corpus.chapter_size(chapter_id), 1))
+        )
+        for chapter_id in chapter_ids
+    }
+
+    exercise_ids, link_chapters = corpus.links_for(chapter_ids)
+    if not len(exercise_ids):
+        return []
+    link_scores = np.array([chapter_score[chapter_id] for chapter_id in link_chapters.tolist()])
+
+    # An exercise in several chapters keeps its best chapter score
+    candidates, inverse = np.unique(exercise_ids, return_inverse=True)
+    scores = np.full(len(candidates), -np.inf)
+    np.maximum.at(scores, inverse, link_scores)
+
+    recent = [corpus.difficulties[exercise_id] for exercise_id in completed[:RECENT_COMPLETIONS]
+              if exercise_id < len(corpus.difficulties)]
+    target = min(np.mean(recent) + DIFFICULTY_STEP, 2) if recent else DIFFICULTY_LEVELS['easy']
+    scores += DIFFICULTY_WEIGHT * (1 - np.abs(corpus.difficulties[candidates] - target) / 2)
+
+    started = np.fromiter(viewed - completed_set, dtype=np.int64)
+    scores += RESUME_WEIGHT * np.isin(candidates, started)
+
+    keep = ~np.isin(candidates, np.fromiter(completed_set, dtype=np.int64))
+    candidates, scores = candidates[keep], np.round(scores[keep], 6)
+
+    if len(candidates) > top_n:
+        best = np.argpartition(-scores, top_n)[:top_n]
+        candidates, scores = candidates[best], scores[best]
+
+    order = np.lexsort((candidates, -scores))
+    return list(zip(candidates[order].tolist(), scores[order].tolist()))
+
+
+#----------------------------HISTORY-------------------------------
+
+def _load_histories(user_ids=None):
+    """
+    Return {user_id: (viewed set, completed list newest first, upvoted set)}.
+    """
+    history = ViewHistory.objects.order_by('user_id', '-viewed_at')
+    upvotes = Vote.objects.filter(content_type=ContentType.objects.get_for_model(Exercise), value=Vote.UP)
+    if user_ids is not None:
+        history = history.filter(user_id__in=user_ids)
+        upvotes = upvotes.filter(user_id__in=user_ids)
+
+    histories = defaultdict(lambda: (set(), [], set()))
+    for user_id, exercise_id, completed in history.values_list('user_id', 'content_id', 'completed').iterator():
+        viewed, completed_list, _ = histories[user_id]
+        viewed.add(exercise_id)
+        if completed:
+            completed_list.append(exercise_id)
+    for user_id, exercise_id in upvotes.values_list('user_id', 'object_id').iterator():
+        histories[user_id][2].add(exercise_id)
+    return histories
+
+
+def _to_rows(user_id, ranked):
+    return [
+        Recommendation(user_id=user_id, exercise_id=exercise_id, score=score, rank=rank)
+        for rank, (exercise_id, score) in enumerate(ranked)
+    ]
+
+
+#----------------------------BATCH-------------------------------
+
+def _store_feeds(corpus, histories, user_ids, top_n, users_per_batch, started):
+    """
+    Recompute and store the feeds of `user_ids`, clearing the stale marks
+    set before `started`; later marks wait for the next run.
+    """
+    for offset in range(0, len(user_ids), users_per_batch):
+        batch = user_ids[offset:offset + users_per_batch]
+        rows = []
+        for user_id in batch:
+            rows.extend(_to_rows(user_id, recommend(corpus, *histories[user_id], top_n=top_n)))
+        with transaction.atomic():
+            Recommendation.objects.filter(user_id__in=batch).delete()
+            Recommendation.objects.bulk_create(rows, batch_size=1000)
+            StaleFeed.objects.filter(user_id__in=batch, marked_at__lte=started).delete()
+
+
+def build_recommendations(top_n=FEED_SIZE, users_per_batch=500):
+    """
+    Recompute the feed of every user with some history. Returns the number
+    of users processed.
+    """
+    started = timezone.now()
+    corpus = Corpus.load()
+    histories = _load_histories()
+    user_ids = list(histories)
+    _store_feeds(corpus, histories, user_ids, top_n, users_per_batch, started)
+
+    # Users whose history disappeared keep no stale feed
+    Recommendation.objects.exclude(user_id__in=user_ids).delete()
+    StaleFeed.objects.filter(marked_at__lte=started).delete()
+    return len(user_ids)
+
+
+def build_stale_recommendations(top_n=FEED_SIZE, users_per_batch=500):
+    """
+    Recompute the feeds marked stale. Returns the number of users processed.
+    """
+    started = timezone.now()
+    user_ids = list(StaleFeed.objects.filter(marked_at__lte=started).values_list('user_id', flat=True))
+    if not user_ids:
+        return 0
+    histories = _load_histories(user_ids)
+    _store_feeds(Corpus.load(), histories, user_ids, top_n, users_per_batch, started)
+    return len(user_ids)
+
+
+#----------------------------INCREMENTAL-------------------------------
+
+def mark_stale(user_id):
+    """
+    Queue the user's feed for the next `build_recommendations --stale` run.
+    """
+    StaleFeed.objects.bulk_create(
+        [StaleFeed(user_id=user_id, marked_at=timezone.now())],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['marked_at'],
+    )
+
@@ -0,0 +1,335 @@
+"""
+Reputation and leaderboards.
+
+A user's reputation is the number of upvotes on the exercises they wrote,
+overall (UserProfile.reputation) and per subject (SubjectReputation). The
+vote write path (things/votes.py) passes the change each vote makes to
+`record_reputation`, which applies it with relative UPDATEs in the vote's
+transaction; nothing is recounted.
+
+Rankings are served by a leaderboard backend chosen with
+LEADERBOARD_BACKEND: a global board and one board per subject, each a
+sorted set of users with positive reputation. Rank lookups and top-N pages
+cost O(log n) (plus the page) whatever the number of users.
+LocalLeaderboard keeps the boards in memory and is only right for a single
+process (dev server, tests); RedisLeaderboard keeps them in Redis sorted
+sets shared by every worker.
+
+A board is loaded from the database the first time it is read. After a
+vote commits, the changed users' stored reputations are written to the
+boards already loaded. Both happen under the board's lock, and the values
+are read from the database inside it, so a vote landing while a board
+loads is neither lost nor counted twice. `rebuild_reputation` (the
+rebuild_reputation command) recounts everything from the votes and reloads
+every board, correcting any drift, e.g. after exercises are deleted or
+change subject.
+"""
+
+import bisect
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.utils.module_loading import import_string
+
+from things.models import Exercise, Subject, Vote
+from .models import SubjectReputation, UserProfile
+
+
+logger = logging.getLogger('django')
+
+GLOBAL_BOARD = 'global'
+UPDATE_BATCH = 500
+
+
+def subject_board(subject_id):
+    return f'subject:{subject_id}'
+
+
+#----------------------------BACKENDS-------------------------------
+
+class LocalLeaderboard:
+    """
+    In-process boards: a list sorted by (-reputation, user id) plus a
+    reputation per user. Rank is a bisection; updates shift the list.
+    """
+    def __init__(self, **options):
+        self._boards = {}
+        self._lock = threading.Lock()
+        self._board_locks = defaultdict(threading.Lock)
+
+    def lock(self, board):
+        with self._lock:
+            return self._board_locks[board]
+
+    def is_loaded(self, board):
+        return board in self._boards
+
+    def replace(self, board, scores):
+        entries = sorted((-score, user_id) for user_id, score in scores.items() if score > 0)
+        with self._lock:
+            self._boards[board] = (entries, {user_id: -score for score, user_id in entries})
+
+    def update(self, board, scores):
+        """
+        Set the reputation of some users; 0 or less takes them off the board.
+        """
+        with self._lock:
+            if board not in self._boards:
+                return
+            entries, current = self._boards[board]
+            for user_id, score in scores.items():
+                previous = current.pop(user_id, None)
+                if previous is not None:
+                    del entries[bisect.bisect_left(entries, (-previous, user_id))]
+                if score > 0:
+                    current[user_id] = score
+                    bisect.insort(entries, (-score, user_id))
+
+    def top(self, board, count, offset=0):
+        with self._lock:
+            entries, _ = self._boards.get(board, ([], {}))
+            return [(user_id, -score) for score, user_id in entries[offset:offset + count]]
+
+    def rank(self, board, user_id):
+        """
+        Return (1-based rank, reputation), or None when the user has none.
+        """
+        with self._lock:
+            entries, scores = self._boards.get(board, ([], {}))
+            score = scores.get(user_id)
+            if score is None:
+                return None
+            return bisect.bisect_left(entries, (-score, user_id)) + 1, score
+
+
+class RedisLeaderboard:
+    """
+    One Redis sorted set per board (ZADD, ZREVRANGE, ZREVRANK), a marker key
+    recording that the board was loaded and a Redis lock per board.
+    """
+    def __init__(self, url='redis://localhost:6379/0', prefix='fidni:leaderboard:', lock_timeout=60, **options):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+
+    def _key(self, board):
+        return self.prefix + board
+
+    def lock(self, board):
+        return self.client.lock(self._key('lock:' + board), timeout=self.lock_timeout)
+
+    def is_loaded(self, board):
+        return bool(self.client.exists(self._key('loaded:' + board)))
+
+    def replace(self, board, scores):
+        key = self._key(board)
+        mapping = {user_id: score for user_id, score in scores.items() if score > 0}
+        with self.client.pipeline() as pipe:
+            pipe.delete(key)
+            if mapping:
+                pipe.zadd(key, mapping)
+            pipe.set(self._key('loaded:' + board), 1)
+            pipe.execute()
+
+    def update(self, board, scores):
+        key = self._key(board)
+        positive = {user_id: score for user_id, score in scores.items() if score > 0}
+        removed = [user_id for user_id, score in scores.items() if score <= 0]
+        with self.client.pipeline() as pipe:
+            if positive:
+                pipe.zadd(key, positive)
+            if removed:
+                pipe.zrem(key, *removed)
+            pipe.execute()
+
+    def top(self, board, count, offset=0):
+        rows = self.client.zrevrange(self._key(board), offset, offset + count - 1, withscores=True)
+        return [(int(user_id), int(score)) for user_id, score in rows]
+
+    def rank(self, board, user_id):
+        with self.client.pipeline() as pipe:
+            pipe.zrevrank(self._key(board), user_id)
+            pipe.zscore(self._key(board), user_id)
+            position, score = pipe.execute()
+        if position is None:
+            return None
+        return position + 1, int(score)
+
+
+_leaderboard = None
+_leaderboard_lock = threading.Lock()
+
+
+def get_leaderboard():
+    global _leaderboard
+    with _leaderboard_lock:
+        if _leaderboard is None:
+            _leaderboard = import_string(settings.LEADERBOARD_BACKEND)(**settings.LEADERBOARD_OPTIONS)
+    return _leaderboard
+
+
+#----------------------------UPDATES-------------------------------
+
+def record_reputation(changes):
+    """
+    Apply reputation changes, a list of (author_id, subject_id, delta);
+    `subject_id` may be None. Must run inside the vote's transaction.
+    """
+    by_user, by_subject = defaultdict(int), defaultdict(int)
+    for author_id, subject_id, delta in changes:
+        by_user[author_id] += delta
+        if subject_id is not None:
+            by_subject[(author_id, subject_id)] += delta
+    by_user = {user_id: delta for user_id, delta in by_user.items() if delta}
+    by_subject = {key: delta for key, delta in by_subject.items() if delta}
+    if not by_user:
+        return
+
+    UserProfile.objects.filter(user_id__in=list(by_user)).update(reputation=F('reputation') + Case(
+        *[When(user_id=user_id, then=Value(delta)) for user_id, delta in by_user.items()],
+        output_field=IntegerField(),
+    ))
+    if by_subject:
+        SubjectReputation.objects.bulk_create(
+            [SubjectReputation(user_id=user_id, subject_id=subject_id) for user_id, subject_id in by_subject],
+            ignore_conflicts=True,
+        )
+        condition = Q()
+        for user_id, subject_id in by_subject:
+            condition |= Q(user_id=user_id, subject_id=subject_id)
+        SubjectReputation.objects.filter(condition).update(reputation=F('reputation') + Case(
+            *[When(user_id=user_id, subject_id=subject_id, then=Value(delta))
+              for (user_id, subject_id), delta in by_subject.items()],
+            output_field=IntegerField(),
+        ))
+
+    def update_boards():
+        try:
+            boards = defaultdict(set)
+            boards[GLOBAL_BOARD].update(by_user)
+            for user_id, subject_id in by_subject:
+                boards[subject_board(subject_id)].add(user_id)
+            for board, user_ids in boards.items():
+                _update_board(board, user_ids)
+        except Exception:
+            # The database is right: the rebuild command resynchronises the boards
+            logger.exception("Updating the leaderboards failed")
+
+    transaction.on_commit(update_boards)
+
+
+def upvote_delta(old, new):
+    """
+    Reputation change for the author when a vote goes from `old` to `new`
+    (None for no vote).
+    """
+    return (new == Vote.UP) - (old == Vote.UP)
+
+
+#----------------------------QUERIES-------------------------------
+
+def _scores(board, user_ids=None):
+    """
+    {user_id: reputation} stored for a board, of some users or of every
+    user with positive reputation.
+    """
+    if board == GLOBAL_BOARD:
+        rows = UserProfile.objects.values_list('user_id', 'reputation')
+    else:
+        subject_id = int(board.split(':', 1)[1])
+        rows = SubjectReputation.objects.filter(subject_id=subject_id).values_list('user_id', 'reputation')
+    if user_ids is None:
+        return dict(rows.filter(reputation__gt=0).iterator())
+    scores = dict.fromkeys(user_ids, 0)
+    scores.update(rows.filter(user_id__in=list(user_ids)))
+    return scores
+
+
+def _loaded(board):
+    leaderboard = get_leaderboard()
+    if not leaderboard.is_loaded(board):
+        with leaderboard.lock(board):
+            if not leaderboard.is_loaded(board):
+                leaderboard.replace(board, _scores(board))
+    return leaderboard
+
+
+def _update_board(board, user_ids):
+    """
+    Copy the stored reputation of `user_ids` to a loaded board. An unloaded
+    board reads every committed vote when it loads.
+    """
+    leaderboard = get_leaderboard()
+    with leaderboard.lock(board):
+        if leaderboard.is_loaded(board):
+            leaderboard.update(board, _scores(board, user_ids))
+
+
+def top(board, count, offset=0):
+    """
+    [(user_id, reputation)] of the best `count` users after `offset`.
+    """
+    return _loaded(board).top(board, count, offset)
+
+
+def rank(board, user_id):
+    """
+    (1-based rank, reputation) of a user, or None without reputation.
+    """
+    return _loaded(board).rank(board, user_id)
+
+
+#----------------------------REBUILD-------------------------------
+
+def rebuild_reputation():
+    """
+    Recount every reputation from the votes and reload every board. Returns
+    the number of users with reputation.
+    """
+    rows = (
+        Exercise.objects.filter(votes__value=Vote.UP)
+        .values('author_id', 'subject_id')
+        .annotate(upvotes=Count('votes'))
+        .order_by()
+    )
+    by_user, by_subject = defaultdict(int), defaultdict(dict)
+    for row in rows.iterator():
+        by_user[row['author_id']] += row['upvotes']
+        if row['subject_id'] is not None:
+            by_subject[row['subject_id']][row['author_id']] = row['upvotes']
+
+    with transaction.atomic():
+        UserProfile.objects.exclude(user_id__in=list(by_user)).exclude(reputation=0).update(reputation=0)
+        user_ids = list(by_user)
+        for start in range(0, len(user_ids), UPDATE_BATCH):
+            batch = user_ids[start:start + UPDATE_BATCH]
+            UserProfile.objects.filter(user_id__in=batch).update(reputation=Case(
+                *[When(user_id=user_id, then=Value(by_user[user_id])) for user_id in batch],
+                output_field=IntegerField(),
+            ))
+        SubjectReputation.objects.all().delete()
+        SubjectReputation.objects.bulk_create([
+            SubjectReputation(user_id=user_id, subject_id=subject_id, reputation=reputation)
+            for subject_id, scores in by_subject.items()
+            for user_id, reputation in scores.items()
+        ], batch_size=UPDATE_BATCH)
+
+        subject_ids = list(Subject.objects.values_list('id', flat=True))
+
+        def reload_boards():
+            leaderboard = get_leaderboard()
+            with leaderboard.lock(GLOBAL_BOARD):
+                leaderboard.replace(GLOBAL_BOARD, _scores(GLOBAL_BOARD))
+            for subject_id in subject_ids:
+                board = subject_board(subject_id)
+                with leaderboard.lock(board):
+                    leaderboard.replace(board, _scores(board))
+
+        transaction.on_commit(reload_boards)
+    return len(by_user)
@@ -0,0 +1,79 @@
+"""
+Spaced repetition of completed exercises (SM-2).
+
+Every completion of a due exercise is a review graded from 0 (blackout) to
+5 (perfect recall); completions before the due date are not. A grade below
+PASSING_GRADE starts the exercise over at a one day interval; a passing
+grade moves it to 1 day, then 6 days, then the previous interval times its
+ease factor. The ease factor starts at 2.5 and goes up or down with the
+grade, never below 1.3. The resulting due date is stored in ReviewSchedule,
+whose (user, next_due) index makes the due queue of a user a range scan
+however long their history is.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ReviewSchedule
+
+
+MIN_GRADE = 0
+MAX_GRADE = 5
+PASSING_GRADE = 3
+# Completing an exercise without saying how it went counts as a correct
+# answer recalled with some effort
+DEFAULT_GRADE = 4
+
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+FIRST_INTERVAL = 1  # days
+SECOND_INTERVAL = 6
+
+
+def next_interval(interval, ease, repetitions, grade):
+    """
+    Return (interval in days, ease factor, repetitions) after a review.
+    """
+    if grade < PASSING_GRADE:
+        repetitions, interval = 0, FIRST_INTERVAL
+    else:
+        if repetitions == 0:
+            interval = FIRST_INTERVAL
+        elif repetitions == 1:
+            interval = SECOND_INTERVAL
+        else:
+            interval = round(interval * ease)
+        repetitions += 1
+    miss = MAX_GRADE - grade
+    ease = max(MIN_EASE, ease + 0.1 - miss * (0.08 + miss * 0.02))
+    return interval, ease, repetitions
+
+
+def record_review(user, exercise, grade=DEFAULT_GRADE, now=None):
+    """
+    Reschedule `exercise` for `user` after a review graded `grade`. A review
+    before the exercise is due only records the visit: repeating it the same
+    day must not push it months ahead.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        # Locked: two completions at once must not both start from the old state
+        schedule, created = ReviewSchedule.objects.select_for_update().get_or_create(
+            user=user, exercise=exercise,
+            defaults={'ease_factor': INITIAL_EASE, 'next_due': now},
+        )
+        if not created and schedule.next_due > now:
+            schedule.last_reviewed_at = now
+            schedule.save(update_fields=['last_reviewed_at'])
+            return schedule
+
+        schedule.interval_days, schedule.ease_factor, schedule.repetitions = next_interval(
+            schedule.interval_days, schedule.ease_factor, schedule.repetitions, grade,
+        )
+        schedule.last_grade = grade
+        schedule.last_reviewed_at = now
+        schedule.next_due = now + timedelta(days=schedule.interval_days)
+        schedule.save()
+    return schedule
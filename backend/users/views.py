@@ -2,22 +2,28 @@ from rest_framework import status, views
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
-from django.db.models import Count
+from django.utils import timezone
+from django.db.models import Count, Exists, F, OuterRef
 from django.contrib.contenttypes.models import ContentType
 
 
-from .models import ViewHistory
+from .models import ViewHistory, Recommendation, ReviewSchedule
+from .recommendations import mark_stale
+from .reviews import DEFAULT_GRADE, MAX_GRADE, MIN_GRADE, record_review
+from .reputation import GLOBAL_BOARD, rank, subject_board, top
 from .serializers import (
     UserSerializer, 
     UserStatsSerializer, 
 )
 
-from things.serializers import UserHistorySerializer,ExerciseSerializer
+from things.serializers import UserHistorySerializer,ExerciseSerializer,RecommendationSerializer,ReviewSerializer
 from things.models import Exercise,Vote
+from things.preload import attach_author_stats, preload_exercises, with_nested
 
 
 import logging
@@ -119,6 +125,7 @@ class LogoutView(views.APIView):
 @api_view(['GET'])
 def get_current_user(request):
     if request.user.is_authenticated:
+        attach_author_stats([request.user])
         return Response(UserSerializer(request.user).data)
     return Response(status=status.HTTP_401_UNAUTHORIZED)
 
@@ -127,16 +134,9 @@ def get_current_user(request):
 def get_user_stats(request):
     user = request.user
     stats = {
-        'exercisesCompleted': ViewHistory.objects.filter(
-            user=user, 
-            completed=True, 
-            content__type='exercise'
-        ).count(),
-        'lessonsCompleted': ViewHistory.objects.filter(
-            user=user, 
-            completed=True, 
-            content__type='course'
-        ).count(),
+        'exercisesCompleted': ViewHistory.objects.filter(user=user, completed=True).count(),
+        # View history only tracks exercises so far
+        'lessonsCompleted': 0,
         'totalUpvotes': Exercise.objects.filter(author=user).aggregate(
             total=Count('votes')
         )['total'] or 0,
@@ -150,16 +150,19 @@ def get_user_history(request):
     exercise_content_type = ContentType.objects.get_for_model(Exercise)
 
     history = {
-        'recentlyViewed': Exercise.objects.filter(
-            viewhistory__user=user
-        ).order_by('-viewhistory__viewed_at')[:5],
-        'upvoted': Exercise.objects.filter(
+        'recentlyViewed': list(with_nested(Exercise.objects.filter(
+            viewhistory__user=user,
+            is_hidden=False
+        )).order_by('-viewhistory__viewed_at')[:5]),
+        'upvoted': list(with_nested(Exercise.objects.filter(
             votes__user=user,
             votes__value=Vote.UP,
-            votes__content_type=exercise_content_type
-        ).order_by('-votes__created_at')[:5],
+            votes__content_type=exercise_content_type,
+            is_hidden=False
+        )).order_by('-votes__created_at')[:5]),
     }
-    return Response(UserHistorySerializer(history).data)
+    preload_exercises(history['recentlyViewed'] + history['upvoted'], user)
+    return Response(UserHistorySerializer(history, context={'request': request}).data)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -170,8 +173,8 @@ def mark_content_viewed(request, content_id):
             user=request.user,
             content=content
         )
-        content.view_count += 1
-        content.save()
+        # Atomic counter bump: no lost updates and no Exercise post_save
+        Exercise.objects.filter(id=content.id).update(view_count=F('view_count') + 1)
         return Response(status=status.HTTP_200_OK)
     except Exercise.DoesNotExist:
         return Response(
@@ -182,6 +185,19 @@ def mark_content_viewed(request, content_id):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def mark_content_completed(request, content_id):
+    """
+    Mark an exercise completed and schedule its next review. The optional
+    `grade` (0 to 5) says how well it went, see users/reviews.py.
+    """
+    try:
+        grade = int(request.data.get('grade', DEFAULT_GRADE))
+    except (TypeError, ValueError):
+        grade = None
+    if grade is None or not MIN_GRADE <= grade <= MAX_GRADE:
+        return Response(
+            {'error': f'grade must be an integer from {MIN_GRADE} to {MAX_GRADE}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     try:
         content = Exercise.objects.get(id=content_id)
         history, _ = ViewHistory.objects.get_or_create(
@@ -190,6 +206,8 @@ def mark_content_completed(request, content_id):
         )
         history.completed = True
         history.save()
+        record_review(request.user, content, grade)
+        mark_stale(request.user.id)
         return Response(status=status.HTTP_200_OK)
     except Exercise.DoesNotExist:
         return Response(
@@ -199,6 +217,20 @@ def mark_content_completed(request, content_id):
     
 
 
+class ProfileExercisesPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'per_page'
+    max_page_size = 100
+
+
+def paginated_exercises(request, exercises):
+    paginator = ProfileExercisesPagination()
+    page = paginator.paginate_queryset(exercises, request)
+    preload_exercises(page, request.user)
+    data = ExerciseSerializer(page, many=True, context={'request': request}).data
+    return paginator.get_paginated_response(data)
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])  # Allow anyone to view public profiles
 def get_user_profile(request, username):
@@ -206,27 +238,24 @@ def get_user_profile(request, username):
     Get public profile for any user by username
     """
     try:
-        user = User.objects.get(username=username)
-        logger.info(f"GET request to view profile for user: {user.username}")
-        logger.info(f"User data: {request.data}")
+        user = User.objects.select_related('profile').get(username=username)
+        logger.info("GET request to view profile for user: %s", user.username)
+        attach_author_stats([user])
         
         # Get basic user data
         user_data = UserSerializer(user).data
         
-        # Get contribution counts
-        contributions_count = Exercise.objects.filter(author=user).count()
-        
-        # Get reputation (total upvotes on their content)
-        exercise_content_type = ContentType.objects.get_for_model(Exercise)
-        reputation = Vote.objects.filter(
-            content_type=exercise_content_type,
-            object_id__in=Exercise.objects.filter(author=user).values_list('id', flat=True),
-            value=Vote.UP
-        ).count()
-        
-        # Add these to user data
-        user_data['contributionsCount'] = contributions_count
-        user_data['reputation'] = reputation
+        # Counted by attach_author_stats; reputation is kept up to date by
+        # users/reputation.py. Users created without a profile have neither.
+        if hasattr(user, 'profile'):
+            user_data['contributionsCount'] = user.profile.total_contributions
+            user_data['reputation'] = user.profile.reputation
+            position = rank(GLOBAL_BOARD, user.id)
+            user_data['rank'] = position[0] if position else None
+        else:
+            user_data['contributionsCount'] = Exercise.objects.filter(author=user).count()
+            user_data['reputation'] = 0
+            user_data['rank'] = None
         
         return Response(user_data)
     except User.DoesNotExist:
@@ -239,19 +268,8 @@ def get_user_exercises(request, username):
     """
     try:
         user = User.objects.get(username=username)
-        exercises = Exercise.objects.filter(author=user).order_by('-created_at')
-        
-        # Apply pagination if needed
-        page = request.query_params.get('page', 1)
-        per_page = request.query_params.get('per_page', 10)
-        
-        # You can add pagination code here
-        
-        data = ExerciseSerializer(exercises, many=True).data
-        return Response({
-            'results': data,
-            'count': exercises.count()
-        })
+        exercises = with_nested(Exercise.objects.filter(author=user, is_hidden=False)).order_by('-created_at', '-id')
+        return paginated_exercises(request, exercises)
     except User.DoesNotExist:
         return Response({'error': 'User not found'}, status=404)
 
@@ -265,15 +283,113 @@ def get_saved_content(request):
     user = request.user
     exercise_content_type = ContentType.objects.get_for_model(Exercise)
     
-    upvoted_exercises = Exercise.objects.filter(
+    upvoted_exercises = with_nested(Exercise.objects.filter(
         votes__user=user,
         votes__value=Vote.UP,
-        votes__content_type=exercise_content_type
-    ).order_by('-votes__created_at')
-    
-    data = ExerciseSerializer(upvoted_exercises, many=True).data
-    return Response({
-        'results': data,
-        'count': upvoted_exercises.count()
-    })
+        votes__content_type=exercise_content_type,
+        is_hidden=False
+    )).order_by('-votes__created_at')
+    return paginated_exercises(request, upvoted_exercises)
+
+
+#----------------------------FEED-------------------------------
 
+class FeedPagination(CursorPagination):
+    # Cursor pagination on the (user, rank) index: one query per page, no COUNT
+    ordering = 'rank'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_feed(request):
+    """
+    Personalized "next exercises" for the current user, precomputed by
+    users/recommendations.py. Exercises completed since the feed was last
+    computed are left out.
+    """
+    completed = ViewHistory.objects.filter(user=request.user, content_id=OuterRef('exercise_id'), completed=True)
+    recommendations = Recommendation.objects.filter(
+        ~Exists(completed), user=request.user, exercise__is_hidden=False
+    ).select_related('exercise').only(
+        'score', 'rank', 'exercise_id',
+        'exercise__title', 'exercise__difficulty', 'exercise__excerpt'
+    )
+
+    paginator = FeedPagination()
+    page = paginator.paginate_queryset(recommendations, request)
+    return paginator.get_paginated_response(RecommendationSerializer(page, many=True).data)
+
+
+#----------------------------REVIEWS-------------------------------
+
+class ReviewPagination(CursorPagination):
+    # Cursor pagination on the (user, next_due) index: a range scan, no COUNT
+    ordering = 'next_due'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_due_reviews(request):
+    """
+    Completed exercises due for review now, most overdue first.
+    """
+    reviews = ReviewSchedule.objects.filter(
+        user=request.user, next_due__lte=timezone.now(), exercise__is_hidden=False
+    ).select_related('exercise').only(
+        'next_due', 'interval_days', 'repetitions', 'last_reviewed_at', 'exercise_id',
+        'exercise__title', 'exercise__difficulty', 'exercise__excerpt'
+    )
+
+    paginator = ReviewPagination()
+    page = paginator.paginate_queryset(reviews, request)
+    return paginator.get_paginated_response(ReviewSerializer(page, many=True).data)
+
+
+#----------------------------LEADERBOARD-------------------------------
+
+LEADERBOARD_SIZE = 20
+MAX_LEADERBOARD_SIZE = 100
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_leaderboard(request):
+    """
+    Users ranked by reputation, overall or within `subject`, from `offset`;
+    `me` is the rank of the current user.
+    """
+    try:
+        limit = max(min(int(request.query_params.get('limit', LEADERBOARD_SIZE)), MAX_LEADERBOARD_SIZE), 1)
+        offset = max(int(request.query_params.get('offset', 0)), 0)
+        subject_id = request.query_params.get('subject')
+        board = subject_board(int(subject_id)) if subject_id else GLOBAL_BOARD
+    except ValueError:
+        return Response({'error': 'limit, offset and subject must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    entries = top(board, limit, offset)
+    users = User.objects.select_related('profile').in_bulk([user_id for user_id, _ in entries])
+    results = [
+        {
+            'rank': offset + index + 1,
+            'reputation': reputation,
+            'id': user_id,
+            'username': users[user_id].username,
+            # Users created without a profile can still hold subject reputation
+            'avatar': getattr(getattr(users[user_id], 'profile', None), 'avatar', None),
+        }
+        for index, (user_id, reputation) in enumerate(entries)
+        if user_id in users
+    ]
+
+    me = None
+    if request.user.is_authenticated:
+        position = rank(board, request.user.id)
+        if position:
+            me = {'rank': position[0], 'reputation': position[1]}
+    return Response({'results': results, 'me': me})
@@ -148,7 +148,7 @@ export const ContentCard: React.FC<ContentCardProps> = ({
         <div className="p-3 sm:p-5">
           {/* Content Preview with TipTap renderer instead of regex */}
           <div className="prose max-w-none text-l text-gray-900 break-words">
-            <TipTapRenderer content={content.content} />
+            <TipTapRenderer content={content.excerpt ?? content.content} />
           </div>
         </div>
         
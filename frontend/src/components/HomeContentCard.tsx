@@ -167,7 +167,7 @@ export const HomeContentCard: React.FC<HomeContentCardProps> = ({
         <div className="px-4 py-2 flex-1">
           {/* Content Preview */}
           <div className="prose max-w-none text-sm text-gray-600 line-clamp-2 overflow-hidden">
-            <TipTapRenderer content = {truncateText(content.content, 120)}></TipTapRenderer>
+            <TipTapRenderer content = {truncateText(content.excerpt ?? content.content, 120)}></TipTapRenderer>
         </div>
 
         {/* Compact footer with metadata and votes */}
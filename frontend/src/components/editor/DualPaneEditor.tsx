@@ -6,6 +6,7 @@ import Color from '@tiptap/extension-color';
 import Image from '@tiptap/extension-image';
 import Mathematics from '@tiptap-pro/extension-mathematics';
 import 'katex/dist/katex.min.css';
+import { uploadImage } from '@/lib/api';
 import { 
   Bold, 
   Italic, 
@@ -201,50 +202,37 @@ const DualPaneEditor: React.FC<DualPaneEditorProps> = ({ content, setContent })
     setShowImageModal(true);
   };
 
-  // Handle file upload
-  const handleFileUpload = (event: React.ChangeEvent<HTMLInputElement>) => {
-    const file = event.target.files?.[0];
-    if (!file) return;
-
+  // Upload the file so the editor stores its content-addressed URL rather
+  // than a data URL; the local preview is shown while the upload runs
+  const uploadAndPreview = (file: File, errorMessage: string) => {
     setIsUploading(true);
 
-    // Create a preview
     const reader = new FileReader();
     reader.onload = (e) => {
       if (e.target?.result) {
         setImagePreview(e.target.result as string);
-        setImageUrl(e.target.result as string);
-        setIsUploading(false);
       }
     };
-    reader.onerror = () => {
-      setIsUploading(false);
-      alert("Erreur lors du chargement de l'image");
-    };
     reader.readAsDataURL(file);
+
+    uploadImage(file)
+      .then((url) => setImageUrl(url))
+      .catch(() => alert(errorMessage))
+      .finally(() => setIsUploading(false));
+  };
+
+  // Handle file upload
+  const handleFileUpload = (event: React.ChangeEvent<HTMLInputElement>) => {
+    const file = event.target.files?.[0];
+    if (!file) return;
+    uploadAndPreview(file, "Erreur lors du chargement de l'image");
   };
 
   // Handle camera capture
   const captureImage = (event: React.ChangeEvent<HTMLInputElement>) => {
     const file = event.target.files?.[0];
     if (!file) return;
-
-    setIsUploading(true);
-
-    // Create a preview for the captured photo
-    const reader = new FileReader();
-    reader.onload = (e) => {
-      if (e.target?.result) {
-        setImagePreview(e.target.result as string);
-        setImageUrl(e.target.result as string);
-        setIsUploading(false);
-      }
-    };
-    reader.onerror = () => {
-      setIsUploading(false);
-      alert("Erreur lors de la capture de l'image");
-    };
-    reader.readAsDataURL(file);
+    uploadAndPreview(file, "Erreur lors de la capture de l'image");
   };
 
   // Insert image into editor
@@ -22,7 +22,7 @@ api.interceptors.request.use((config) => {
 
 // Add these functions to your existing lib/api.ts file
 
-import { User, Content } from "@/types";
+import { User, Content, Comment } from "@/types";
 
 /**
  * Get user profile by ID or username
@@ -133,7 +133,13 @@ export async function getSavedContents(): Promise<{ results: Content[] }> {
 type VoteValue = 1 | -1 | 0;  // Matches Vote.UP, Vote.DOWN, Vote.UNVOTE
 type VoteTarget = 'exercise' | 'solution' | 'comment';
 
-const voteContent = async (contentId: string, value: VoteValue, target: VoteTarget) => {
+// Vote endpoints return only the new score and the user's vote
+export interface VoteResult {
+  vote_count: number;
+  user_vote: VoteValue;
+}
+
+const voteContent = async (contentId: string, value: VoteValue, target: VoteTarget): Promise<VoteResult> => {
   const endpoints = {
     exercise: `/exercises/${contentId}/vote/`,
     solution: `/solutions/${contentId}/vote/`,
@@ -141,7 +147,8 @@ const voteContent = async (contentId: string, value: VoteValue, target: VoteTarg
   };
 
   const response = await api.post(endpoints[target], { value });
-  return response.data;
+  const { vote_count, user_vote } = response.data;
+  return { vote_count, user_vote };
 };
 
 export const voteExercise = async (id: string, value: VoteValue) => {
@@ -156,6 +163,39 @@ export const voteComment = async (id: string, value: VoteValue) => {
   return voteContent(id, value, 'comment');
 };
 
+// Live exercise updates, pushed by the server over Server-Sent Events
+export interface LiveVote {
+  type: VoteTarget;
+  id: number;
+  vote_count: number;
+}
+
+export interface LiveHandlers {
+  onVote: (vote: LiveVote) => void;
+  onComment: (comment: Comment) => void;
+  // Called when the stream comes back after a drop: deltas may have been missed
+  onResync: () => void;
+}
+
+export const subscribeToExercise = (id: string, handlers: LiveHandlers) => {
+  const source = new EventSource(`${api.defaults.baseURL}/exercises/${id}/events/`, { withCredentials: true });
+  let dropped = false;
+
+  source.addEventListener('vote', (event) => handlers.onVote(JSON.parse((event as MessageEvent).data)));
+  source.addEventListener('comment', (event) => handlers.onComment(JSON.parse((event as MessageEvent).data)));
+  source.onerror = () => {
+    dropped = true;
+  };
+  source.onopen = () => {
+    if (dropped) {
+      dropped = false;
+      handlers.onResync();
+    }
+  };
+
+  return () => source.close();
+};
+
 // Auth API
 export const login = async (identifier: string, password: string) => {
   const response = await api.post('/auth/login/', { identifier, password });
@@ -194,6 +234,7 @@ export const getContents = async (params: {
       subjects: params.subjects,
       chapters: params.chapters,
       difficulties: params.difficulties,
+      sort: params.sort,
     } 
   });
   return {
@@ -24,7 +24,7 @@ import {
   ThumbsUp
 } from 'lucide-react';
 import { Button } from '@/components/ui/button';
-import { getContentById, voteExercise, addComment, markContentViewed, deleteContent, voteComment, updateComment, deleteComment, deleteSolution, voteSolution, addSolution } from '@/lib/api';
+import { getContentById, voteExercise, addComment, markContentViewed, deleteContent, voteComment, updateComment, deleteComment, deleteSolution, voteSolution, addSolution, subscribeToExercise, LiveVote } from '@/lib/api';
 import { Content, Comment, VoteValue, Difficulty } from '@/types';
 import { useAuth } from '@/contexts/AuthContext';
 import { VoteButtons } from '@/components/VoteButtons';
@@ -88,6 +88,52 @@ export function ExerciseDetail() {
     }
   }, [id]);
 
+  // Live vote and comment deltas from other users
+  useEffect(() => {
+    if (!id) return;
+
+    const applyVote = (vote: LiveVote) => {
+      const withScore = <T extends { id: string | number; vote_count: number }>(item: T): T =>
+        String(item.id) === String(vote.id) ? { ...item, vote_count: vote.vote_count } : item;
+      const updateTree = (comments: Comment[]): Comment[] =>
+        comments.map(comment => ({
+          ...withScore(comment),
+          replies: comment.replies ? updateTree(comment.replies) : comment.replies
+        }));
+
+      setExercise(prev => {
+        if (!prev) return prev;
+        if (vote.type === 'exercise') return withScore(prev);
+        if (vote.type === 'solution') return prev.solution ? { ...prev, solution: withScore(prev.solution) } : prev;
+        return { ...prev, comments: updateTree(prev.comments || []) };
+      });
+    };
+
+    const addLiveComment = (comment: Comment) => {
+      const contains = (comments: Comment[]): boolean =>
+        comments.some(item => String(item.id) === String(comment.id) || contains(item.replies || []));
+      const insertReply = (comments: Comment[]): Comment[] =>
+        comments.map(item => String(item.id) === String(comment.parent_id)
+          ? { ...item, replies: [...(item.replies || []), comment] }
+          : { ...item, replies: item.replies ? insertReply(item.replies) : item.replies });
+
+      setExercise(prev => {
+        // Our own comments are already added from the POST response
+        if (!prev || contains(prev.comments || [])) return prev;
+        const comments = comment.parent_id ? insertReply(prev.comments || []) : [...(prev.comments || []), comment];
+        return { ...prev, comments };
+      });
+    };
+
+    return subscribeToExercise(id, {
+      onVote: applyVote,
+      onComment: addLiveComment,
+      onResync: () => {
+        getContentById(id).then(setExercise).catch(console.error);
+      }
+    });
+  }, [id]);
+
   // Timer effect
   useEffect(() => {
     let interval: NodeJS.Timeout | null = null;
@@ -159,6 +205,7 @@ export function ExerciseDetail() {
       setError(null);
       const data = await getContentById(exerciseId);
       setExercise(data);
+      if (data.completed) setCompleted(true);
     } catch (err) {
       console.error('Failed to load exercise:', err);
       setError('Failed to load exercise. Please try again.');
@@ -175,17 +222,17 @@ export function ExerciseDetail() {
 
     try {
       if (target === 'solution' && exercise?.solution) {
-        const updatedSolution = await voteSolution(exercise.solution.id, value);
+        const result = await voteSolution(exercise.solution.id, value);
         setExercise(prev => {
-          if (!prev) return prev;
+          if (!prev || !prev.solution) return prev;
           return {
             ...prev,
-            solution: updatedSolution
+            solution: { ...prev.solution, ...result }
           };
         });
       } else {
-        const updatedExercise = await voteExercise(id, value);
-        setExercise(updatedExercise);
+        const result = await voteExercise(id, value);
+        setExercise(prev => prev ? { ...prev, ...result } : prev);
       }
     } catch (err) {
       console.error('Failed to vote:', err);
@@ -244,12 +291,12 @@ export function ExerciseDetail() {
     }
 
     try {
-      const updatedComment = await voteComment(commentId, value);
+      const result = await voteComment(commentId, value);
       
       const updateCommentInTree = (comments: Comment[]): Comment[] => {
         return comments.map(comment => {
           if (comment.id === commentId) {
-            return updatedComment;
+            return { ...comment, ...result };
           }
           if (comment.replies) {
             return {
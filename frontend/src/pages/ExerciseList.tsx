@@ -84,10 +84,10 @@ export const ExerciseList = () => {
 
   const handleVote = async (id: string, type: VoteValue) => {
     try {
-      const updatedExercise = await voteExercise(id, type);
+      const result = await voteExercise(id, type);
       setContents(prevContents => 
         prevContents.map(content => 
-          content.id === id ? updatedExercise : content
+          content.id === id ? { ...content, ...result } : content
         )
       );
     } catch (err) {
@@ -44,10 +44,10 @@ export function Home() {
     }
 
     try {
-      const updatedExercise = await voteExercise(id, value);
+      const result = await voteExercise(id, value);
       setPopularExercises(prevExercises =>
         prevExercises.map(exercise =>
-          exercise.id === id ? updatedExercise : exercise
+          exercise.id === id ? { ...exercise, ...result } : exercise
         )
       );
     } catch (err) {
@@ -1,5 +1,5 @@
 export type Difficulty = 'easy' | 'medium' | 'hard';
-export type SortOption = 'newest' | 'oldest' | 'most_upvoted' | 'most_commented';
+export type SortOption = 'newest' | 'oldest' | 'most_upvoted' | 'most_commented' | 'most_viewed';
 export type VoteValue = 1 | -1 | 0;
 
 export type ClassLevel = 
@@ -48,6 +48,9 @@ export interface Content {
   id: string;
   title: string;
   content: string;
+  excerpt?: string;
+  word_count?: number;
+  formula_count?: number;
   class_levels: ClassLevelModel[];
   subject: SubjectModel;
   chapters: ChapterModel[];
@@ -62,6 +65,7 @@ export interface Content {
   solution?:  Solution;  
   comments: Comment[];
   view_count: number;
+  completed?: boolean | null;
 }
 
 export interface User {